@@ -0,0 +1,3 @@
+"""
+Composants partagés par les outils BioImageIT astroca (dossiers biit_*).
+"""
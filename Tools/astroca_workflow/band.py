@@ -0,0 +1,315 @@
+"""
+Stockage compact des séquences 4D (T,Z,Y,X) restreint à la bande [xmin, xmax] de chaque Z.
+
+Les étapes astroca ne calculent qu'entre index_xmin[z] et index_xmax[z] (bornes incluses) ; les
+marges en X ne contiennent qu'une valeur constante. Un BandPackedArray ne stocke que la bande :
+pour chaque instant, un vecteur à plat concaténant les blocs (Y, largeur_z) de chaque Z, le bloc
+du plan z commençant à offsets[z]. La mémoire et les écritures sont réduites dans la proportion
+de la surface recadrée.
+
+La bande est un format de stockage et d'échange entre outils, pas de calcul : les fonctions
+astroca attendent des tableaux denses, et un BandPackedArray est reconstruit volume par volume
+(band[t]) ou en entier (to_dense) au moment du calcul. Il expose shape, dtype, ndim et l'accès
+par volume, ce qui suffit à stacks.export_sequence.
+
+Format .band.npz : shape, index_xmin, index_xmax, fill et values (T, longueur de bande), non
+compressés. BandWriter écrit values volume par volume, sans assembler la séquence ; load relit
+values par memmap, de sorte qu'un volume lu ne charge que sa ligne.
+"""
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+BAND_SUFFIX = '.band.npz'
+
+
+def band_path(output_image):
+    """ Chemin du fichier en bande correspondant à la sortie .tif d'un outil. """
+    return os.path.splitext(str(output_image))[0] + BAND_SUFFIX
+
+
+class BandPackedArray:
+    """
+    Séquence 4D dont seule la bande [xmin, xmax] de chaque Z est stockée.
+
+    Paramètres :
+        values : tableau (T, longueur de bande), éventuellement un np.memmap
+        shape : forme (T,Z,Y,X) de la séquence dense
+        index_xmin, index_xmax : bornes incluses par Z
+        fill : valeur des marges
+    """
+
+    def __init__(self, values, shape, index_xmin, index_xmax, fill=0):
+        self.values = values
+        self.shape = tuple(int(n) for n in shape)
+        width = self.shape[-1]
+        # Bounds are clipped to the frame so that every band slice matches its width
+        self.index_xmin = np.clip(np.asarray(index_xmin, dtype=np.int64), 0, width)
+        self.index_xmax = np.clip(np.asarray(index_xmax, dtype=np.int64), -1, width - 1)
+        self.fill = fill
+        self.dtype = values.dtype
+        self.ndim = 4
+        widths = band_widths(self.index_xmin, self.index_xmax, width)
+        self.offsets = np.concatenate([[0], np.cumsum(widths * self.shape[2])]).astype(np.int64)
+
+    @classmethod
+    def empty(cls, shape, dtype, index_xmin, index_xmax, fill=0, scratch_dir=None):
+        from .store import allocate_4d
+
+        widths = band_widths(index_xmin, index_xmax, shape[-1])
+        values = allocate_4d((shape[0], int(widths.sum()) * shape[2]), dtype, scratch_dir)
+        return cls(values, shape, index_xmin, index_xmax, fill)
+
+    @classmethod
+    def from_dense(cls, data4D, index_xmin, index_xmax, scratch_dir=None):
+        """
+        Compresse une séquence dense volume par volume.
+
+        Retour :
+            BandPackedArray, ou None si les marges ne contiennent pas une seule et même valeur
+        """
+        fill = margin_value(np.asarray(data4D[0]), index_xmin, index_xmax)
+        band = cls.empty(data4D.shape, data4D.dtype, index_xmin, index_xmax, fill, scratch_dir)
+        for t in range(data4D.shape[0]):
+            if not band.set_frame(t, np.asarray(data4D[t])):
+                return None
+        return band
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def set_frame(self, t, frame):
+        """ Stocke le volume dense `frame` à l'instant t ; False si ses marges diffèrent de `fill`. """
+        return _pack_frame(frame, self.values[t], self.offsets, self.index_xmin, self.index_xmax, self.fill)
+
+    def __getitem__(self, t):
+        if not isinstance(t, (int, np.integer)):
+            raise TypeError("Un BandPackedArray s'indexe par instant : band[t].")
+        frame = np.full(self.shape[1:], self.fill, dtype=self.dtype)
+        row = self.values[t]
+        for z in range(self.shape[1]):
+            start, stop = self.offsets[z], self.offsets[z + 1]
+            if stop > start:
+                frame[z, :, self.index_xmin[z]:self.index_xmax[z] + 1] = \
+                    row[start:stop].reshape(self.shape[2], -1)
+        return frame
+
+    def to_dense(self, scratch_dir=None):
+        """ Séquence dense (T,Z,Y,X), les marges valant `fill`. """
+        from .store import allocate_4d
+
+        data4D = allocate_4d(self.shape, self.dtype, scratch_dir)
+        for t in range(self.shape[0]):
+            data4D[t] = self[t]
+        return data4D
+
+    def save(self, path):
+        """
+        Écrit la séquence au format .band.npz.
+
+        Retour :
+            liste contenant le chemin écrit
+        """
+        with BandWriter(path, self.shape, self.dtype, self.index_xmin, self.index_xmax, self.fill) as writer:
+            for t in range(self.shape[0]):
+                writer.write_row(self.values[t])
+        return writer.close()
+
+    @classmethod
+    def load(cls, path):
+        """ Relit un fichier .band.npz ; values est un memmap en lecture seule s'il n'est pas compressé. """
+        path = str(path)
+        with np.load(path) as band:
+            header = {name: band[name] for name in ('shape', 'index_xmin', 'index_xmax', 'fill')}
+            values = _npz_memmap(path, 'values.npy')
+            if values is None:
+                values = band['values']
+        return cls(values, header['shape'], header['index_xmin'], header['index_xmax'], header['fill'].item())
+
+
+class BandWriter:
+    """
+    Écrit une séquence au format .band.npz volume par volume : seule la bande du volume en cours
+    est en mémoire.
+
+    Paramètres :
+        path : fichier .band.npz
+        shape : forme (T,Z,Y,X) de la séquence dense
+        dtype : type des valeurs
+        index_xmin, index_xmax : bornes incluses par Z
+        fill : valeur des marges
+    """
+
+    def __init__(self, path, shape, dtype, index_xmin, index_xmax, fill=0):
+        self.path = str(path)
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        width = self.shape[-1]
+        self.index_xmin = np.clip(np.asarray(index_xmin, dtype=np.int64), 0, width)
+        self.index_xmax = np.clip(np.asarray(index_xmax, dtype=np.int64), -1, width - 1)
+        self.fill = fill
+        widths = band_widths(self.index_xmin, self.index_xmax, width)
+        self.offsets = np.concatenate([[0], np.cumsum(widths * self.shape[2])]).astype(np.int64)
+        self.n_frames = 0
+        self._row = np.empty(int(self.offsets[-1]), dtype=self.dtype)
+
+        # Same members as np.savez, stored uncompressed; values is streamed row by row
+        self._zip = zipfile.ZipFile(self.path, 'w', zipfile.ZIP_STORED, allowZip64=True)
+        for name, value in (('shape', np.asarray(self.shape, dtype=np.int64)), ('index_xmin', self.index_xmin),
+                            ('index_xmax', self.index_xmax), ('fill', np.asarray(fill, dtype=self.dtype))):
+            with self._zip.open(name + '.npy', 'w') as member:
+                np.lib.format.write_array(member, value, allow_pickle=False)
+        self._values = self._zip.open('values.npy', 'w', force_zip64=True)
+        np.lib.format.write_array_header_2_0(self._values, {
+            'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False,
+            'shape': (self.shape[0], len(self._row))})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.discard()
+
+    def write(self, frame):
+        """ Ajoute le volume dense suivant ; False (rien n'est écrit) si ses marges diffèrent de `fill`. """
+        if not _pack_frame(np.asarray(frame), self._row, self.offsets, self.index_xmin, self.index_xmax, self.fill):
+            return False
+        self.write_row(self._row)
+        return True
+
+    def write_row(self, row):
+        """ Ajoute la bande (déjà extraite) du volume suivant. """
+        if self.n_frames >= self.shape[0]:
+            raise ValueError(f"La séquence en bande ne compte que {self.shape[0]} volumes.")
+        self._values.write(np.ascontiguousarray(row, dtype=self.dtype).tobytes())
+        self.n_frames += 1
+
+    def close(self):
+        """
+        Termine le fichier.
+
+        Retour :
+            liste contenant le chemin écrit
+        """
+        if self._zip is None:
+            return [self.path]
+        if self.n_frames != self.shape[0]:
+            self.discard()
+            raise ValueError(f"Séquence en bande incomplète : {self.n_frames} volumes écrits sur {self.shape[0]}.")
+        self._values.close()
+        self._zip.close()
+        self._zip = None
+        dense_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        band_bytes = self.shape[0] * self._row.nbytes
+        print(f"Séquence en bande écrite : {band_bytes / 1e6:.1f} Mo au lieu de {dense_bytes / 1e6:.1f} Mo -> {self.path}")
+        return [self.path]
+
+    def discard(self):
+        """ Abandonne l'écriture et supprime le fichier partiel. """
+        if self._zip is None:
+            return
+        try:
+            self._values.close()
+            self._zip.close()
+        finally:
+            self._zip = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def _npz_memmap(path, member):
+    """ Membre .npy non compressé d'un fichier .npz, ouvert par memmap ; None s'il est compressé. """
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(member)
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(path, 'rb') as f:
+        # Local file header: 30 bytes, then the file name and the extra field
+        f.seek(info.header_offset)
+        name_length, extra_length = struct.unpack('<HH', f.read(30)[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if fortran_order or dtype.hasobject:
+        return None
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+
+def _pack_frame(frame, row, offsets, index_xmin, index_xmax, fill):
+    """ Copie la bande de `frame` dans `row` ; False si ses marges diffèrent de `fill`. """
+    if not _margins_equal(frame, index_xmin, index_xmax, fill):
+        return False
+    for z in range(frame.shape[0]):
+        start, stop = offsets[z], offsets[z + 1]
+        if stop > start:
+            row[start:stop] = frame[z, :, index_xmin[z]:index_xmax[z] + 1].reshape(-1)
+    return True
+
+
+def band_widths(index_xmin, index_xmax, width):
+    """ Largeur de la bande de chaque Z, bornée à [0, width]. """
+    xmin = np.clip(np.asarray(index_xmin, dtype=np.int64), 0, width)
+    xmax = np.clip(np.asarray(index_xmax, dtype=np.int64), -1, width - 1)
+    return np.maximum(0, xmax - xmin + 1)
+
+
+def _margins(frame, index_xmin, index_xmax):
+    from .boundaries import outside_mask
+
+    outside = outside_mask(index_xmin, index_xmax, frame.shape[-1])
+    return frame[np.broadcast_to(outside[:, np.newaxis, :], frame.shape)]
+
+
+def margin_value(frame, index_xmin, index_xmax):
+    """ Valeur des marges d'un volume (la première rencontrée ; 0 s'il n'a pas de marge). """
+    values = _margins(frame, index_xmin, index_xmax)
+    return values[0].item() if values.size else 0
+
+
+def _margins_equal(frame, index_xmin, index_xmax, fill):
+    values = _margins(frame, index_xmin, index_xmax)
+    if isinstance(fill, float) and np.isnan(fill):
+        return bool(np.isnan(values).all())
+    return bool((values == fill).all())
+
+
+def save_band_4d(data4D, index_xmin, index_xmax, path):
+    """
+    Écrit data4D au format .band.npz, volume par volume.
+
+    Retour :
+        liste contenant le chemin écrit, ou None si les marges ne sont pas constantes
+        (la séquence doit alors être écrite sous forme dense)
+    """
+    first = np.asarray(data4D[0])
+    with BandWriter(path, data4D.shape, data4D.dtype, index_xmin, index_xmax,
+                    margin_value(first, index_xmin, index_xmax)) as writer:
+        for t in range(data4D.shape[0]):
+            if not writer.write(first if t == 0 else np.asarray(data4D[t])):
+                writer.discard()
+                print("Les marges hors de [xmin, xmax] ne sont pas constantes : la séquence est écrite en entier.")
+                return None
+        return writer.close()
+
+
+def is_band(path):
+    """ Indique si `path` est un fichier écrit par BandPackedArray.save. """
+    path = str(path)
+    if not path.endswith(BAND_SUFFIX) or not os.path.exists(path):
+        return False
+    try:
+        with np.load(path) as band:
+            return {'shape', 'index_xmin', 'index_xmax', 'fill', 'values'} <= set(band.files)
+    except (OSError, ValueError):
+        return False
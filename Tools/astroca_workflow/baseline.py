@@ -0,0 +1,191 @@
+"""
+Estimation du fond F0 (background_estimation_single_block) par blocs de Z en parallèle.
+
+Le F0 d'un voxel ne dépend que de sa propre série temporelle : la séquence est découpée
+en tranches de Z, traitées indépendamment par un pool de processus. Chaque processus ne
+lit que sa tranche, ce qui permet de traiter une séquence sur disque (memmap) plus
+grande que la mémoire.
+
+IncrementalBaseline met à jour F0 quand des volumes sont ajoutés à la séquence, à partir d'un
+état enregistré à côté de la sortie (voir state_path).
+"""
+import json
+import os
+
+import numpy as np
+
+from .tiling import map_blocks
+
+STATE_SUFFIX = '.baseline_state.npz'
+
+
+def _background_block(block, index_xmin, index_xmax, params):
+    from .resolver import astroca_function
+    background_estimation_single_block = astroca_function(
+        'dynamicImage.dynamicImage.background_estimation_single_block')
+
+    return background_estimation_single_block(block, index_xmin, index_xmax, params)
+
+
+def background_estimation_tiled(data4D, index_xmin, index_xmax, params, n_workers=1, n_slabs=None):
+    """
+    Équivalent de background_estimation_single_block(data4D, index_xmin, index_xmax, params),
+    calculé par tranches de Z.
+
+    Paramètres :
+        data4D : séquence (T,Z,Y,X), en mémoire ou np.memmap
+        index_xmin, index_xmax : bornes en X par Z
+        params : paramètres de background_estimation_single_block
+        n_workers : nombre de processus ; 1 appelle directement la fonction astroca
+        n_slabs : nombre de tranches de Z (défaut : 2 par processus, pour équilibrer la charge)
+
+    Retour :
+        F0 : np.ndarray (nbF0,Z,Y,X)
+    """
+    if n_workers <= 1:
+        return _background_block(data4D, index_xmin, index_xmax, params)
+    return map_blocks(_background_block, data4D, 1, n_workers, n_slabs or 2 * n_workers,
+                      sliced_args=(index_xmin, index_xmax), args=(params,))
+
+
+class IncrementalBaseline:
+    """
+    Estimation du fond F0 mise à jour quand des volumes sont ajoutés à la séquence.
+
+    background_estimation_single_block retourne nbF0 estimations, une par fenêtre temporelle. Si
+    chaque estimation ne dépend que des volumes de sa fenêtre, une séquence qui s'allonge n'a
+    besoin que du F0 des nouvelles fenêtres : l'état conserve les F0 déjà calculés, la longueur
+    des fenêtres et les volumes de la dernière fenêtre incomplète.
+
+    La longueur L des fenêtres est déduite du premier calcul complet (T volumes, nbF0 estimations)
+    et vérifiée (voir window_length) : nbF0 >= 3, nbF0 fenêtres de L volumes couvrent T (volumes
+    restants rattachés à la dernière fenêtre ou formant une fenêtre plus courte), et les deux
+    premières fenêtres, recalculées seules sur les 2·L premiers volumes, doivent redonner
+    exactement les deux premières estimations. À défaut, chaque mise à jour recalcule tout.
+
+    Paramètres :
+        state_path : fichier .npz de l'état
+        params : paramètres de background_estimation_single_block
+        index_xmin, index_xmax : bornes en X par Z
+        n_workers : nombre de processus (voir background_estimation_tiled)
+    """
+
+    def __init__(self, state_path, params, index_xmin, index_xmax, n_workers=1):
+        self.state_path = str(state_path)
+        self.params = params
+        self.index_xmin = index_xmin
+        self.index_xmax = index_xmax
+        self.n_workers = n_workers
+        self.paths = []
+        self.block_frames = 0
+        self.F0 = None
+        self.tail = None
+
+    def _signature(self):
+        return json.dumps({'params': self.params,
+                           'index_xmin': np.asarray(self.index_xmin).tolist(),
+                           'index_xmax': np.asarray(self.index_xmax).tolist()}, sort_keys=True, default=str)
+
+    def load(self, paths):
+        """
+        Reprend l'état enregistré s'il a été calculé avec les mêmes paramètres et bornes, et si
+        `paths` commence par les volumes déjà traités.
+
+        Retour :
+            nombre de volumes déjà traités (0 : tout est à calculer)
+        """
+        if not os.path.isfile(self.state_path):
+            return 0
+        with np.load(self.state_path, allow_pickle=False) as state:
+            if str(state['signature']) != self._signature() or int(state['block_frames']) <= 0:
+                return 0
+            known = [str(path) for path in state['paths']]
+            if [_frame_identity(path) for path in paths[:len(known)]] != [str(i) for i in state['identities']]:
+                return 0
+            self.paths = known
+            self.block_frames = int(state['block_frames'])
+            self.F0 = state['F0']
+            self.tail = state['tail']
+        return len(self.paths)
+
+    def save(self):
+        with open(self.state_path, 'wb') as f:
+            np.savez(f, signature=np.asarray(self._signature()), block_frames=np.asarray(self.block_frames),
+                     paths=np.asarray(self.paths, dtype=str),
+                     identities=np.asarray([_frame_identity(path) for path in self.paths], dtype=str),
+                     F0=self.F0, tail=self.tail)
+
+    def window_length(self, data4D, F0):
+        """
+        Longueur des fenêtres de F0 (calculé sur data4D), ou 0 si elle n'est pas établie.
+
+        Les longueurs candidates sont celles pour lesquelles nbF0 fenêtres couvrent T : les volumes
+        restants (moins d'une fenêtre) sont rattachés à la dernière fenêtre, ou forment une
+        dernière fenêtre plus courte. La première candidate dont les deux premières fenêtres,
+        recalculées seules, redonnent F0[:2] est retenue. Avec nbF0 = 2, plusieurs longueurs
+        découpent T en deux fenêtres (T = 8 : 3 ou 4) sans que ce recalcul les distingue : au
+        moins trois fenêtres sont exigées, de sorte que deux fenêtres entières précèdent la
+        dernière.
+        """
+        T, nb = data4D.shape[0], F0.shape[0]
+        if nb < 3:
+            return 0
+        # Leftover merged into the last window: nb*L <= T < (nb+1)*L ; shorter last window: (nb-1)*L < T <= nb*L
+        candidates = sorted({length for length in range(1, T + 1)
+                             if nb * length <= T < (nb + 1) * length or (nb - 1) * length < T <= nb * length})
+        equal_nan = bool(np.issubdtype(F0.dtype, np.floating))
+        for length in candidates:
+            alone = background_estimation_tiled(np.asarray(data4D[:2 * length]), self.index_xmin,
+                                                self.index_xmax, self.params, self.n_workers)
+            if alone.shape[0] == 2 and np.array_equal(alone, F0[:2], equal_nan=equal_nan):
+                return length
+        return 0
+
+    def initialize(self, data4D, paths):
+        """ Calcul complet ; détermine et vérifie la longueur des fenêtres. Retour : F0 (nbF0,Z,Y,X). """
+        F0 = background_estimation_tiled(data4D, self.index_xmin, self.index_xmax, self.params, self.n_workers)
+        T, nb = data4D.shape[0], F0.shape[0]
+        length = self.window_length(data4D, F0)
+        self.paths = [str(path) for path in paths]
+        self.block_frames = length
+        if not length:
+            print("F0 incrémental : longueur des fenêtres non établie, chaque ajout recalcule toute la séquence.")
+            self.F0 = F0
+            self.tail = np.empty((0,) + data4D.shape[1:], data4D.dtype)
+            return F0
+        # Leftover frames may belong to the last window: it is recomputed once complete
+        kept = nb if T == nb * length else nb - 1
+        self.F0 = F0[:kept]
+        self.tail = np.asarray(data4D[kept * length:])
+        return F0
+
+    def update(self, new_frames, new_paths):
+        """
+        Ajoute des volumes : seul le F0 des fenêtres qu'ils complètent est calculé.
+
+        Retour :
+            F0 (nbF0,Z,Y,X) des fenêtres complètes
+        """
+        pending = np.concatenate([self.tail, np.asarray(new_frames)]) if len(self.tail) else np.asarray(new_frames)
+        complete = (pending.shape[0] // self.block_frames) * self.block_frames
+        estimates = [self.F0]
+        for start in range(0, complete, self.block_frames):
+            estimates.append(background_estimation_tiled(pending[start:start + self.block_frames], self.index_xmin,
+                                                         self.index_xmax, self.params, self.n_workers))
+        self.F0 = np.concatenate(estimates)
+        self.tail = pending[complete:]
+        self.paths += [str(path) for path in new_paths]
+        print(f"F0 incrémental : {len(new_paths)} volumes ajoutés, {complete // self.block_frames} fenêtres calculées, "
+              f"{self.tail.shape[0]} volumes en attente")
+        return self.F0
+
+
+def state_path(output_image):
+    """ Chemin de l'état incrémental correspondant à la sortie .tif de l'outil. """
+    return os.path.splitext(str(output_image))[0] + STATE_SUFFIX
+
+
+def _frame_identity(path):
+    """ Chemin, taille et date de modification d'un volume : un volume réécrit invalide l'état. """
+    stat = os.stat(str(path))
+    return f"{path}|{stat.st_size}|{stat.st_mtime_ns}"
@@ -0,0 +1,278 @@
+"""
+Exécution de la chaîne astroca (pipeline.run_pipeline) sur de nombreux enregistrements à la fois.
+
+Les enregistrements sont listés dans un manifeste JSON et traités par un pool de processus.
+La mémoire de pointe de chaque enregistrement est estimée à partir de la forme (T,Z,Y,X) lue
+dans les en-têtes : PEAK_COPIES séquences float32 coexistent au pire moment de la chaîne.
+L'ordonnanceur lance, dès qu'un processus se libère, le plus gros enregistrement qui tient dans
+la mémoire restante (first-fit decreasing) : les petits enregistrements comblent la place
+laissée par les gros, sans que leur somme dépasse le budget. Un enregistrement plus gros que
+le budget, ou dont la forme n'a pu être lue, est traité seul ; avec un scratch_dir, ses
+résultats intermédiaires y sont conservés d'une étape à l'autre (voir pipeline.run_pipeline).
+
+Manifeste : liste d'objets
+    {"name": "rec01", "inputs": "acq/rec01/*.tif", "x_min": 0, "x_max": 319, "pixel_cropped": 2,
+     "output_dir": "...", "params": {...}}
+`inputs` est un motif glob, une liste de volumes ou une pile 4D ; `output_dir` vaut par défaut
+<--output-dir>/<name> ; `params` surcharge les paramètres communs (--params).
+
+Usage :
+    python -m astroca_workflow.batch manifest.json --output-dir results --workers 8 --keep events
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from .pipeline import STAGES, default_parameters, merge_parameters
+
+# float32 copies of the sequence alive at the peak of run_pipeline (bounded, stabilized, dF, Z-score)
+PEAK_COPIES = 4
+
+# Share of the available memory given to the batch when no budget is set
+DEFAULT_BUDGET_FRACTION = 0.8
+
+LOG_FILE = 'astroca.log'
+REPORT_FILE = 'batch_report.json'
+
+
+def _input_paths(inputs, base_dir):
+    """ Chemins des volumes (ou de la pile 4D) d'un enregistrement. """
+    if isinstance(inputs, (list, tuple)):
+        return [os.path.join(base_dir, str(path)) for path in inputs]
+    pattern = os.path.join(base_dir, str(inputs))
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+        raise FileNotFoundError(f"Aucun volume ne correspond à {pattern}")
+    return paths
+
+
+def recording_shape(paths):
+    """ (forme (T,Z,Y,X), dtype) lus dans les en-têtes, ou None si le format n'est pas reconnu. """
+    from .preflight import read_header
+    from .stacks import is_stack
+
+    if len(paths) == 1 and is_stack(paths[0]):
+        return read_header(paths[0], ndim=4)
+    header = read_header(paths[0])
+    if header is None or len(header[0]) != 3:
+        return None
+    return (len(paths),) + header[0], header[1]
+
+
+def peak_memory(shape4D, copies=PEAK_COPIES):
+    """ Mémoire de pointe estimée (octets) de la chaîne sur une séquence (T,Z,Y,X). """
+    n = 1
+    for size in shape4D:
+        n *= int(size)
+    return copies * n * 4
+
+
+def load_manifest(path, output_dir, params=None, copies=PEAK_COPIES):
+    """
+    Lit le manifeste et prépare les enregistrements.
+
+    Retour :
+        liste de dict (name, inputs, output_dir, params, shape, memory)
+    """
+    with open(str(path)) as f:
+        entries = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(str(path)))
+    jobs = []
+    for k, entry in enumerate(entries):
+        name = str(entry.get('name') or f"recording_{k:03d}")
+        paths = _input_paths(entry['inputs'], base_dir)
+        job_params = merge_parameters(default_parameters(), params)
+        merge_parameters(job_params, entry.get('params'))
+        for key in ('x_min', 'x_max', 'pixel_cropped'):
+            if key in entry:
+                job_params['preprocessing'][key] = entry[key]
+        header = recording_shape(paths)
+        jobs.append({
+            'name': name,
+            'inputs': paths[0] if len(paths) == 1 else paths,
+            'output_dir': str(entry.get('output_dir') or os.path.join(str(output_dir), name)),
+            'params': job_params,
+            'shape': None if header is None else [int(n) for n in header[0]],
+            'memory': None if header is None else peak_memory(header[0], copies),
+        })
+    names = [job['name'] for job in jobs]
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise ValueError(f"Noms d'enregistrements en double dans le manifeste : {', '.join(duplicated)}")
+    return jobs
+
+
+def _need(job, budget):
+    """ Mémoire réservée pour un enregistrement : son estimation, bornée par le budget. """
+    if job['memory'] is None:
+        return budget if budget != float('inf') else 0
+    return min(job['memory'], budget)
+
+
+def schedule(jobs, budget):
+    """
+    Ordre de lancement first-fit decreasing : générateur appelé avec la mémoire libre, qui
+    retourne le plus gros enregistrement en attente qui y tient (ou None).
+
+    Un enregistrement dont la mémoire est inconnue ou supérieure au budget n'est lancé que
+    lorsque toute la mémoire est libre.
+    """
+    waiting = sorted(jobs, key=lambda job: _need(job, budget), reverse=True)
+    free = yield
+    while waiting:
+        chosen = None
+        for job in waiting:
+            if _need(job, budget) <= free:
+                chosen = job
+                break
+        if chosen is not None:
+            waiting.remove(chosen)
+        free = yield chosen
+
+
+def _init_worker(threads):
+    # Each process gets its share of the cores for the numba / BLAS thread pools
+    for variable in ('NUMBA_NUM_THREADS', 'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[variable] = str(threads)
+
+
+def _run_job(job, keep, single_stack, scratch_dir):
+    """ Traite un enregistrement ; la sortie est écrite dans <output_dir>/astroca.log. """
+    from .pipeline import run_pipeline
+
+    os.makedirs(job['output_dir'], exist_ok=True)
+    start = time.perf_counter()
+    with open(os.path.join(job['output_dir'], LOG_FILE), 'w') as log, contextlib.redirect_stdout(log):
+        try:
+            result = run_pipeline(job['inputs'], job['output_dir'], job['params'], keep, single_stack, scratch_dir)
+        except Exception as error:
+            return {'status': 'error', 'error': f"{type(error).__name__}: {error}",
+                    'seconds': time.perf_counter() - start}
+    return {'status': 'ok', 'ids_events': result['ids_events'], 'timings': result['timings'],
+            'seconds': time.perf_counter() - start}
+
+
+def run_batch(jobs, workers=None, budget=None, keep=(), single_stack=False, scratch_dir=None):
+    """
+    Traite les enregistrements par un pool de processus, sous un budget de mémoire.
+
+    Paramètres :
+        jobs : enregistrements (voir load_manifest)
+        workers : nombre de processus (défaut : nombre de cœurs)
+        budget : mémoire totale (octets) des enregistrements simultanés
+                 (défaut : DEFAULT_BUDGET_FRACTION de la mémoire disponible)
+        keep, single_stack : voir pipeline.run_pipeline
+        scratch_dir : dossier des memmap des enregistrements plus gros que le budget ou de mémoire
+                      inconnue
+
+    Retour :
+        rapport (dict) : résultat de chaque enregistrement et utilisation des processus
+    """
+    import multiprocessing
+
+    from .preflight import available_memory
+
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    if budget is None:
+        available = available_memory()
+        budget = int(available * DEFAULT_BUDGET_FRACTION) if available else float('inf')
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"Lot : {len(jobs)} enregistrements, {workers} processus de {threads} threads, "
+          f"budget {budget / 1e9:.2f} Go")
+
+    results = {}
+    scheduler = schedule(jobs, budget)
+    next(scheduler)
+    free = budget
+    running = {}
+    start = time.perf_counter()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(threads,)) as executor:
+        while True:
+            while len(running) < workers:
+                try:
+                    job = scheduler.send(free)
+                except StopIteration:
+                    break
+                if job is None:
+                    # Reservations are capped at the budget: with no job running, one always fits
+                    break
+                need = _need(job, budget)
+                oversized = job['memory'] is None or job['memory'] > budget
+                if job['memory'] is None:
+                    print(f"{job['name']} : mémoire inconnue (format d'entrée non reconnu), traité seul"
+                          + (f" dans {scratch_dir}" if scratch_dir else ""))
+                elif oversized:
+                    print(f"{job['name']} : mémoire estimée supérieure au budget, traité seul"
+                          + (f" dans {scratch_dir}" if scratch_dir else ""))
+                free -= need
+                future = executor.submit(_run_job, job, tuple(keep), single_stack,
+                                         scratch_dir if oversized else None)
+                running[future] = (job, need)
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, need = running.pop(future)
+                free += need
+                try:
+                    result = future.result()
+                except Exception as error:  # the worker process itself failed
+                    result = {'status': 'error', 'error': f"{type(error).__name__}: {error}", 'seconds': 0.0}
+                results[job['name']] = dict(result, shape=job['shape'], memory=job['memory'])
+                print(f"{job['name']} : {result['status']} en {result['seconds']:.1f} s "
+                      f"({len(results)}/{len(jobs)})" + (f" - {result['error']}" if 'error' in result else ""))
+
+    wall = time.perf_counter() - start
+    busy = sum(result['seconds'] for result in results.values())
+    report = {
+        'recordings': results,
+        'wall_seconds': wall,
+        'workers': workers,
+        'budget_bytes': None if budget == float('inf') else budget,
+        # Share of the worker time spent processing recordings
+        'utilization': busy / (wall * workers) if wall > 0 else 0.0,
+        'failed': sorted(name for name, result in results.items() if result['status'] != 'ok'),
+    }
+    print(f"Lot terminé en {wall:.1f} s, utilisation des processus {report['utilization']:.0%}, "
+          f"{len(report['failed'])} échec(s)")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest', help='Manifeste JSON des enregistrements')
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--params', help='Fichier JSON surchargeant les paramètres par défaut pour tout le lot')
+    parser.add_argument('--workers', type=int, default=None, help='Nombre de processus (défaut : nombre de cœurs)')
+    parser.add_argument('--memory-budget', type=float, default=None,
+                        help='Mémoire totale des enregistrements simultanés, en Go')
+    parser.add_argument('--peak-copies', type=float, default=PEAK_COPIES,
+                        help='Nombre de séquences float32 simultanées retenu pour estimer la mémoire')
+    parser.add_argument('--keep', nargs='*', default=[], choices=STAGES, help='Étapes à écrire sur disque')
+    parser.add_argument('--single-stack', action='store_true', help='Écrit chaque étape en une pile TIFF 4D')
+    parser.add_argument('--scratch-dir', default=None,
+                        help='Dossier des memmap des enregistrements plus gros que le budget')
+    args = parser.parse_args(argv)
+
+    params = None
+    if args.params:
+        with open(args.params) as f:
+            params = json.load(f)
+    jobs = load_manifest(args.manifest, args.output_dir, params, args.peak_copies)
+    budget = None if args.memory_budget is None else int(args.memory_budget * 1e9)
+    report = run_batch(jobs, args.workers, budget, args.keep, args.single_stack, args.scratch_dir)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, REPORT_FILE), 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,212 @@
+"""
+Bornes en X par Z (index_xmin / index_xmax) calculées sur un échantillon de volumes et réutilisées
+d'une acquisition à l'autre.
+
+Les bornes ne dépendent que de la géométrie du microscope. compute_boundaries est donc appliquée
+à quelques volumes répartis dans la séquence ; on en déduit la règle de remplissage hors bornes
+(valeur constante, vérifiée exactement sur l'échantillon), puis on l'applique à toute la séquence.
+
+Les bornes et la règle sont enregistrées sous une empreinte de la géométrie : forme et type des
+volumes, paramètres de recadrage et occupation des colonnes (Z,X) du premier volume. Une nouvelle
+acquisition de même empreinte réutilise ces bornes sans appeler compute_boundaries.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+GEOMETRY_ENV = 'ASTROCA_GEOMETRY_DIR'
+
+
+def compute_boundaries_4d(data4D, params):
+    """
+    Bornes [xmin, xmax] de chaque Z et séquence bornée, calculées par astroca sur data4D.
+
+    Retour :
+        (index_xmin, index_xmax, séquence bornée)
+    """
+    from .resolver import astroca_function
+    compute_boundaries = astroca_function('croppingBoundaries.computeBoundaries.compute_boundaries')
+
+    index_xmin, index_xmax, _, bounded = compute_boundaries(data4D, params)
+    return np.asarray(index_xmin), np.asarray(index_xmax), bounded
+
+
+def sample_indices(time_length, n_samples):
+    """ Indices de `n_samples` volumes répartis régulièrement dans range(time_length). """
+    n_samples = max(1, min(int(n_samples), time_length))
+    return np.unique(np.linspace(0, time_length - 1, n_samples).round().astype(int))
+
+
+def outside_mask(index_xmin, index_xmax, width):
+    """ Masque (Z,X) des colonnes hors de [xmin, xmax] pour chaque Z. """
+    columns = np.arange(width)
+    return (columns < np.asarray(index_xmin)[:, None]) | (columns > np.asarray(index_xmax)[:, None])
+
+
+def apply_boundaries(data4D, index_xmin, index_xmax, fill, dtype=None, scratch_dir=None):
+    """
+    Remplace par `fill` les voxels hors des bornes [xmin, xmax] de chaque Z.
+
+    Paramètres :
+        data4D : séquence recadrée (T,Z,Y,X)
+        index_xmin, index_xmax : bornes par Z
+        fill : valeur hors bornes
+        dtype : type de la sortie (défaut : celui de data4D)
+        scratch_dir : dossier du memmap de sortie (voir store.allocate_4d)
+
+    Retour :
+        np.ndarray (ou np.memmap) (T,Z,Y,X)
+    """
+    from .store import allocate_4d
+
+    out = allocate_4d(data4D.shape, dtype or data4D.dtype, scratch_dir)
+    outside = outside_mask(index_xmin, index_xmax, data4D.shape[-1])
+    for t in range(data4D.shape[0]):
+        frame = out[t]
+        frame[...] = data4D[t]
+        # (Z,X) mask broadcast over Y
+        np.copyto(frame, fill, casting='unsafe', where=outside[:, np.newaxis, :])
+    return out
+
+
+def learn_fill(sample, bounded, index_xmin, index_xmax):
+    """
+    Valeur constante écrite par compute_boundaries hors des bornes, si apply_boundaries
+    reproduit exactement `bounded` à partir de `sample` ; None sinon.
+    """
+    if bounded.shape != sample.shape:
+        return None
+    outside = outside_mask(index_xmin, index_xmax, sample.shape[-1])
+    values = np.asarray(bounded)[np.broadcast_to(outside[np.newaxis, :, np.newaxis, :], bounded.shape)]
+    fill = values.flat[0].item() if values.size else 0
+    candidate = apply_boundaries(sample, index_xmin, index_xmax, fill, bounded.dtype)
+    floating = np.issubdtype(bounded.dtype, np.floating)
+    return fill if np.array_equal(candidate, bounded, equal_nan=bool(floating)) else None
+
+
+def geometry_fingerprint(data4D, params):
+    """ Empreinte de la géométrie d'une séquence recadrée (voir le docstring du module). """
+    description = {
+        'frame_shape': list(data4D.shape[1:]),
+        'dtype': str(data4D.dtype),
+        'preprocessing': params.get('preprocessing'),
+    }
+    h = hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode())
+    occupied_columns = (np.asarray(data4D[0]) != 0).any(axis=1)
+    h.update(np.packbits(occupied_columns).tobytes())
+    return h.hexdigest()
+
+
+class GeometryStore:
+    """
+    Bornes enregistrées par empreinte de géométrie : `<dossier>/<empreinte>/` contient
+    index_xmin.npy, index_xmax.npy et rule.json (valeur et type hors bornes).
+    """
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def for_tool(cls, arg):
+        """ Store désigné par l'attribut `geometry_cache` de l'outil ou ASTROCA_GEOMETRY_DIR, sinon None. """
+        directory = getattr(arg, 'geometry_cache', None)
+        if directory is None or str(directory).strip() in ('', 'None'):
+            directory = os.environ.get(GEOMETRY_ENV)
+        return cls(directory) if directory else None
+
+    def load(self, fingerprint):
+        """ (index_xmin, index_xmax, règle) enregistrés sous `fingerprint`, ou None. """
+        entry = os.path.join(self.directory, fingerprint)
+        try:
+            with open(os.path.join(entry, 'rule.json')) as f:
+                rule = json.load(f)
+            return (np.load(os.path.join(entry, 'index_xmin.npy')),
+                    np.load(os.path.join(entry, 'index_xmax.npy')), rule)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, fingerprint, index_xmin, index_xmax, rule):
+        entry = os.path.join(self.directory, fingerprint)
+        os.makedirs(entry, exist_ok=True)
+        np.save(os.path.join(entry, 'index_xmin.npy'), index_xmin)
+        np.save(os.path.join(entry, 'index_xmax.npy'), index_xmax)
+        # rule.json is written last: an entry without it is incomplete and ignored by load()
+        with open(os.path.join(entry, 'rule.json'), 'w') as f:
+            json.dump(rule, f)
+
+    def discard(self, fingerprint):
+        try:
+            os.remove(os.path.join(self.directory, fingerprint, 'rule.json'))
+        except OSError:
+            pass
+
+
+def boundaries_sampled(data4D, params, n_samples=0, store=None, verify=False, scratch_dir=None):
+    """
+    Équivalent de compute_boundaries(data4D, params) fondé sur un échantillon de volumes
+    ou sur des bornes déjà connues pour cette géométrie.
+
+    Paramètres :
+        data4D : séquence recadrée par crop_boundaries (T,Z,Y,X)
+        params : paramètres de compute_boundaries
+        n_samples : nombre de volumes échantillonnés ; 0 (ou >= T) : toute la séquence
+        store : GeometryStore où chercher et enregistrer les bornes, ou None
+        verify : recalcule aussi les bornes sur toute la séquence et compare ; en cas d'écart,
+                 le résultat complet est retourné et l'entrée du store est invalidée
+        scratch_dir : dossier du memmap de sortie (voir store.allocate_4d)
+
+    Retour :
+        (index_xmin, index_xmax, séquence bornée)
+    """
+    T = data4D.shape[0]
+    fingerprint = geometry_fingerprint(data4D, params) if store is not None else None
+    known = store.load(fingerprint) if store is not None else None
+
+    if known is not None:
+        index_xmin, index_xmax, rule = known
+        print(f"Bornes réutilisées pour cette géométrie ({fingerprint[:12]})")
+    elif 0 < n_samples < T:
+        indices = sample_indices(T, n_samples)
+        sample = np.asarray(data4D[indices])
+        index_xmin, index_xmax, bounded_sample = compute_boundaries_4d(sample, params)
+        fill = learn_fill(sample, bounded_sample, index_xmin, index_xmax)
+        if fill is None:
+            print("Bornes : compute_boundaries ne se réduit pas à un remplissage constant, "
+                  "calcul sur toute la séquence.")
+            return _full_and_record(data4D, params, store, fingerprint)
+        rule = {'fill': fill, 'dtype': str(bounded_sample.dtype)}
+        print(f"Bornes calculées sur {len(indices)} volumes sur {T}")
+        if store is not None:
+            store.save(fingerprint, index_xmin, index_xmax, rule)
+    else:
+        return _full_and_record(data4D, params, store, fingerprint)
+
+    bounded = apply_boundaries(data4D, index_xmin, index_xmax, rule['fill'], np.dtype(rule['dtype']), scratch_dir)
+    if not verify:
+        return index_xmin, index_xmax, bounded
+
+    ref_xmin, ref_xmax, reference = compute_boundaries_4d(data4D, params)
+    same = (np.array_equal(ref_xmin, index_xmin) and np.array_equal(ref_xmax, index_xmax)
+            and np.array_equal(reference, bounded, equal_nan=bool(np.issubdtype(reference.dtype, np.floating))))
+    if same:
+        print("Vérification des bornes : identiques au calcul sur toute la séquence.")
+        return index_xmin, index_xmax, bounded
+    changed = int(np.count_nonzero(ref_xmin != index_xmin) + np.count_nonzero(ref_xmax != index_xmax))
+    print(f"Vérification des bornes : écart avec le calcul complet ({changed} bornes différentes), "
+          f"le calcul complet est retenu.")
+    if store is not None:
+        store.discard(fingerprint)
+    return ref_xmin, ref_xmax, reference
+
+
+def _full_and_record(data4D, params, store, fingerprint):
+    index_xmin, index_xmax, bounded = compute_boundaries_4d(data4D, params)
+    if store is not None:
+        indices = sample_indices(data4D.shape[0], 4)
+        fill = learn_fill(np.asarray(data4D[indices]), np.asarray(bounded[indices]), index_xmin, index_xmax)
+        if fill is not None:
+            store.save(fingerprint, index_xmin, index_xmax, {'fill': fill, 'dtype': str(bounded.dtype)})
+    return index_xmin, index_xmax, bounded
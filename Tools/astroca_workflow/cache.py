@@ -0,0 +1,223 @@
+"""
+Cache des résultats des outils, indexé par l'empreinte des entrées et des paramètres.
+
+Une entrée du cache est un dossier `<cache_dir>/<clé>/` contenant les fichiers produits
+par l'outil et un manifest.json. La clé est un SHA-256 du nom de l'outil, des paramètres
+et de l'empreinte de chaque fichier d'entrée :
+    - mode 'stat' (défaut) : nom, taille et date de modification du fichier ;
+    - mode 'content' : contenu complet du fichier.
+Les fichiers sont copiés avec leurs dates (shutil.copy2), de sorte que les empreintes des
+sorties restaurées restent identiques pour l'outil suivant. Ils ne sont pas liés : un outil
+réécrivant sa sortie sur place corromprait sinon l'entrée du cache.
+
+Le cache est limité en taille : les entrées les moins récemment utilisées sont supprimées.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+CACHE_ENV = 'ASTROCA_CACHE_DIR'
+CACHE_MAX_GB_ENV = 'ASTROCA_CACHE_MAX_GB'
+CACHE_DIGEST_ENV = 'ASTROCA_CACHE_DIGEST'
+DEFAULT_MAX_GB = 20.0
+MANIFEST = 'manifest.json'
+
+
+def _file_fingerprint(path, digest):
+    stat = os.stat(path)
+    if digest == 'content':
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        return [os.path.basename(path), stat.st_size, h.hexdigest()]
+    return [os.path.basename(path), stat.st_size, stat.st_mtime_ns]
+
+
+def _copy(src, dst):
+    if os.path.exists(dst):
+        os.remove(dst)
+    shutil.copy2(src, dst)
+
+
+def tool_input_files(argsList, attributes):
+    """
+    Chemins des fichiers référencés par les attributs `attributes` de tous les éléments de argsList,
+    sans doublon et dans l'ordre.
+    """
+    paths = []
+    for arg in argsList:
+        for attribute in attributes:
+            path = str(getattr(arg, attribute))
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def snapshot_dir(directory):
+    """ Dates de modification des fichiers d'un dossier, pour repérer ceux qu'un outil y écrit. """
+    if not os.path.isdir(directory):
+        return {}
+    return {entry.path: entry.stat().st_mtime_ns for entry in os.scandir(directory) if entry.is_file()}
+
+
+def written_since(directory, snapshot):
+    """ Fichiers créés ou modifiés dans `directory` depuis `snapshot` (voir snapshot_dir). """
+    return [path for path, mtime in snapshot_dir(directory).items() if snapshot.get(path) != mtime]
+
+
+class StageCache:
+    """
+    Cache LRU borné en taille des sorties des outils.
+
+    Paramètres :
+        cache_dir : dossier du cache
+        max_bytes : taille maximale du cache en octets
+        digest : 'stat' ou 'content', mode d'empreinte des fichiers d'entrée
+    """
+
+    def __init__(self, cache_dir, max_bytes=int(DEFAULT_MAX_GB * 1e9), digest='stat'):
+        if digest not in ('stat', 'content'):
+            raise ValueError(f"Mode d'empreinte inconnu : {digest} (attendu 'stat' ou 'content').")
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = int(max_bytes)
+        self.digest = digest
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def for_tool(cls, arg):
+        """
+        Cache configuré pour un outil, ou None si aucun dossier de cache n'est défini.
+
+        L'attribut `cache_dir` de l'argument de l'outil est prioritaire sur ASTROCA_CACHE_DIR ;
+        ASTROCA_CACHE_MAX_GB et ASTROCA_CACHE_DIGEST règlent la taille et le mode d'empreinte.
+        """
+        cache_dir = getattr(arg, 'cache_dir', None)
+        if cache_dir is None or str(cache_dir).strip() in ('', 'None'):
+            cache_dir = os.environ.get(CACHE_ENV)
+        if not cache_dir:
+            return None
+        max_gb = float(os.environ.get(CACHE_MAX_GB_ENV, DEFAULT_MAX_GB))
+        return cls(cache_dir, int(max_gb * 1e9), os.environ.get(CACHE_DIGEST_ENV, 'stat'))
+
+    def key(self, tool_name, input_paths, params):
+        """ Clé du résultat de `tool_name` pour ces fichiers d'entrée et ces paramètres. """
+        for path in input_paths:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {path}")
+        description = {
+            'tool': tool_name,
+            'params': params,
+            'inputs': [_file_fingerprint(path, self.digest) for path in input_paths],
+        }
+        encoded = json.dumps(description, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def restore(self, key, output_dir):
+        """
+        Restaure dans output_dir les fichiers de l'entrée `key`.
+
+        Retour :
+            les métadonnées enregistrées avec l'entrée (dict) en cas de succès, None sinon
+        """
+        manifest_path = os.path.join(self._entry(key), MANIFEST)
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        os.makedirs(output_dir, exist_ok=True)
+        try:
+            for name in manifest['files']:
+                _copy(os.path.join(self._entry(key), name), os.path.join(output_dir, name))
+        except OSError:
+            # Entry evicted concurrently or incomplete: recompute
+            return None
+        os.utime(manifest_path)  # mark as recently used
+        print(f"Résultat restauré depuis le cache ({len(manifest['files'])} fichiers) : {key[:12]}")
+        return manifest.get('extra', {})
+
+    def store(self, key, paths, extra=None):
+        """
+        Enregistre les fichiers `paths` produits par l'outil sous la clé `key`, puis applique la limite de taille.
+
+        Paramètres :
+            key : clé retournée par key()
+            paths : fichiers produits par l'outil
+            extra : métadonnées JSON restituées par restore() (ex. nombre d'événements)
+        """
+        entry = self._entry(key)
+        tmp_entry = f"{entry}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        os.makedirs(tmp_entry)
+        names = []
+        for path in paths:
+            name = os.path.basename(str(path))
+            _copy(str(path), os.path.join(tmp_entry, name))
+            names.append(name)
+        size = sum(os.path.getsize(os.path.join(tmp_entry, name)) for name in names)
+        with open(os.path.join(tmp_entry, MANIFEST), 'w') as f:
+            json.dump({'files': names, 'size': size, 'extra': extra or {}, 'created': time.time()}, f)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.rename(tmp_entry, entry)
+        self.evict(keep=key)
+
+    def entries(self):
+        """ Liste (dernière utilisation, taille, clé) des entrées complètes du cache. """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            manifest_path = os.path.join(self.cache_dir, name, MANIFEST)
+            try:
+                with open(manifest_path) as f:
+                    size = json.load(f)['size']
+                entries.append((os.path.getmtime(manifest_path), size, name))
+            except (OSError, ValueError, KeyError):
+                continue
+        return entries
+
+    def evict(self, keep=None):
+        """ Supprime les entrées les moins récemment utilisées jusqu'à respecter max_bytes. """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= size
+
+
+def open_stage_cache(tool_name, argsList, input_attributes, params, extra_inputs=(),
+                     output_attribute='output_image'):
+    """
+    Ouvre le cache d'un outil et calcule la clé de son exécution.
+
+    Paramètres :
+        tool_name : nom de l'outil
+        argsList : arguments reçus par processAllData
+        input_attributes : attributs de argsList désignant des fichiers d'entrée
+        params : paramètres de l'outil (sérialisables en JSON)
+        extra_inputs : autres fichiers d'entrée (ex. index_xmin / index_xmax résolus)
+        output_attribute : attribut désignant la sortie ; son nom de fichier fait partie de la clé
+
+    Retour :
+        (cache, clé), ou (None, None) si le cache est désactivé
+    """
+    from .options import output_format
+
+    stage_cache = StageCache.for_tool(argsList[0])
+    if stage_cache is None:
+        return None, None
+    key_params = {
+        'params': params,
+        'output': os.path.basename(str(getattr(argsList[0], output_attribute))),
+        'format': output_format(argsList[0]),
+    }
+    input_paths = tool_input_files(argsList, input_attributes) + [str(path) for path in extra_inputs]
+    return stage_cache, stage_cache.key(tool_name, input_paths, key_params)
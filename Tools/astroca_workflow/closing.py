@@ -0,0 +1,151 @@
+"""
+Fermeture morphologique spatiale (closing_morphology_in_space) appliquée à des lots de volumes.
+
+La fonction astroca ferme chaque volume (Z,Y,X) séparément. Ici, un lot de volumes est fermé en
+une seule opération scipy.ndimage.grey_closing sur le tableau 4D, avec un élément structurant
+de taille 1 selon T : les volumes restent indépendants, mais la boucle par volume disparaît.
+Les lots sont éventuellement répartis entre processus (tiling.map_blocks_into).
+
+Une séquence binaire peut être traitée sous forme de PackedMask (1 bit par voxel) : seul le lot
+en cours est décompressé.
+
+L'équivalence avec la fonction astroca (forme de la boule, gestion des bords) est vérifiée sur
+le volume central et sur deux masques synthétiques (voir synthetic_masks) dont les objets touchent
+toutes les faces : le comportement aux bords n'apparaît que sur un masque non vide, et un volume
+central vide coïnciderait trivialement. En cas de différence, les lots sont fermés par
+closing_morphology_in_space elle-même.
+"""
+import numpy as np
+
+from .packed import PackedMask, is_binary
+from .tiling import map_blocks_into
+
+# Working set of one batch (input, dilation, output), in bytes
+BATCH_BYTES = 512 * 2 ** 20
+# Largest (Z,Y,X) of the synthetic masks checking the batched closing
+PROBE_SHAPE = (8, 32, 32)
+
+
+def _reference(data4D, radius, border_mode):
+    from .resolver import astroca_function
+    closing_morphology_in_space = astroca_function('activeVoxels.spaceMorphology.closing_morphology_in_space')
+
+    return closing_morphology_in_space(data4D, radius, border_mode)
+
+
+def ball_footprint(radius):
+    """ Élément structurant 4D (1, 2r+1, 2r+1, 2r+1) : boule de rayon `radius` dans chaque volume. """
+    r = int(radius)
+    grid = np.arange(-r, r + 1)
+    dz, dy, dx = np.meshgrid(grid, grid, grid, indexing='ij')
+    return (dz ** 2 + dy ** 2 + dx ** 2 <= r ** 2)[np.newaxis]
+
+
+def _closing_batch(block, radius, border_mode, batched, out_dtype):
+    if not batched:
+        return _reference(block, radius, border_mode)
+    from scipy.ndimage import grey_closing
+
+    closed = grey_closing(block, footprint=ball_footprint(radius), mode=border_mode)
+    return closed if closed.dtype == out_dtype else closed.astype(out_dtype)
+
+
+def synthetic_masks(frame_shape, dtype, seed=0):
+    """
+    Deux masques aléatoires (2,Z,Y,X) de la forme d'un volume (bornée par PROBE_SHAPE) : objets
+    épars avec trous à combler, et faces du volume à moitié pleines pour que la fermeture
+    atteigne les bords.
+    """
+    shape = tuple(min(n, p) for n, p in zip(frame_shape, PROBE_SHAPE))
+    rng = np.random.default_rng(seed)
+    masks = rng.random((2,) + shape) < 0.3
+    for axis in range(1, 4):
+        for face in (0, -1):
+            index = [slice(None)] * 4
+            index[axis] = face
+            masks[tuple(index)] |= rng.random(masks[tuple(index)].shape) < 0.5
+    return masks.astype(dtype)
+
+
+def batch_length(frame_shape, dtype, n_frames):
+    """ Nombre de volumes par lot pour rester dans BATCH_BYTES. """
+    frame_bytes = int(np.prod(frame_shape)) * np.dtype(dtype).itemsize
+    return int(max(1, min(n_frames, BATCH_BYTES // max(1, 3 * frame_bytes))))
+
+
+def _closing_packed(source, radius, border_mode, batched, out_dtype, scratch_dir):
+    """ Ferme un PackedMask lot par lot : seul le lot en cours est décompressé. """
+    T = source.shape[0]
+    out = PackedMask.empty(source.shape, out_dtype, scratch_dir)
+    step = batch_length(source.shape[1:], source.dtype, T)
+    for start in range(0, T, step):
+        stop = min(T, start + step)
+        out.pack(start, _closing_batch(source.unpack(start, stop, source.dtype), radius, border_mode,
+                                       batched, out_dtype))
+    print(f"Fermeture sur masque compressé : {out.nbytes / 1e6:.1f} Mo "
+          f"au lieu de {int(np.prod(out.shape)) * out_dtype.itemsize / 1e6:.1f} Mo")
+    return out
+
+
+def closing_batched(data4D, radius, border_mode, n_workers=1, packed=False, scratch_dir=None):
+    """
+    Équivalent de closing_morphology_in_space(data4D, radius, border_mode), calculé par lots de volumes.
+
+    Paramètres :
+        data4D : séquence (T,Z,Y,X), en mémoire, np.memmap ou PackedMask
+        radius : rayon de la boule (entier)
+        border_mode : mode de gestion des bords (modes de scipy.ndimage)
+        n_workers : nombre de processus (séquence dense uniquement)
+        packed : traite et retourne la séquence sous forme de PackedMask si elle est binaire
+                 (toujours le cas si data4D est un PackedMask)
+        scratch_dir : dossier des memmap de sortie (voir store.allocate_4d), None pour la mémoire
+
+    Retour :
+        np.ndarray (ou np.memmap) (T,Z,Y,X), ou PackedMask si `packed` et la séquence est binaire
+    """
+    from .store import allocate_4d
+
+    T = data4D.shape[0]
+    probe = T // 2
+    packed_input = isinstance(data4D, PackedMask)
+    if packed_input:
+        probe_frames = data4D.unpack(probe, probe + 1, data4D.dtype)
+    else:
+        probe_frames = np.asarray(data4D[probe:probe + 1])
+    reference = _reference(probe_frames, radius, border_mode)
+    out_dtype = reference.dtype
+    try:
+        candidate = _closing_batch(probe_frames, radius, border_mode, True, out_dtype)
+        batched = np.array_equal(candidate, reference)
+        # An empty or nearly empty central frame proves nothing about the borders
+        if batched:
+            masks = synthetic_masks(data4D.shape[1:], probe_frames.dtype)
+            batched = np.array_equal(_closing_batch(masks, radius, border_mode, True, out_dtype),
+                                     _reference(masks, radius, border_mode))
+    except (RuntimeError, ValueError) as e:
+        print(f"Fermeture : calcul par lots indisponible ({e}).")
+        batched = False
+    if not batched:
+        print("Fermeture : le calcul par lots diffère de closing_morphology_in_space, "
+              "les volumes sont fermés par la fonction astroca.")
+
+    if (packed or packed_input) and is_binary(reference):
+        source = data4D if packed_input else PackedMask.from_dense(data4D, scratch_dir)
+        if source is not None:
+            return _closing_packed(source, radius, border_mode, batched, out_dtype, scratch_dir)
+    if packed_input:
+        data4D = data4D.to_dense(scratch_dir)
+    elif packed:
+        print("Fermeture : la séquence n'est pas binaire, elle est traitée sous forme dense.")
+
+    out = allocate_4d(data4D.shape, out_dtype, scratch_dir)
+    step = batch_length(data4D.shape[1:], data4D.dtype, T)
+    args = (radius, border_mode, batched, out_dtype)
+    if n_workers <= 1:
+        for start in range(0, T, step):
+            stop = min(T, start + step)
+            out[start:stop] = _closing_batch(np.asarray(data4D[start:stop]), *args)
+    else:
+        map_blocks_into(_closing_batch, data4D, out, 0, n_workers,
+                        n_blocks=max(n_workers, -(-T // step)), args=args)
+    return out
@@ -0,0 +1,136 @@
+"""
+Écriture des caractéristiques par blocs de lignes, en CSV ou en format colonnes (Parquet, Feather).
+
+La table des caractéristiques n'est jamais assemblée : les lignes reçues au fil du calcul sont
+regroupées par blocs de `row_group_rows` lignes, écrits l'un après l'autre (groupes de lignes
+Parquet, lots Arrow IPC pour Feather, ajouts au fichier CSV). Les fichiers Parquet et Feather
+se relisent sans tout charger, colonne par colonne ou avec un filtre (voir open_features).
+
+pyarrow n'est nécessaire que pour les formats Parquet et Feather.
+"""
+import os
+
+FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+
+# Rows per Parquet row group / Arrow record batch
+DEFAULT_ROW_GROUP_ROWS = 65536
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("Les formats Parquet et Feather nécessitent pyarrow "
+                          "(conda install pyarrow) ; utilisez le format csv sinon.") from e
+    return pyarrow
+
+
+def features_path(path, fmt):
+    """ Chemin de sortie `path` avec l'extension du format `fmt`. """
+    if fmt not in FORMATS:
+        raise ValueError(f"Format de caractéristiques inconnu : {fmt} (attendu : {', '.join(FORMATS)}).")
+    return os.path.splitext(str(path))[0] + FORMATS[fmt]
+
+
+class FeatureWriter:
+    """
+    Écrit une table de caractéristiques reçue par morceaux (pandas.DataFrame de mêmes colonnes).
+
+    Paramètres :
+        path : fichier de sortie ; son extension est remplacée par celle du format
+        fmt : 'csv', 'parquet' ou 'feather'
+        row_group_rows : nombre de lignes accumulées avant chaque écriture
+    """
+
+    def __init__(self, path, fmt='csv', row_group_rows=DEFAULT_ROW_GROUP_ROWS):
+        self.path = features_path(path, fmt)
+        self.fmt = fmt
+        self.row_group_rows = max(1, int(row_group_rows))
+        self.n_rows = 0
+        self._pending = []
+        self._pending_rows = 0
+        self._started = False
+        self._writer = None
+        self._schema = None
+        if fmt != 'csv':
+            _pyarrow()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def append(self, table):
+        """ Ajoute des lignes ; elles sont écrites dès que `row_group_rows` lignes sont en attente. """
+        if len(table) == 0:
+            return
+        self._pending.append(table)
+        self._pending_rows += len(table)
+        if self._pending_rows >= self.row_group_rows:
+            self._flush()
+
+    def _flush(self):
+        import pandas as pd
+
+        if not self._pending:
+            return
+        table = pd.concat(self._pending, ignore_index=True)
+        self._pending, self._pending_rows = [], 0
+        if self.fmt == 'csv':
+            table.to_csv(self.path, mode='a' if self._started else 'w', header=not self._started, index=False)
+        else:
+            self._write_arrow(table)
+        self._started = True
+        self.n_rows += len(table)
+
+    def _write_arrow(self, table):
+        pa = _pyarrow()
+
+        if self._writer is None:
+            batch = pa.Table.from_pandas(table, preserve_index=False)
+            self._schema = batch.schema
+            if self.fmt == 'parquet':
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            else:
+                import pyarrow.ipc as ipc
+                self._writer = ipc.new_file(self.path, self._schema)
+        else:
+            # Later blocks are cast to the schema of the first one (e.g. int columns with NaN)
+            batch = pa.Table.from_pandas(table, schema=self._schema, preserve_index=False)
+        if self.fmt == 'parquet':
+            self._writer.write_table(batch, row_group_size=len(batch))
+        else:
+            self._writer.write_table(batch, max_chunksize=len(batch))
+
+    def close(self):
+        """
+        Écrit les lignes en attente et ferme le fichier.
+
+        Retour :
+            liste contenant le chemin écrit (vide si aucune ligne n'a été reçue)
+        """
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        return [self.path] if self._started else []
+
+
+def open_features(path):
+    """
+    Ouvre un fichier de caractéristiques sans le charger (pyarrow.dataset.Dataset).
+
+    Les lignes utiles se lisent ensuite à la demande, ex. :
+        open_features(path).to_table(columns=['id', 'duration'], filter=ds.field('duration') > 5)
+    """
+    _pyarrow()
+    import pyarrow.dataset as ds
+
+    path = str(path)
+    extension = os.path.splitext(path)[1].lower()
+    fmt = {'.parquet': 'parquet', '.feather': 'ipc', '.arrow': 'ipc', '.csv': 'csv'}.get(extension)
+    if fmt is None:
+        raise ValueError(f"Format de caractéristiques non reconnu : {path}")
+    return ds.dataset(path, format=fmt)
@@ -0,0 +1,207 @@
+"""
+Détection des événements calciques par fenêtres temporelles recouvrantes.
+
+detect_calcium_events_opti reçoit la séquence 4D entière. Ici, elle est appelée sur des
+fenêtres [début - recouvrement, fin + recouvrement) : chaque fenêtre n'écrit que son cœur
+[début, fin) dans la sortie, et les étiquettes de deux fenêtres voisines qui marquent un même
+voxel de leur zone commune sont fusionnées (union-find). Les identifiants sont ensuite
+renumérotés dans l'ordre de première apparition (parcours t, z, y, x).
+
+Seules deux fenêtres sont en mémoire à la fois ; avec un scratch_dir, l'entrée et la sortie
+sont des memmap.
+
+Le raccord ne fait que fusionner : il ne sépare jamais ce qu'une fenêtre a regroupé, et ne
+retrouve pas un voxel qu'une fenêtre a écarté. Le résultat n'est celui du calcul d'un seul
+tenant que si chaque fenêtre décide comme la séquence entière pour les instants de son cœur :
+    - threshold_size_3d et threshold_size_3d_remove portent sur des composantes 3D d'un seul
+      instant : ils ne dépendent pas de la fenêtre ;
+    - le regroupement par corrélation (threshold_corr) et tout seuil portant sur la taille ou la
+      durée d'un événement entier dépendent de la fenêtre : ils ne sont sûrs que si le
+      recouvrement couvre la durée des événements, de sorte qu'aucun événement du cœur ne soit
+      tronqué.
+Au raccord (dernier instant d'un cœur et premier du suivant), les deux fenêtres ont chacune au
+moins `overlap` instants de contexte : elles doivent y marquer les mêmes voxels, avec une
+correspondance une à une des étiquettes. Un désaccord signale un recouvrement trop court ou un
+seuil dépendant de la fenêtre (TilingMismatch avec strict=True). L'accord au raccord est
+nécessaire mais pas suffisant : seule la comparaison au calcul d'un seul tenant (verify_tiling
+dans Event_Finder) garantit le résultat.
+"""
+import numpy as np
+
+
+class UnionFind:
+    """ Union-find sur les entiers 0..n-1 (compression de chemin, union par rang). """
+
+    def __init__(self, n):
+        self.parent = np.arange(n, dtype=np.int64)
+        self.rank = np.zeros(n, dtype=np.int8)
+
+    def grow(self, n):
+        """ Étend l'ensemble à 0..n-1. """
+        old = len(self.parent)
+        if n > old:
+            self.parent = np.concatenate([self.parent, np.arange(old, n, dtype=np.int64)])
+            self.rank = np.concatenate([self.rank, np.zeros(n - old, dtype=np.int8)])
+
+    def find(self, x):
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.rank[a] < self.rank[b]:
+            a, b = b, a
+        self.parent[b] = a
+        if self.rank[a] == self.rank[b]:
+            self.rank[a] += 1
+
+    def roots(self):
+        """ Racine de chaque élément, sous forme de tableau. """
+        return np.array([self.find(x) for x in range(len(self.parent))], dtype=np.int64)
+
+
+class TilingMismatch(ValueError):
+    """ Deux fenêtres voisines ne s'accordent pas sur les événements de leur raccord. """
+
+
+def seam_conflicts(mine, theirs):
+    """
+    Désaccords de deux étiquetages d'un même raccord.
+
+    Retour :
+        (nombre de voxels actifs dans un seul étiquetage, nombre d'étiquettes associées à
+        plusieurs étiquettes de l'autre)
+    """
+    mine, theirs = np.asarray(mine), np.asarray(theirs)
+    one_side = int(np.count_nonzero((mine > 0) != (theirs > 0)))
+    both = (mine > 0) & (theirs > 0)
+    pairs = np.unique(np.stack([mine[both], theirs[both]], axis=1), axis=0)
+    shared = 2 * len(pairs) - len(np.unique(pairs[:, 0])) - len(np.unique(pairs[:, 1]))
+    return one_side, int(shared)
+
+
+def window_bounds(length, window, overlap):
+    """
+    Fenêtres couvrant range(length).
+
+    Retour :
+        liste de (début du cœur, fin du cœur, début étendu, fin étendue)
+    """
+    bounds = []
+    for start in range(0, length, window):
+        stop = min(length, start + window)
+        bounds.append((start, stop, max(0, start - overlap), min(length, stop + overlap)))
+    return bounds
+
+
+def _label_dtype(dtype):
+    # Offset labels of all windows must fit before renumbering
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.integer) and dtype.itemsize < 4:
+        return np.dtype(np.int32)
+    return dtype
+
+
+def detect_events_tiled(detect, data4D, params, window, overlap, scratch_dir=None, strict=False):
+    """
+    Équivalent de detect(data4D, params) (detect_calcium_events_opti) calculé par fenêtres.
+
+    Paramètres :
+        detect : fonction astroca (séquence 4D, paramètres) -> (étiquettes 4D, nombre d'événements)
+        data4D : séquence (T,Z,Y,X), en mémoire ou np.memmap
+        params : paramètres transmis à detect
+        window : nombre d'instants du cœur de chaque fenêtre ; 0 ou >= T : un seul appel
+        overlap : nombre d'instants ajoutés de chaque côté du cœur (au moins 1)
+        scratch_dir : dossier du memmap de sortie (voir store.allocate_4d), None pour la mémoire
+        strict : lève TilingMismatch si deux fenêtres voisines ne s'accordent pas à leur raccord
+            (voir seam_conflicts) ; sinon, le désaccord est seulement signalé
+
+    Retour :
+        (étiquettes (T,Z,Y,X), nombre d'événements)
+    """
+    from .store import allocate_4d
+
+    T = data4D.shape[0]
+    if window <= 0 or window >= T:
+        return detect(data4D, params)
+    if overlap < 1:
+        raise ValueError("Le recouvrement des fenêtres doit être d'au moins un instant pour raccorder les événements.")
+
+    uf = UnionFind(1)  # label 0 is the background
+    out = None
+    previous = None  # (extended start, offset labels) of the previous window
+    one_side = shared = 0
+    for start, stop, ext_start, ext_stop in window_bounds(T, window, overlap):
+        labels, n_events = detect(np.ascontiguousarray(data4D[ext_start:ext_stop]), params)
+        if out is None:
+            out = allocate_4d(data4D.shape, _label_dtype(labels.dtype), scratch_dir)
+        offset = len(uf.parent) - 1
+        uf.grow(offset + int(n_events) + 1)
+        labels = np.where(labels > 0, labels.astype(np.int64) + offset, 0)
+
+        if previous is not None:
+            prev_start, prev_labels = previous
+            # Instants seen by both windows: their labels of a same voxel are one event
+            common = slice(ext_start, min(ext_stop, prev_start + len(prev_labels)))
+            mine = labels[common.start - ext_start:common.stop - ext_start]
+            theirs = prev_labels[common.start - prev_start:common.stop - prev_start]
+            both = (mine > 0) & (theirs > 0)
+            if both.any():
+                pairs = np.unique(np.stack([mine[both], theirs[both]], axis=1), axis=0)
+                for a, b in pairs:
+                    uf.union(int(a), int(b))
+            # Seam: last instant of the previous core and first of this one, where both windows
+            # have at least `overlap` instants of context
+            seam = slice(start - 1 - common.start, start + 1 - common.start)
+            conflicts = seam_conflicts(mine[seam], theirs[seam])
+            one_side += conflicts[0]
+            shared += conflicts[1]
+
+        out[start:stop] = labels[start - ext_start:stop - ext_start]
+        # Only the instants the next window also sees are kept
+        keep_from = max(ext_start, stop - overlap)
+        previous = (keep_from, labels[keep_from - ext_start:])
+
+    if one_side or shared:
+        message = (f"Détection par fenêtres : les fenêtres voisines ne s'accordent pas à leur raccord "
+                   f"({one_side} voxels actifs dans une seule fenêtre, {shared} étiquettes associées à "
+                   f"plusieurs) ; recouvrement trop court ou seuil dépendant de la fenêtre.")
+        if strict:
+            raise TilingMismatch(message)
+        print(message)
+    n_events = _renumber(out, uf.roots())
+    return out, n_events
+
+
+def _renumber(out, roots):
+    """ Remplace chaque étiquette par sa classe, numérotée dans l'ordre de première apparition. """
+    new_ids = np.zeros(len(roots), dtype=np.int64)
+    root_ids = {}
+    for t in range(out.shape[0]):
+        frame = np.asarray(out[t]).astype(np.int64)
+        labels, first = np.unique(frame, return_index=True)
+        for label in labels[np.argsort(first)]:
+            if label == 0:
+                continue
+            root = roots[label]
+            if root not in root_ids:
+                root_ids[root] = len(root_ids) + 1
+            new_ids[label] = root_ids[root]
+        out[t] = new_ids[frame]
+    return len(root_ids)
+
+
+def same_partition(a, b):
+    """ Indique si deux étiquetages définissent les mêmes événements (aux numéros près). """
+    a = np.asarray(a).reshape(-1)
+    b = np.asarray(b).reshape(-1)
+    if a.shape != b.shape or not np.array_equal(a > 0, b > 0):
+        return False
+    pairs = np.unique(np.stack([a[a > 0], b[b > 0]], axis=1), axis=0)
+    return len(np.unique(pairs[:, 0])) == len(pairs) == len(np.unique(pairs[:, 1]))
@@ -0,0 +1,286 @@
+"""
+Calcul des caractéristiques des événements en parallèle, événement par événement.
+
+save_features_from_events parcourt les événements 1..ids_events sur les séquences 4D entières.
+Ici, un index des événements est construit en une passe (tri des voxels actifs par étiquette) :
+pour chaque identifiant, ses indices plats et sa boîte englobante (t, z, y, x). Chaque événement
+est ensuite traité seul dans un pool de processus, sur sa boîte : l'étiquette et l'amplitude
+recadrées sont transmises, l'événement y porte l'identifiant 1. Les lignes obtenues sont
+transmises au fil du calcul (voir columnar.FeatureWriter).
+
+La boîte transmise à astroca part de l'origine de la séquence : elle va de (0, 0, 0, 0) au coin
+le plus éloigné de l'événement. Les coordonnées calculées (instant de début, centroïde, ...) sont
+donc absolues sans aucune correction ; seul le coin éloigné est recadré, et la boîte ne dépasse
+jamais la séquence. Le reste de la boîte est vidé des autres événements.
+
+Les caractéristiques calculées par astroca ne sont pas connues ici : le calcul par événement
+suppose que les caractéristiques d'un événement ne dépendent que de ses voxels. Il est comparé,
+sur les PROBE_EVENTS premiers événements, au calcul de référence restreint à ces événements, et
+n'est utilisé que s'il donne les mêmes valeurs (au bit près pour les colonnes entières, à
+FEATURES_RTOL près pour les colonnes flottantes) ; sinon, les caractéristiques sont calculées
+d'un seul tenant. La colonne des identifiants doit être la seule colonne de la référence valant
+1..PROBE_EVENTS, et valoir 1 pour chaque événement calculé seul ; sinon, calcul d'un seul tenant.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+FEATURES_FUNCTION = 'features.featuresComputation.save_features_from_events'
+
+# Events checked against the reference computation before the per-event path is used
+PROBE_EVENTS = 8
+
+# Tolerance on float columns (sums over the same voxels, possibly in another order)
+FEATURES_RTOL = 1e-9
+FEATURES_ATOL = 1e-12
+
+
+class EventIndex:
+    """
+    Voxels et boîtes englobantes des événements d'un étiquetage 4D.
+
+    Paramètres :
+        labels : étiquettes (T,Z,Y,X), 0 pour le fond, 1..n_events pour les événements
+        n_events : nombre d'événements
+    """
+
+    def __init__(self, labels, n_events):
+        flat = np.asarray(labels).reshape(-1)
+        active = np.flatnonzero(flat)
+        ids = flat[active].astype(np.int64)
+        ids[ids > int(n_events)] = 0
+        order = np.argsort(ids, kind='stable')
+        self._build(labels.shape, n_events, active[order], np.bincount(ids, minlength=int(n_events) + 1))
+
+    @classmethod
+    def from_spans(cls, spans):
+        """ Index construit à partir des plages d'un fichier .events.npz (voir spans.EventSpans), sans tri. """
+        index = cls.__new__(cls)
+        # Voxels before the first run of each event, hence the size of each event
+        voxel_offsets = np.concatenate([[0], np.cumsum(spans.lengths, dtype=np.int64)])[spans.offsets]
+        index._build(spans.shape, spans.n_events, spans.flat_indices(), np.diff(voxel_offsets))
+        return index
+
+    def _build(self, shape, n_events, voxels, counts):
+        self.shape = tuple(shape)
+        self.n_events = int(n_events)
+        self.voxels = voxels
+        # Voxels of event i are voxels[offsets[i]:offsets[i + 1]]; label 0 only holds ids > n_events
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        coords = np.unravel_index(self.voxels, self.shape)
+        starts = self.offsets[:-1]
+        present = counts > 0
+        self.bbox_min = np.zeros((self.n_events + 1, len(self.shape)), dtype=np.int64)
+        self.bbox_max = np.full((self.n_events + 1, len(self.shape)), -1, dtype=np.int64)
+        for axis, coord in enumerate(coords):
+            if len(coord):
+                self.bbox_min[present, axis] = np.minimum.reduceat(coord, starts[present])
+                self.bbox_max[present, axis] = np.maximum.reduceat(coord, starts[present])
+
+    def flat_indices(self, event_id):
+        """ Indices plats (dans la séquence 4D) des voxels de l'événement. """
+        return self.voxels[self.offsets[event_id]:self.offsets[event_id + 1]]
+
+    def size(self, event_id):
+        return int(self.offsets[event_id + 1] - self.offsets[event_id])
+
+    def bbox(self, event_id):
+        """ Boîte englobante de l'événement, sous forme d'un tuple de slices (t, z, y, x). """
+        return tuple(slice(int(lo), int(hi) + 1)
+                     for lo, hi in zip(self.bbox_min[event_id], self.bbox_max[event_id]))
+
+
+def _event_crop(labels, amplitude, index, event_id):
+    """
+    Étiquette (l'événement vaut 1, le reste 0) et amplitude de l'événement, sur la boîte allant
+    de l'origine de la séquence à son coin le plus éloigné : les coordonnées restent absolues.
+    """
+    box = tuple(slice(0, int(hi) + 1) for hi in index.bbox_max[event_id])
+    crop = (np.asarray(labels[box]) == event_id).astype(labels.dtype)
+    return crop, np.ascontiguousarray(amplitude[box])
+
+
+def _tables_match(candidate, reference):
+    """ Tables identiques ; colonnes flottantes à FEATURES_RTOL / FEATURES_ATOL près. """
+    if list(candidate.columns) != list(reference.columns) or len(candidate) != len(reference):
+        return False
+    for column in reference.columns:
+        a, b = candidate[column].to_numpy(), reference[column].to_numpy()
+        if np.issubdtype(b.dtype, np.floating) or np.issubdtype(a.dtype, np.floating):
+            if not np.allclose(a.astype(np.float64), b.astype(np.float64), rtol=FEATURES_RTOL,
+                               atol=FEATURES_ATOL, equal_nan=True):
+                return False
+        elif not np.array_equal(a, b):
+            return False
+    return True
+
+
+def _features_table(result):
+    import pandas as pd
+
+    if isinstance(result, tuple):
+        result = next((item for item in result if isinstance(item, (pd.DataFrame, dict))), None)
+    if isinstance(result, dict):
+        result = pd.DataFrame(result)
+    if not isinstance(result, pd.DataFrame):
+        raise TypeError("save_features_from_events ne retourne pas de table de caractéristiques.")
+    return result.reset_index(drop=True)
+
+
+def _params_for(params, n_events):
+    # The event count is also passed in the parameters: keep both consistent, and write nothing
+    return dict(params, features_extraction=dict(params.get('features_extraction', {}), ids_events=n_events),
+                files=dict(params.get('files', {}), save_results=0))
+
+
+def _compute_events(crops, params):
+    from .resolver import astroca_function
+
+    save_features_from_events = astroca_function(FEATURES_FUNCTION)
+    params = _params_for(params, 1)
+    tables = []
+    for crop, amplitude in crops:
+        tables.append(_features_table(save_features_from_events(crop, 1, amplitude, params)))
+    return tables
+
+
+def _id_column(reference, n_events, tables):
+    """
+    Colonne des identifiants : la seule colonne de la référence valant 1..n_events, qui vaut 1
+    dans chacune des tables `tables` (événements calculés seuls). None si elle n'est pas unique.
+    """
+    expected = np.arange(1, n_events + 1)
+    candidates = []
+    for column in reference.columns:
+        values = reference[column].to_numpy()
+        if len(values) == n_events and np.issubdtype(values.dtype, np.number) and np.array_equal(values, expected):
+            candidates.append(column)
+    candidates = [column for column in candidates
+                  if all(column in table.columns and np.array_equal(table[column].to_numpy(), [1]) for table in tables)]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def _with_ids(tables, ids, id_column):
+    import pandas as pd
+
+    table = pd.concat(tables, ignore_index=True)
+    table[id_column] = np.asarray(ids, dtype=table[id_column].dtype)
+    return table
+
+
+def features_table(labels, n_events, amplitude, params):
+    """
+    Table des caractéristiques calculée d'un seul tenant par save_features_from_events, sans que
+    la fonction astroca n'écrive de fichier.
+
+    Retour :
+        pandas.DataFrame, ou None si la fonction ne retourne pas de table
+    """
+    from .resolver import astroca_function
+
+    save_features_from_events = astroca_function(FEATURES_FUNCTION)
+    try:
+        return _features_table(save_features_from_events(labels, n_events, amplitude,
+                                                         _params_for(params, int(n_events))))
+    except TypeError as error:
+        print(f"Caractéristiques : {error}")
+        return None
+
+
+def features_parallel(labels, n_events, amplitude, params, n_workers, sink=None, chunk_size=4, index=None):
+    """
+    Table des caractéristiques des événements 1..n_events, calculée événement par événement.
+
+    Paramètres :
+        labels : étiquettes des événements (T,Z,Y,X)
+        n_events : nombre d'événements
+        amplitude : amplitude (T,Z,Y,X)
+        params : paramètres de save_features_from_events
+        n_workers : nombre de processus ; 1 calcule les événements dans ce processus
+        sink : si renseigné, fonction recevant les lignes au fil du calcul, dans l'ordre des
+            identifiants (ex. FeatureWriter.append) ; la table n'est alors pas assemblée
+        chunk_size : nombre d'événements envoyés à la fois à un processus
+        index : EventIndex de `labels` s'il est déjà connu (ex. EventIndex.from_spans)
+
+    Retour :
+        pandas.DataFrame, une ligne par événement (avec `sink` : nombre de lignes transmises) ;
+        None si le calcul par événement diffère du calcul de référence (les caractéristiques
+        doivent alors être calculées d'un seul tenant ; rien n'a été transmis à `sink`)
+    """
+    from .resolver import astroca_function
+
+    save_features_from_events = astroca_function(FEATURES_FUNCTION)
+    if index is None:
+        index = EventIndex(labels, n_events)
+
+    # Reference on the first events only, on the box [0, their largest coordinate]: coordinates
+    # stay absolute, and the other labels are cleared (ids 1..n_probe are kept)
+    n_probe = min(PROBE_EVENTS, index.n_events)
+    if n_probe < 2:
+        return None
+    probe_box = tuple(slice(0, int(hi) + 1) for hi in index.bbox_max[1:n_probe + 1].max(axis=0))
+    probe_labels = np.asarray(labels[probe_box])
+    probe_labels = np.where(probe_labels <= n_probe, probe_labels, 0).astype(labels.dtype)
+    try:
+        reference = _features_table(save_features_from_events(probe_labels, n_probe,
+                                                                np.ascontiguousarray(amplitude[probe_box]),
+                                                                _params_for(params, n_probe)))
+    except TypeError as error:
+        print(f"Caractéristiques : {error}")
+        return None
+    del probe_labels
+    probe_ids = list(range(1, n_probe + 1))
+    probe_tables = _compute_events([_event_crop(labels, amplitude, index, i) for i in probe_ids], params)
+    id_column = _id_column(reference, n_probe, probe_tables)
+    if id_column is None:
+        print("Caractéristiques : colonne des identifiants introuvable ou ambiguë, calcul d'un seul tenant.")
+        return None
+    columns = list(reference.columns)
+
+    def per_box(ids, tables):
+        return _with_ids(tables, ids, id_column)
+
+    candidate = per_box(probe_ids, probe_tables)
+    if not _tables_match(candidate[columns], reference):
+        print("Caractéristiques : le calcul par événement diffère du calcul de référence, calcul d'un seul tenant.")
+        return None
+
+    import pandas as pd
+
+    tables = []
+    n_rows = 0
+
+    def emit(table):
+        nonlocal n_rows
+        table = table[columns]
+        n_rows += len(table)
+        if sink is not None:
+            sink(table)
+        else:
+            tables.append(table)
+
+    emit(candidate)
+    ids = list(range(n_probe + 1, index.n_events + 1))
+    chunks = [ids[start:start + chunk_size] for start in range(0, len(ids), chunk_size)]
+    if n_workers <= 1:
+        for chunk in chunks:
+            crops = [_event_crop(labels, amplitude, index, i) for i in chunk]
+            emit(per_box(chunk, _compute_events(crops, params)))
+    else:
+        # Crops are cut just before submission so that only a few chunks are held at once
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            pending = deque()
+            for chunk in chunks:
+                crops = [_event_crop(labels, amplitude, index, i) for i in chunk]
+                pending.append((chunk, executor.submit(_compute_events, crops, params)))
+                if len(pending) >= 2 * n_workers:
+                    done, future = pending.popleft()
+                    emit(per_box(done, future.result()))
+            while pending:
+                done, future = pending.popleft()
+                emit(per_box(done, future.result()))
+    if sink is not None:
+        return n_rows
+    return pd.concat(tables, ignore_index=True)
@@ -0,0 +1,146 @@
+"""
+Assemblage d'une séquence 4D (T,Z,Y,X) à partir des volumes 3D listés dans argsList.
+
+Les volumes sont lus en parallèle par un pool de threads (le décodage TIFF libère
+le GIL) et écrits directement dans le tableau 4D préalloué.
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .store import allocate_4d, resolve_scratch_dir
+
+
+def default_workers():
+    """ Nombre de threads de lecture utilisé par défaut. """
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def _read_frame(load_data, path):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {path}")
+    start = time.perf_counter()
+    data = load_data(path)
+    return data, time.perf_counter() - start
+
+
+def load_frames(paths, max_workers=None, verbose=True, scratch_dir=None):
+    """
+    Charge les volumes 3D de `paths` dans un tableau 4D (T,Z,Y,X).
+
+    Paramètres :
+        paths : liste des chemins des volumes, dans l'ordre temporel
+        max_workers : nombre de threads de lecture (défaut : default_workers())
+        verbose : affiche le débit de lecture par volume
+        scratch_dir : si renseigné, la séquence est assemblée dans un memmap .npy de ce dossier
+
+    Retour :
+        data4D : np.ndarray (ou np.memmap) de forme (T,Z,Y,X) et du dtype du premier volume
+    """
+    from .resolver import astroca_function
+    load_data = astroca_function('tools.loadData.load_data')
+
+    from .preflight import check_inputs
+
+    paths = [str(path) for path in paths]
+    # Missing or inconsistent volumes are reported before any frame is decoded
+    check_inputs(paths, scratch_dir, max_workers, estimate=True)
+
+    start = time.perf_counter()
+    data, elapsed = _read_frame(load_data, paths[0])
+    if data.ndim != 3:
+        raise ValueError(f"Le volume {paths[0]} doit être 3D (Z,Y,X), mais a une forme {data.shape}.")
+
+    data4D = allocate_4d((len(paths),) + data.shape, data.dtype, scratch_dir)
+    data4D[0] = data  # Initialize the first time frame
+    frame_times = [elapsed]
+
+    def read_into(t):
+        frame, frame_time = _read_frame(load_data, paths[t])
+        if frame.shape != data4D.shape[1:]:
+            raise ValueError(f"Le volume {paths[t]} a une forme {frame.shape}, "
+                             f"attendu {data4D.shape[1:]}.")
+        data4D[t] = frame
+        return frame_time
+
+    # Each worker writes its own time slice, so no locking is needed
+    if len(paths) > 1:
+        workers = max_workers or default_workers()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            frame_times.extend(executor.map(read_into, range(1, len(paths))))
+
+    if verbose:
+        report_throughput(frame_times, data4D[0].nbytes, time.perf_counter() - start)
+    return data4D
+
+
+def iter_frames(paths, max_workers=None, prefetch=None):
+    """
+    Itère sur les volumes 3D de `paths` dans l'ordre, en lisant les suivants en arrière-plan.
+
+    Paramètres :
+        paths : liste des chemins des volumes, dans l'ordre temporel
+        max_workers : nombre de threads de lecture (défaut : default_workers())
+        prefetch : nombre maximal de volumes lus d'avance (défaut : 2 par thread)
+
+    Retour :
+        générateur de np.ndarray (Z,Y,X) ; au plus `prefetch` volumes sont en mémoire
+    """
+    from .resolver import astroca_function
+    load_data = astroca_function('tools.loadData.load_data')
+
+    paths = [str(path) for path in paths]
+    workers = max_workers or default_workers()
+    prefetch = max(1, prefetch or 2 * workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        next_t = 0
+        for _ in range(len(paths)):
+            while next_t < len(paths) and len(pending) < prefetch:
+                pending.append(executor.submit(_read_frame, load_data, paths[next_t]))
+                next_t += 1
+            frame, _ = pending.popleft().result()
+            yield frame
+
+
+def read_stack(argsList, attribute='input_image', max_workers=None, verbose=True):
+    """
+    Charge en 4D les volumes référencés par l'attribut `attribute` de chaque élément de argsList.
+
+    La séquence est stockée sur disque si l'outil reçoit un `scratch_dir` (ou si
+    ASTROCA_SCRATCH_DIR est défini), en mémoire sinon. Un unique fichier contenant
+    une pile 4D (voir stacks.export_stack), une séquence creuse .npz (voir
+    sparse.save_sparse_4d), une séquence en bande .band.npz (voir band.BandPackedArray)
+    ou des événements stockés par plages .events.npz (voir spans.EventSpans) est lu directement.
+    """
+    from .band import BandPackedArray, is_band
+    from .sparse import is_sparse, load_sparse_4d
+    from .spans import EventSpans, is_spans
+    from .stacks import is_stack, load_stack
+
+    scratch_dir = resolve_scratch_dir(argsList[0]) if len(argsList) > 0 else None
+    if len(argsList) == 1:
+        path = getattr(argsList[0], attribute)
+        if is_band(path):
+            return BandPackedArray.load(path).to_dense(scratch_dir)
+        if is_spans(path):
+            return EventSpans.load(path).to_dense(scratch_dir)
+        if is_sparse(path):
+            return load_sparse_4d(path, scratch_dir)
+        if is_stack(path):
+            return load_stack(path, scratch_dir)
+    return load_frames([getattr(arg, attribute) for arg in argsList], max_workers, verbose, scratch_dir)
+
+
+def report_throughput(frame_times, frame_nbytes, wall_time):
+    """ Affiche le débit de lecture (volumes/s, Mo/s) et le temps médian par volume. """
+    n_frames = len(frame_times)
+    wall_time = max(wall_time, 1e-9)
+    median_ms = float(np.median(frame_times)) * 1e3
+    mb_per_s = n_frames * frame_nbytes / wall_time / 1e6
+    print(f"Lecture de {n_frames} volumes en {wall_time:.2f} s : "
+          f"{n_frames / wall_time:.1f} volumes/s, {mb_per_s:.1f} Mo/s "
+          f"(médiane {median_ms:.1f} ms/volume)")
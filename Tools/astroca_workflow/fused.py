@@ -0,0 +1,113 @@
+"""
+Stabilisation d'Anscombe → image dynamique (ΔF) → Z-score enchaînés volume par volume.
+
+Les outils Anscombe, Dynamic_Image et Zscore parcourent chacun toute la séquence 4D et allouent
+chacun une sortie flottante de la taille de la séquence. Ici, les trois fonctions astroca sont
+appliquées l'une après l'autre à un seul volume : les intermédiaires (volume stabilisé, ΔF)
+n'existent qu'à l'échelle d'un volume, et seuls le Z-score (et, sur demande, ΔF) sont écrits
+dans des sorties 4D.
+
+Cet enchaînement suppose des transformations sans dépendance temporelle, avec un seul volume F0.
+Il est vérifié sur le volume central contre la chaîne en trois étapes appliquée à un bloc de
+volumes consécutifs, à la tolérance FUSED_RTOL / FUSED_ATOL près (Z-score et ΔF flottants ;
+les masques booléens ou entiers doivent être identiques).
+"""
+import numpy as np
+
+FUSED_FUNCTIONS = (
+    'varianceStabilization.varianceStabilization.compute_variance_stabilization',
+    'dynamicImage.dynamicImage.compute_dynamic_image',
+    'activeVoxels.zScore.compute_z_score',
+)
+
+# Tolerance between the fused and the three-stage results (float32 round-off of the chain)
+FUSED_RTOL = 1e-5
+FUSED_ATOL = 1e-6
+
+_PARAMS = {'files': {'save_results': 0}, 'paths': {'output_dir': None}}
+
+
+def _close(a, b):
+    a, b = np.asarray(a), np.asarray(b)
+    if a.shape != b.shape:
+        return False
+    if not np.issubdtype(a.dtype, np.floating) and not np.issubdtype(b.dtype, np.floating):
+        return np.array_equal(a, b)
+    return np.allclose(a, b, rtol=FUSED_RTOL, atol=FUSED_ATOL, equal_nan=True)
+
+
+def _chain(block, F0, index_xmin, index_xmax, std_noise, mean_noise, threshold):
+    """ Chaîne en trois étapes des outils Anscombe, Dynamic_Image et Zscore sur un bloc 4D. """
+    from .resolver import astroca_functions
+
+    compute_variance_stabilization, compute_dynamic_image, compute_z_score = astroca_functions(*FUSED_FUNCTIONS)
+    stabilized = compute_variance_stabilization(block, index_xmin, index_xmax, _PARAMS)
+    dF, _ = compute_dynamic_image(stabilized, F0, index_xmin, index_xmax, block.shape[0], _PARAMS)
+    del stabilized
+    zscore = compute_z_score(dF, std_noise, mean_noise, threshold, index_xmin, index_xmax)
+    return zscore, dF
+
+
+def fused_frame(frame, F0, index_xmin, index_xmax, std_noise, mean_noise, threshold):
+    """
+    Z-score et ΔF d'un volume (Z,Y,X), sans intermédiaire 4D.
+
+    Retour :
+        (Z-score (Z,Y,X), ΔF (Z,Y,X))
+    """
+    zscore, dF = _chain(np.asarray(frame)[np.newaxis, ...], F0, index_xmin, index_xmax,
+                        std_noise, mean_noise, threshold)
+    return zscore[0], dF[0]
+
+
+def fused_zscore(data4D, F0, index_xmin, index_xmax, std_noise, mean_noise, threshold,
+                 keep_dynamic=False, scratch_dir=None):
+    """
+    Équivalent des outils Anscombe → Dynamic_Image → Zscore, calculé volume par volume.
+
+    Paramètres :
+        data4D : séquence brute (T,Z,Y,X) recadrée, en mémoire ou np.memmap
+        F0 : fond estimé (1,Z,Y,X)
+        index_xmin, index_xmax : bornes par Z
+        std_noise, mean_noise, threshold : paramètres du Z-score
+        keep_dynamic : retourne aussi ΔF
+        scratch_dir : dossier des memmap de sortie (voir store.allocate_4d), None pour la mémoire
+
+    Retour :
+        (Z-score (T,Z,Y,X), ΔF (T,Z,Y,X) ou None) ; None si l'enchaînement diffère de la chaîne
+        en trois étapes sur le volume central (celle-ci doit alors être utilisée)
+    """
+    from .store import allocate_4d
+
+    if F0.shape[0] != 1:
+        print(f"Z-score fusionné : {F0.shape[0]} volumes F0, seul le cas d'un volume est enchaîné.")
+        return None
+
+    # The middle frame, computed both ways, gives the output dtypes and checks the per-frame chain
+    T = data4D.shape[0]
+    probe = T // 2
+    start, stop = max(0, probe - 1), min(T, probe + 2)
+    reference_z, reference_dF = _chain(np.asarray(data4D[start:stop]), F0, index_xmin, index_xmax,
+                                       std_noise, mean_noise, threshold)
+    probe_z, probe_dF = fused_frame(data4D[probe], F0, index_xmin, index_xmax, std_noise, mean_noise, threshold)
+    if not (_close(probe_z, reference_z[probe - start]) and _close(probe_dF, reference_dF[probe - start])):
+        print("Z-score fusionné : résultat différent de la chaîne en trois étapes, celle-ci est utilisée.")
+        return None
+    del reference_z, reference_dF
+
+    zscore = allocate_4d(data4D.shape, probe_z.dtype, scratch_dir)
+    dF = allocate_4d(data4D.shape, probe_dF.dtype, scratch_dir) if keep_dynamic else None
+    for t in range(T):
+        if t == probe:
+            frame_z, frame_dF = probe_z, probe_dF
+        else:
+            frame_z, frame_dF = fused_frame(data4D[t], F0, index_xmin, index_xmax, std_noise, mean_noise, threshold)
+        zscore[t] = frame_z
+        if dF is not None:
+            dF[t] = frame_dF
+    return zscore, dF
+
+
+def chained_zscore(data4D, F0, index_xmin, index_xmax, std_noise, mean_noise, threshold):
+    """ Chaîne en trois étapes sur toute la séquence : (Z-score, ΔF). """
+    return _chain(data4D, F0, index_xmin, index_xmax, std_noise, mean_noise, threshold)
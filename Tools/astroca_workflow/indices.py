@@ -0,0 +1,71 @@
+"""
+Chargement unique des bornes index_xmin / index_xmax produites par BoundariesComputation.
+
+BioImageIT transmet aux outils suivants des chemins de la forme `.../index_xmin0.npy`, alors que
+BoundariesComputation écrit `.../index_xmin.npy`. Les chemins sont résolus ici une fois pour
+toutes, et les tableaux sont ouverts en memmap lecture seule et mis en cache pour la durée du
+processus : toutes les étapes exécutées dans un même processus (pipeline, lots) partagent la
+même copie, et les processus d'un pool partagent les pages du fichier.
+
+Les bornes sont chargées avant toute séquence 4D, de sorte qu'un chemin mal résolu échoue
+immédiatement.
+"""
+import os
+from functools import lru_cache
+
+import numpy as np
+
+# Suffix appended by BioImageIT to the index paths it passes to the tools
+FRAME_SUFFIX = '0.npy'
+
+
+def resolve_index_path(path, name='index'):
+    """
+    Chemin canonique (absolu, liens résolus) d'un fichier de bornes.
+
+    Le chemin sans le suffixe `0` ajouté par BioImageIT est prioritaire, comme historiquement ;
+    le chemin reçu est utilisé s'il est le seul à exister.
+    """
+    path = str(path)
+    candidates = [path]
+    if path.endswith(FRAME_SUFFIX):
+        candidates.insert(0, path[:-len(FRAME_SUFFIX)] + '.npy')
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return os.path.realpath(candidate)
+    raise FileNotFoundError(f"Le fichier {name} est introuvable : {' ou '.join(candidates)}")
+
+
+@lru_cache(maxsize=None)
+def _load(path, mtime_ns, size):
+    # The file identity is part of the key so that a rewritten index is reloaded
+    return np.load(path, mmap_mode='r')
+
+
+def load_index(path, name='index'):
+    """ Bornes d'un fichier .npy, en memmap lecture seule, mises en cache par fichier. """
+    path = resolve_index_path(path, name)
+    stat = os.stat(path)
+    return _load(path, stat.st_mtime_ns, stat.st_size)
+
+
+def load_indices(xmin_path, xmax_path):
+    """
+    Résout et charge une paire de bornes, en vérifiant qu'elles sont cohérentes.
+
+    Retour :
+        (chemin xmin, chemin xmax, index_xmin, index_xmax)
+    """
+    xmin_path = resolve_index_path(xmin_path, 'index_xmin')
+    xmax_path = resolve_index_path(xmax_path, 'index_xmax')
+    index_xmin = load_index(xmin_path, 'index_xmin')
+    index_xmax = load_index(xmax_path, 'index_xmax')
+    if index_xmin.ndim != 1 or index_xmin.shape != index_xmax.shape:
+        raise ValueError(f"Bornes incohérentes : index_xmin {index_xmin.shape} ({xmin_path}), "
+                         f"index_xmax {index_xmax.shape} ({xmax_path}) ; une valeur par Z est attendue.")
+    return xmin_path, xmax_path, index_xmin, index_xmax
+
+
+def load_tool_indices(arg):
+    """ load_indices appliqué aux attributs index_xmin / index_xmax d'un argument d'outil. """
+    return load_indices(arg.index_xmin, arg.index_xmax)
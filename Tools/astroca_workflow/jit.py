@@ -0,0 +1,215 @@
+"""
+Cache disque persistant des noyaux numba d'astroca et mesure du temps de compilation.
+
+Chaque outil BioImageIT est un processus neuf : sans cache, les noyaux @njit de voxels_finder,
+unified_median_filter_3d, detect_calcium_events_opti et background_estimation_single_block sont
+recompilés à chaque lancement. enable_jit_cache() est appelé par le resolver avant le premier
+import d'astroca et fait de cache=True la valeur par défaut de numba.njit / numba.jit ; les noyaux
+compilés sont écrits dans NUMBA_CACHE_DIR (par défaut ~/.cache/astroca/numba), ce qui évite
+d'écrire dans le dossier d'installation d'astroca.
+
+Préchauffage du cache (une fois par environnement et par type de données) :
+    python -m astroca_workflow.jit --dtype float32
+"""
+import argparse
+import functools
+import importlib.abc
+import importlib.util
+import inspect
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+JIT_CACHE_ENV = 'ASTROCA_NUMBA_CACHE'
+NUMBA_CACHE_DIR_ENV = 'NUMBA_CACHE_DIR'
+
+_state = {'enabled': False, 'compile_listener': None}
+_dispatchers = []
+
+
+def default_cache_dir():
+    """ Dossier du cache numba : NUMBA_CACHE_DIR, sinon <XDG_CACHE_HOME>/astroca/numba. """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.environ.get(NUMBA_CACHE_DIR_ENV) or os.path.join(base, 'astroca', 'numba')
+
+
+def _register(dispatcher):
+    if hasattr(dispatcher, 'stats'):
+        _dispatchers.append(dispatcher)
+    return dispatcher
+
+
+def _caching(decorator):
+    """ Variante de numba.njit / numba.jit avec cache=True par défaut, qui recense les noyaux créés. """
+    def decorate(build, **kwargs):
+        if 'cache' in kwargs:
+            return _register(build(**kwargs))
+        try:
+            return _register(build(cache=True, **kwargs))
+        except RuntimeError:
+            # Function without a cache locator (defined interactively or in exec'd code)
+            return _register(build(**kwargs))
+
+    @functools.wraps(decorator)
+    def wrapper(*args, **kwargs):
+        if args and inspect.isfunction(args[0]):
+            # @njit without arguments, or a direct call such as njit(func, parallel=True)
+            return decorate(lambda **options: decorator(*args, **options), **kwargs)
+        return lambda func: decorate(lambda **options: decorator(*args, **options)(func), **kwargs)
+    wrapper.__wrapped_by_astroca__ = True
+    return wrapper
+
+
+def _patch_numba(numba):
+    for name in ('njit', 'jit'):
+        decorator = getattr(numba, name)
+        if not getattr(decorator, '__wrapped_by_astroca__', False):
+            setattr(numba, name, _caching(decorator))
+    try:
+        from numba.core import event
+        listener = event.TimingListener()
+        event.register('numba:compile', listener)
+        _state['compile_listener'] = listener
+    except (ImportError, AttributeError):
+        # numba < 0.55: no compilation events, only cache hit/miss counts are reported
+        pass
+
+
+class _PatchOnImport(importlib.abc.MetaPathFinder):
+    """ Modifie numba dès son import, avant que les modules astroca ne décorent leurs noyaux. """
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname != 'numba':
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(fullname)
+        exec_module = spec.loader.exec_module
+
+        def exec_and_patch(module):
+            exec_module(module)
+            _patch_numba(module)
+        spec.loader.exec_module = exec_and_patch
+        return spec
+
+
+def enable_jit_cache():
+    """
+    Active le cache disque des noyaux numba pour les modules astroca importés ensuite.
+
+    numba n'est pas importé ici : il est modifié au moment où un module astroca l'importe,
+    de sorte que les outils sans noyau numba ne paient pas son import.
+    Sans effet si numba n'est pas installé ou si ASTROCA_NUMBA_CACHE vaut 0.
+
+    Retour :
+        True si le cache est actif
+    """
+    if _state['enabled']:
+        return True
+    if os.environ.get(JIT_CACHE_ENV, '1').strip().lower() in ('0', 'false', 'no'):
+        return False
+    if 'numba' not in sys.modules and importlib.util.find_spec('numba') is None:
+        return False
+
+    cache_dir = default_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ[NUMBA_CACHE_DIR_ENV] = cache_dir
+    if 'numba' in sys.modules:
+        numba = sys.modules['numba']
+        numba.core.config.reload_config()
+        _patch_numba(numba)
+    else:
+        sys.meta_path.insert(0, _PatchOnImport())
+    _state['enabled'] = True
+    return True
+
+
+def compile_seconds():
+    """ Temps total passé à compiler des noyaux numba dans ce processus (hors chargement du cache). """
+    listener = _state['compile_listener']
+    return listener.duration if listener is not None and listener.done else 0.0
+
+
+def cache_counts():
+    """ (signatures chargées depuis le cache disque, signatures compilées) pour les noyaux recensés. """
+    hits = misses = 0
+    for dispatcher in _dispatchers:
+        stats = dispatcher.stats
+        hits += sum(stats.cache_hits.values())
+        misses += sum(stats.cache_misses.values())
+    return hits, misses
+
+
+@contextmanager
+def kernel_timing(tool_name=None):
+    """
+    Mesure le bloc exécuté et affiche la part de compilation numba et la part de calcul.
+
+    Les compilations effectuées dans des processus fils (pool de tiling.map_blocks) ne sont pas comptées.
+    """
+    compile_start = compile_seconds()
+    hits_start, misses_start = cache_counts()
+    start = time.perf_counter()
+    timing = {}
+    try:
+        yield timing
+    finally:
+        wall = time.perf_counter() - start
+        timing['compile'] = compile_seconds() - compile_start
+        timing['compute'] = wall - timing['compile']
+        hits, misses = cache_counts()
+        label = f"{tool_name} : " if tool_name else ''
+        cache_state = (f"cache : {hits - hits_start} noyaux chargés, {misses - misses_start} compilés"
+                       if _state['enabled'] else 'cache numba désactivé')
+        print(f"{label}calcul {timing['compute']:.2f} s, compilation numba {timing['compile']:.2f} s ({cache_state})")
+
+
+def warmup(dtype='float32', shape=(6, 3, 16, 24)):
+    """
+    Compile (ou charge) les noyaux des étapes numba sur une petite séquence synthétique,
+    afin que le premier lancement réel des outils trouve le cache rempli.
+
+    Les signatures dépendant du type des données, le préchauffage doit utiliser le dtype des séquences traitées.
+    """
+    import numpy as np
+
+    from .pipeline import DEFAULT_PARAMETERS, stage_params
+    from .resolver import astroca_functions
+
+    enable_jit_cache()
+    (background_estimation_single_block, unified_median_filter_3d, voxels_finder,
+     detect_calcium_events_opti) = astroca_functions(
+        'dynamicImage.dynamicImage.background_estimation_single_block',
+        'activeVoxels.medianFilter.unified_median_filter_3d',
+        'activeVoxels.activeVoxelsFinder.voxels_finder',
+        'events.eventDetectorCorrected.detect_calcium_events_opti',
+    )
+
+    rng = np.random.default_rng(0)
+    data4D = (rng.random(shape) * 100).astype(dtype)
+    index_xmin = np.zeros(shape[1], dtype=int)
+    index_xmax = np.full(shape[1], shape[3] - 1, dtype=int)
+    median = DEFAULT_PARAMETERS['median_filter']
+
+    with kernel_timing('préchauffage'):
+        background_estimation_single_block(
+            data4D, index_xmin, index_xmax,
+            stage_params('background_estimation', DEFAULT_PARAMETERS['background_estimation']))
+        filtered = unified_median_filter_3d((data4D > 50).astype(dtype), median['radius'], median['border_mode'])
+        active = voxels_finder(filtered, data4D, DEFAULT_PARAMETERS['active_voxels']['std_noise'],
+                               index_xmin, index_xmax)
+        detect_calcium_events_opti(
+            active, stage_params('events_extraction', DEFAULT_PARAMETERS['events_extraction']))
+    print(f"Cache numba : {default_cache_dir()}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dtype', nargs='+', default=['float32'], help='Types des séquences à préchauffer')
+    args = parser.parse_args(argv)
+    for dtype in args.dtype:
+        warmup(dtype)
+
+
+if __name__ == '__main__':
+    main()
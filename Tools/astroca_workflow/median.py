@@ -0,0 +1,298 @@
+"""
+Filtre médian 3D (unified_median_filter_3d) appliqué en parallèle sur les volumes d'une séquence.
+
+Le filtre est purement spatial : chaque volume (Z,Y,X) est filtré indépendamment des autres.
+Les volumes sont répartis entre processus (tiling.map_blocks_into), qui écrivent directement
+dans la sortie partagée.
+
+Chemin rapide (optionnel) pour les petits rayons et le mode de bord 'ignore' : noyau numba
+(median_filter_ignore) qui trie par insertion le voisinage sphérique de chaque voxel, limité aux
+voisins situés dans le volume, ou qui compte les uns pour un masque binaire. Sur un volume
+30×256×256 et un seul cœur : 0.37 s pour des valeurs seuillées à 80 % nulles
+(scipy.ndimage.median_filter : 0.40 s) et 0.08 s pour un masque binaire (scipy : 0.42 s) ; le
+noyau est parallèle sur Z (voir benchmarks/bench_median.py --kernel-only).
+
+Les conventions exactes de la fonction astroca (médiane d'un nombre pair de voisins, forme de la
+sphère) ne sont pas reproduites par construction. Le chemin rapide n'est donc retenu que s'il est
+identique au bit près au calcul de référence sur le volume central et sur deux volumes
+synthétiques aléatoires (masque binaire à moitié plein et valeurs continues) : leurs bords
+présentent tous les nombres de voisins, pairs compris, là où un volume central vide ou clairsemé
+coïnciderait trivialement. Cette vérification ne prouve pas l'identité sur tous les volumes ;
+elle écarte le chemin rapide dès que les conventions de médiane ou de sphère diffèrent. Les
+volumes synthétiques ne sont filtrés qu'une fois par processus pour un rayon, un mode de bord et
+un type donnés.
+"""
+import importlib.util
+import math
+from functools import lru_cache
+
+import numpy as np
+
+from .tiling import map_blocks_into
+
+# Largest radius served by the fast path: beyond it the stacked neighbourhood no longer pays off
+FAST_MAX_RADIUS = 2.5
+# Largest (Z,Y,X) of the synthetic volumes checking the fast path
+PROBE_SHAPE = (6, 24, 24)
+
+
+def _reference(data4D, radius, border_mode):
+    from .resolver import astroca_function
+    unified_median_filter_3d = astroca_function('activeVoxels.medianFilter.unified_median_filter_3d')
+
+    return unified_median_filter_3d(data4D, radius, border_mode)
+
+
+def sphere_offsets(radius):
+    """ Décalages (dz,dy,dx) de l'élément structurant sphérique de rayon `radius`. """
+    r = int(math.floor(radius))
+    grid = np.arange(-r, r + 1)
+    dz, dy, dx = np.meshgrid(grid, grid, grid, indexing='ij')
+    inside = dz ** 2 + dy ** 2 + dx ** 2 <= radius ** 2
+    return np.stack([dz[inside], dy[inside], dx[inside]], axis=1)
+
+
+@lru_cache(maxsize=None)
+def _kernel():
+    """ Noyaux numba de la médiane sphérique, compilés au premier appel (cache disque de numba). """
+    import numba
+
+    @numba.njit(inline='always')
+    def insert(window, count, value):
+        i = count
+        while i > 0 and window[i - 1] > value:
+            window[i] = window[i - 1]
+            i -= 1
+        window[i] = value
+
+    @numba.njit(inline='always')
+    def ranked(window, negatives, zeros, i):
+        # i-th smallest neighbour: sorted non-zero values with `zeros` zeros after the negatives
+        if i < negatives:
+            return window[i]
+        if i < negatives + zeros:
+            return 0.0
+        return window[i - zeros]
+
+    @numba.njit(inline='always')
+    def median_of(window, nonzero, zeros):
+        count = nonzero + zeros
+        if count == 0:
+            return np.nan
+        negatives = 0
+        while negatives < nonzero and window[negatives] < 0:
+            negatives += 1
+        if count % 2 == 1:
+            return ranked(window, negatives, zeros, count // 2)
+        return 0.5 * (ranked(window, negatives, zeros, count // 2 - 1) + ranked(window, negatives, zeros, count // 2))
+
+    @numba.njit(parallel=True, cache=True)
+    def median_ignore_kernel(flat, shape, offsets, reach, out):
+        Z, Y, X = shape[0], shape[1], shape[2]
+        n = offsets.shape[0]
+        # Interior voxels read their neighbours at fixed offsets in the flattened volume
+        linear = offsets[:, 0] * (Y * X) + offsets[:, 1] * X + offsets[:, 2]
+        for z in numba.prange(Z):
+            # Non-zero neighbours kept sorted by insertion while they are read; zeros (most
+            # voxels of thresholded data) are only counted
+            window = np.empty(n, dtype=np.float64)
+            inner_z = reach <= z < Z - reach
+            for y in range(Y):
+                inner_zy = inner_z and reach <= y < Y - reach
+                row = (z * Y + y) * X
+                for x in range(X):
+                    count = 0
+                    zeros = 0
+                    if inner_zy and reach <= x < X - reach:
+                        base = row + x
+                        for k in range(n):
+                            value = np.float64(flat[base + linear[k]])
+                            if value == 0:
+                                zeros += 1
+                            elif value == value:
+                                insert(window, count, value)
+                                count += 1
+                    else:
+                        for k in range(n):
+                            zz = z + offsets[k, 0]
+                            yy = y + offsets[k, 1]
+                            xx = x + offsets[k, 2]
+                            if zz < 0 or zz >= Z or yy < 0 or yy >= Y or xx < 0 or xx >= X:
+                                continue
+                            value = np.float64(flat[(zz * Y + yy) * X + xx])
+                            if value == 0:
+                                zeros += 1
+                            elif value == value:
+                                insert(window, count, value)
+                                count += 1
+                    out[row + x] = median_of(window, count, zeros)
+        return out
+
+    @numba.njit(parallel=True, cache=True)
+    def majority_ignore_kernel(flat, shape, offsets, reach, out):
+        # Median of 0/1 values: the share of ones among the neighbours inside the volume decides
+        Z, Y, X = shape[0], shape[1], shape[2]
+        n = offsets.shape[0]
+        linear = offsets[:, 0] * (Y * X) + offsets[:, 1] * X + offsets[:, 2]
+        for z in numba.prange(Z):
+            inner_z = reach <= z < Z - reach
+            for y in range(Y):
+                inner_zy = inner_z and reach <= y < Y - reach
+                row = (z * Y + y) * X
+                for x in range(X):
+                    ones = 0
+                    count = n
+                    if inner_zy and reach <= x < X - reach:
+                        base = row + x
+                        for k in range(n):
+                            ones += flat[base + linear[k]]
+                    else:
+                        count = 0
+                        for k in range(n):
+                            zz = z + offsets[k, 0]
+                            yy = y + offsets[k, 1]
+                            xx = x + offsets[k, 2]
+                            if 0 <= zz < Z and 0 <= yy < Y and 0 <= xx < X:
+                                ones += flat[(zz * Y + yy) * X + xx]
+                                count += 1
+                    if 2 * ones > count:
+                        out[row + x] = 1.0
+                    elif 2 * ones == count:
+                        out[row + x] = 0.5
+                    else:
+                        out[row + x] = 0.0
+        return out
+
+    return median_ignore_kernel, majority_ignore_kernel
+
+
+def fast_kernel_available():
+    """ Indique si numba est disponible pour le noyau du chemin rapide. """
+    return importlib.util.find_spec('numba') is not None
+
+
+def median_filter_ignore(volume, radius, out_dtype=None):
+    """
+    Médiane sphérique d'un volume (Z,Y,X), les voisins hors du volume (et les NaN) étant ignorés.
+
+    Noyaux numba parallèles sur Z. Cas général : pour chaque voxel, les voisins non nuls (au plus
+    81 valeurs pour radius <= FAST_MAX_RADIUS) sont triés par insertion au fil de leur lecture,
+    les zéros étant seulement comptés. Masque
+    binaire (0/1) : la médiane se déduit du nombre de uns parmi les voisins, sans tri. La médiane
+    d'un nombre pair de voisins est la moyenne des deux valeurs centrales.
+
+    Paramètres :
+        volume : volume 3D
+        radius : rayon de la sphère (en voxels)
+        out_dtype : type de la sortie (défaut : celui de `volume`)
+
+    Retour :
+        np.ndarray (Z,Y,X)
+    """
+    offsets = np.ascontiguousarray(sphere_offsets(radius), dtype=np.int64)
+    reach = int(math.floor(radius))
+    volume = np.asarray(volume)
+    shape = np.asarray(volume.shape, dtype=np.int64)
+    out = np.empty(volume.size, dtype=np.float64)
+    median_kernel, majority_kernel = _kernel()
+    if volume.dtype == bool or np.array_equal(volume, volume.astype(bool)):
+        # Binary masks (output of Space_closing): counting replaces sorting
+        majority_kernel(np.ascontiguousarray(volume, dtype=np.uint8).reshape(-1), shape, offsets, reach, out)
+    else:
+        median_kernel(np.ascontiguousarray(volume).reshape(-1), shape, offsets, reach, out)
+    return out.reshape(volume.shape).astype(out_dtype or volume.dtype, copy=False)
+
+
+def _median_block(block, radius, border_mode, fast, out_dtype):
+    if not fast:
+        return _reference(block, radius, border_mode)
+    return np.stack([median_filter_ignore(volume, radius, out_dtype) for volume in block])
+
+
+def synthetic_probes(frame_shape, dtype, seed=0):
+    """
+    Volumes aléatoires vérifiant le chemin rapide : un masque binaire à moitié plein (les voisinages
+    de bord ont des nombres pairs de voisins, 0 et 1 à égalité) et des valeurs continues.
+    """
+    shape = tuple(min(n, p) for n, p in zip(frame_shape, PROBE_SHAPE))
+    rng = np.random.default_rng(seed)
+    mask = (rng.random(shape) < 0.5).astype(dtype)
+    values = (rng.random(shape) * 100).astype(dtype)
+    return [mask, values]
+
+
+# (radius, border_mode, dtype) -> the synthetic probes matched the reference, in this process
+_probe_results = {}
+
+
+def _probes_match(frame_shape, dtype, radius, border_mode):
+    """ Vérification sur synthetic_probes, faite une fois par processus et par paramètres. """
+    key = (float(radius), str(border_mode), np.dtype(dtype).str)
+    if key not in _probe_results:
+        _probe_results[key] = all(_fast_matches(volume, radius, border_mode)
+                                  for volume in synthetic_probes(frame_shape, dtype))
+    return _probe_results[key]
+
+
+def _fast_matches(volume, radius, border_mode):
+    reference = _reference(np.asarray(volume)[np.newaxis, ...], radius, border_mode)[0]
+    candidate = median_filter_ignore(np.asarray(volume), radius, reference.dtype)
+    return np.array_equal(candidate, reference, equal_nan=bool(np.issubdtype(reference.dtype, np.floating)))
+
+
+def fast_path_applies(radius, border_mode):
+    """ Indique si le chemin rapide peut remplacer unified_median_filter_3d pour ces paramètres. """
+    return border_mode == 'ignore' and 0 < radius <= FAST_MAX_RADIUS
+
+
+def median_filter_parallel(data4D, radius, border_mode, n_workers=1, fast=False, scratch_dir=None):
+    """
+    Équivalent de unified_median_filter_3d(data4D, radius, border_mode), calculé volume par volume
+    dans un pool de processus.
+
+    Paramètres :
+        data4D : séquence (T,Z,Y,X), en mémoire ou np.memmap
+        radius : rayon de l'élément structurant sphérique
+        border_mode : mode de gestion des bords
+        n_workers : nombre de processus ; 1 appelle directement la fonction astroca
+        fast : essaie le chemin rapide (mode 'ignore' et petit rayon), vérifié sur le volume central
+               et sur les volumes de synthetic_probes (voir le docstring du module)
+        scratch_dir : dossier du memmap de sortie (voir store.allocate_4d), None pour la mémoire
+
+    Retour :
+        np.ndarray (ou np.memmap) (T,Z,Y,X)
+    """
+    from .store import allocate_4d
+
+    if n_workers <= 1 and not fast:
+        return _reference(data4D, radius, border_mode)
+
+    # One volume is filtered here: it gives the output dtype, serves as reference for the
+    # fast path and compiles the numba kernels (disk cache) before the workers start. Once
+    # numba's thread pool runs here, map_blocks_into spawns the workers instead of forking
+    probe = data4D.shape[0] // 2
+    reference = _reference(np.asarray(data4D[probe:probe + 1]), radius, border_mode)
+    use_fast = False
+    if fast and fast_path_applies(radius, border_mode) and not fast_kernel_available():
+        print("Filtre médian : numba est indisponible, pas de chemin rapide.")
+    elif fast and fast_path_applies(radius, border_mode):
+        candidate = median_filter_ignore(np.asarray(data4D[probe]), radius, reference.dtype)
+        use_fast = np.array_equal(candidate, reference[0],
+                                  equal_nan=bool(np.issubdtype(reference.dtype, np.floating)))
+        # An empty or sparse central frame matches trivially: random volumes exercise the borders
+        use_fast = use_fast and _probes_match(data4D.shape[1:], data4D.dtype, radius, border_mode)
+        if not use_fast:
+            print("Filtre médian : le chemin rapide diffère du calcul de référence, il est désactivé.")
+    elif fast:
+        print(f"Filtre médian : pas de chemin rapide pour radius={radius}, border_mode='{border_mode}'.")
+
+    out = allocate_4d(data4D.shape, reference.dtype, scratch_dir)
+    args = (radius, border_mode, use_fast, reference.dtype)
+    if n_workers <= 1:
+        for t in range(data4D.shape[0]):
+            out[t] = _median_block(np.asarray(data4D[t:t + 1]), *args)[0]
+    else:
+        # Several blocks per worker balance the load when some volumes are slower to filter
+        map_blocks_into(_median_block, data4D, out, 0, n_workers,
+                        n_blocks=min(data4D.shape[0], 4 * n_workers), args=args)
+    return out
@@ -0,0 +1,301 @@
+"""
+Statistiques du bruit de l'image dynamique (ΔF), enregistrées par Dynamic_Image et relues par
+Zscore et AV_finder.
+
+Les statistiques sont accumulées dans la bande [xmin, xmax] de chaque Z, volume par volume, sans
+copie de la séquence. L'écart-type de toutes les valeurs (Welford / Chan, float64) est enregistré
+sous std_all. ΔF contient aussi le signal des événements calciques, qui le gonfle : std_noise
+n'est donc pas l'écart-type de Welford mais un écart-type robuste, 1.4826 × MAD (écart absolu
+médian) d'un échantillon de SAMPLE_SIZE valeurs de la bande, dont les valeurs à plus de
+CLIP_SIGMA écarts de la médiane (signal actif) sont écartées itérativement. Avec 10 % de voxels
+actifs bien séparés du bruit, l'estimation reste à quelques pour cent de l'écart-type du bruit
+seul ; un signal actif de l'ordre du bruit n'est pas séparable et biaise l'estimation vers le
+haut. mean_noise est la valeur retournée par compute_dynamic_image.
+
+Le fichier noise_stats.json est écrit à côté de la sortie de Dynamic_Image. Zscore, AV_finder et
+Fused_Zscore ne le lisent que sur demande (chemin noise_stats, ou use_noise_stats pour le chercher
+à côté de l'image d'entrée) : sinon, les valeurs saisies sont utilisées.
+"""
+import json
+import os
+
+import numpy as np
+
+NOISE_FILE = 'noise_stats.json'
+
+# Values kept for the median absolute deviation
+SAMPLE_SIZE = 1 << 18
+
+# Candidate values drawn from each update (one volume): the sample is refreshed once per volume
+SAMPLE_PER_UPDATE = 1 << 12
+
+# MAD to standard deviation of a normal distribution
+MAD_SCALE = 1.4826
+
+# Values further than CLIP_SIGMA robust deviations from the median are active signal, not noise
+CLIP_SIGMA = 3.0
+CLIP_ITERATIONS = 10
+
+
+class NoiseStats:
+    """
+    Moyenne et variance de toutes les valeurs (Welford / Chan) et échantillon des valeurs pour
+    l'écart-type robuste du bruit.
+
+    Chaque mise à jour (un volume) tire SAMPLE_PER_UPDATE valeurs candidates au hasard, pondérées
+    par le nombre de valeurs qu'elles représentent ; l'échantillon (SAMPLE_SIZE valeurs) est
+    renouvelé par échantillonnage pondéré à clés aléatoires (Efraimidis-Spirakis) lorsque les
+    candidates accumulées atteignent sa taille. Le coût par volume est celui d'une passe
+    Welford sur la bande, plus un tirage de taille fixe.
+    """
+
+    def __init__(self, sample_size=SAMPLE_SIZE, seed=0, per_update=SAMPLE_PER_UPDATE):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sample_size = int(sample_size)
+        self.per_update = int(per_update)
+        self._rng = np.random.default_rng(seed)
+        # Weighted bottom-k sampling: the candidates with the smallest keys form the sample
+        self._keys = np.empty(0)
+        self._sample = np.empty(0)
+        self._pending_keys = []
+        self._pending = []
+        self._n_pending = 0
+
+    def _accumulate(self, block):
+        """ Fusionne moyenne et somme des carrés des écarts des valeurs finies de `block` (Chan). """
+        block = np.asarray(block)
+        if np.issubdtype(block.dtype, np.floating):
+            finite = np.isfinite(block)
+            if not finite.all():
+                block = block[finite]
+        n = block.size
+        if n == 0:
+            return
+        mean = float(block.mean(dtype=np.float64))
+        m2 = float(block.var(dtype=np.float64)) * n
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+
+    def _add_candidates(self, values, n):
+        """ Candidates tirées parmi `n` valeurs : chacune en représente n / len(values). """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return
+        # Exponential keys scaled by the inverse weight: heavier candidates get smaller keys
+        self._pending_keys.append(self._rng.exponential(size=values.size) * (values.size / n))
+        self._pending.append(values)
+        self._n_pending += values.size
+        if self._n_pending >= self.sample_size:
+            self._merge()
+
+    def _merge(self):
+        if not self._pending:
+            return
+        keys = np.concatenate([self._keys] + self._pending_keys)
+        sample = np.concatenate([self._sample] + self._pending)
+        if sample.size > self.sample_size:
+            kept = np.argpartition(keys, self.sample_size)[:self.sample_size]
+            keys, sample = keys[kept], sample[kept]
+        self._keys, self._sample = keys, sample
+        self._pending_keys, self._pending, self._n_pending = [], [], 0
+
+    def update(self, values):
+        """ Ajoute les valeurs finies de `values`. """
+        values = np.asarray(values).reshape(-1)
+        self._accumulate(values)
+        n = values.size
+        if n > self.per_update:
+            values = values[self._rng.integers(0, n, self.per_update)]
+        self._add_candidates(values, n)
+
+    def update_band(self, frame, index_xmin, index_xmax):
+        """ Ajoute les voxels d'un volume (Z,Y,X) compris dans la bande [xmin, xmax] de chaque Z. """
+        frame = np.asarray(frame)
+        xmin = np.clip(np.asarray(index_xmin, dtype=np.int64), 0, frame.shape[2])
+        xmax = np.clip(np.asarray(index_xmax, dtype=np.int64), -1, frame.shape[2] - 1)
+        widths = np.maximum(0, xmax - xmin + 1)
+        for z in np.flatnonzero(widths):
+            self._accumulate(frame[z, :, xmin[z]:xmax[z] + 1])
+        # Candidates drawn over the whole band of the volume, in a single fixed-size draw
+        sizes = widths * frame.shape[1]
+        n = int(sizes.sum())
+        if n == 0:
+            return
+        starts = np.concatenate([[0], np.cumsum(sizes)])
+        flat = self._rng.integers(0, n, min(n, self.per_update))
+        z = np.searchsorted(starts, flat, side='right') - 1
+        local = flat - starts[z]
+        self._add_candidates(frame[z, local // widths[z], xmin[z] + local % widths[z]], n)
+
+    def robust(self):
+        """
+        (médiane, MAD) du bruit : les valeurs à plus de CLIP_SIGMA écarts robustes de la médiane
+        (signal actif) sont écartées itérativement avant le calcul.
+        """
+        self._merge()
+        kept = self._sample
+        if kept.size == 0:
+            return 0.0, 0.0
+        for _ in range(CLIP_ITERATIONS):
+            median = float(np.median(kept))
+            mad = float(np.median(np.abs(kept - median)))
+            inside = np.abs(kept - median) <= CLIP_SIGMA * MAD_SCALE * mad
+            if mad == 0 or inside.all():
+                break
+            kept = kept[inside]
+        return median, mad
+
+    @property
+    def median(self):
+        """ Médiane du bruit (valeurs actives écartées). """
+        return self.robust()[0]
+
+    @property
+    def mad(self):
+        """ Écart absolu médian du bruit (valeurs actives écartées). """
+        return self.robust()[1]
+
+    @property
+    def std(self):
+        """ Écart-type robuste du bruit : MAD_SCALE × MAD, une fois le signal actif écarté. """
+        return MAD_SCALE * self.mad
+
+    @property
+    def std_all(self):
+        """ Écart-type (non biaisé) de toutes les valeurs reçues, signal compris (Welford). """
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else 0.0
+
+    @classmethod
+    def from_sequence(cls, data4D, index_xmin, index_xmax):
+        stats = cls()
+        for t in range(data4D.shape[0]):
+            stats.update_band(np.asarray(data4D[t]), index_xmin, index_xmax)
+        return stats
+
+
+class ObservedSequence:
+    """
+    Séquence 4D dont chaque volume lu (seq[t]) est ajouté une fois aux statistiques du bruit :
+    l'écriture de la sortie alimente les statistiques, sans second parcours de la séquence.
+
+    Paramètres :
+        data4D : séquence (T,Z,Y,X)
+        index_xmin, index_xmax : bande [xmin, xmax] de chaque Z
+        stats : NoiseStats alimenté (nouveau par défaut)
+    """
+
+    def __init__(self, data4D, index_xmin, index_xmax, stats=None):
+        self.data4D = data4D
+        self.index_xmin = index_xmin
+        self.index_xmax = index_xmax
+        self.stats = NoiseStats() if stats is None else stats
+        self.seen = np.zeros(data4D.shape[0], dtype=bool)
+
+    @property
+    def shape(self):
+        return self.data4D.shape
+
+    @property
+    def dtype(self):
+        return self.data4D.dtype
+
+    @property
+    def ndim(self):
+        return self.data4D.ndim
+
+    def __len__(self):
+        return self.data4D.shape[0]
+
+    def __getitem__(self, t):
+        if not isinstance(t, (int, np.integer)):
+            raise TypeError("Une ObservedSequence s'indexe par instant : seq[t].")
+        frame = np.asarray(self.data4D[t])
+        if not self.seen[t]:
+            self.seen[t] = True
+            self.stats.update_band(frame, self.index_xmin, self.index_xmax)
+        return frame
+
+    def finish(self):
+        """ Ajoute les volumes qui n'ont pas été lus ; retour : les statistiques. """
+        for t in np.flatnonzero(~self.seen):
+            self[int(t)]
+        return self.stats
+
+
+def noise_path(output_image):
+    """ Chemin du fichier de statistiques à côté de la sortie `output_image`. """
+    return os.path.join(os.path.dirname(str(output_image)), NOISE_FILE)
+
+
+def save_noise(path, mean_noise, stats):
+    """
+    Écrit les statistiques du bruit.
+
+    Retour :
+        liste contenant le chemin écrit
+    """
+    path = str(path)
+    record = {
+        'mean_noise': float(mean_noise),
+        'std_noise': stats.std,
+        'median': stats.median,
+        'mad': stats.mad,
+        'std_all': stats.std_all,
+        'band_mean': stats.mean,
+        'band_m2': stats.m2,
+        'count': int(stats.count),
+    }
+    with open(path, 'w') as f:
+        json.dump(record, f, indent=2)
+    print(f"Bruit : mean_noise={record['mean_noise']:.6g}, std_noise={record['std_noise']:.6g} "
+          f"({stats.count} voxels) -> {path}")
+    return [path]
+
+
+def find_noise(arg, image_attribute, path_attribute='noise_stats'):
+    """
+    Fichier de statistiques à utiliser par un outil, ou None.
+
+    Le fichier n'est lu que sur demande : le chemin `noise_stats` de l'argument, ou, avec l'option
+    `use_noise_stats`, noise_stats.json dans le dossier de l'image `image_attribute` (la sortie de
+    Dynamic_Image). Sans l'un ni l'autre, les valeurs saisies sont utilisées.
+    """
+    from .options import tool_flag
+
+    path = getattr(arg, path_attribute, None)
+    if path is not None and str(path).strip() not in ('', 'None'):
+        if not os.path.isfile(str(path)):
+            raise FileNotFoundError(f"Le fichier de statistiques du bruit est introuvable : {path}")
+        return str(path)
+    if image_attribute is None or not tool_flag(arg, 'use_noise_stats'):
+        return None
+    candidate = noise_path(getattr(arg, image_attribute))
+    if not os.path.isfile(candidate):
+        raise FileNotFoundError(f"use_noise_stats : {NOISE_FILE} est introuvable à côté de l'image d'entrée ({candidate})")
+    return candidate
+
+
+def resolve_noise(arg, image_attribute, std_noise, mean_noise=None):
+    """
+    Valeurs du bruit à utiliser : celles du fichier demandé (voir find_noise), sinon celles saisies.
+
+    Retour :
+        (std_noise, mean_noise, chemin du fichier ou None)
+    """
+    path = find_noise(arg, image_attribute)
+    if path is None:
+        return std_noise, mean_noise, None
+    with open(path) as f:
+        record = json.load(f)
+    std_noise = float(record['std_noise'])
+    if mean_noise is not None:
+        mean_noise = float(record['mean_noise'])
+    print(f"Bruit lu dans {path} (remplace les valeurs saisies) : std_noise={std_noise:.6g}"
+          + (f", mean_noise={mean_noise:.6g}" if mean_noise is not None else ""))
+    return std_noise, mean_noise, path
@@ -0,0 +1,534 @@
+"""
+Traitement en ligne : les volumes sont traités au fur et à mesure de leur écriture par le
+microscope dans le dossier d'acquisition.
+
+Chaque nouveau volume passe par le recadrage, les bornes, la stabilisation d'Anscombe, l'image
+dynamique, le Z-score, la fermeture spatiale, le filtre médian et la recherche des voxels actifs,
+étapes sans dépendance temporelle : la latence par volume est celle d'un seul volume.
+
+F0 et le bruit dépendent de la séquence. Ils sont lus (--background, --noise-stats) ou estimés
+sur les --warmup premiers volumes, traités ensemble par les fonctions astroca comme dans
+pipeline.run_pipeline ; les volumes suivants utilisent ces valeurs.
+
+Les événements sont détectés par fenêtres de --window volumes précédées de --overlap volumes de
+contexte, raccordées comme dans events.detect_events_tiled. Un événement est émis (ligne de
+events.jsonl) dès qu'il n'a plus de voxel dans les --overlap derniers volumes : aucune fenêtre
+suivante ne peut plus le prolonger.
+
+Le débit et la latence par volume (écriture du fichier → voxels actifs calculés) sont affichés
+régulièrement et écrits dans online_report.json, avec l'intervalle d'acquisition observé.
+
+Usage :
+    python -m astroca_workflow.online acquisition/ --output-dir results \\
+        --x-min 0 --x-max 319 --pixel-cropped 2 --warmup 20 --window 10 --overlap 20
+"""
+import argparse
+import fnmatch
+import json
+import os
+import time
+
+import numpy as np
+
+from .events import UnionFind
+from .pipeline import stage_params, default_parameters, merge_parameters
+
+# Per-frame results that can be written with --keep, and their file names
+ONLINE_STAGES = {
+    'boundaries': 'data_cropped.tif',
+    'dynamic_image': 'dynamic_image.tif',
+    'zscore': 'Zscore.tif',
+    'active_voxels': 'activeVoxels.tif',
+}
+
+EVENTS_FILE = 'events.jsonl'
+REPORT_FILE = 'online_report.json'
+
+
+class FolderWatcher:
+    """
+    Fichiers d'un dossier apparus depuis le dernier appel, dans l'ordre des noms.
+
+    Un fichier n'est retenu que lorsque sa taille n'a pas changé entre deux passages et qu'il n'a
+    pas été modifié depuis `settle` secondes : le microscope a fini de l'écrire.
+    """
+
+    def __init__(self, directory, pattern='*.tif', settle=0.5):
+        self.directory = str(directory)
+        self.pattern = pattern
+        self.settle = settle
+        self.seen = set()
+        self.sizes = {}
+
+    def poll(self):
+        """ Retour : liste de (chemin, date d'écriture) des fichiers complets non encore retournés. """
+        ready = []
+        now = time.time()
+        present = set()
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if path in self.seen or not fnmatch.fnmatch(name, self.pattern):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            present.add(path)
+            previous = self.sizes.get(path)
+            self.sizes[path] = stat.st_size
+            if previous == stat.st_size and now - stat.st_mtime >= self.settle:
+                ready.append((path, stat.st_mtime))
+        # A file removed (or renamed) before being complete no longer holds back the later ones
+        for path in [path for path in self.sizes if path not in present]:
+            del self.sizes[path]
+        # Frames are processed in name order: a later name is not ready before the earlier ones
+        ready_paths = {path for path, _ in ready}
+        waiting = [path for path in self.sizes if path not in ready_paths]
+        if waiting:
+            first_waiting = min(waiting)
+            ready = [(path, mtime) for path, mtime in ready if path < first_waiting]
+        for path, _ in ready:
+            self.seen.add(path)
+            del self.sizes[path]
+        return ready
+
+
+class LatencyReport:
+    """
+    Latence et temps de calcul par volume, intervalle d'acquisition.
+
+    Les volumes de préchauffage attendent l'estimation de F0 et du bruit avant d'être traités :
+    leur latence, qui inclut cette attente, est comptée à part et n'entre pas dans les
+    percentiles du régime établi.
+    """
+
+    def __init__(self):
+        self.arrivals = []
+        self.latencies = []
+        self.compute = []
+        self.warmup_latencies = []
+        self.start = time.perf_counter()
+
+    def record(self, arrival, compute_seconds, warmup=False):
+        self.arrivals.append(arrival)
+        self.compute.append(compute_seconds)
+        (self.warmup_latencies if warmup else self.latencies).append(time.time() - arrival)
+
+    def summary(self):
+        if not self.compute:
+            return {'frames': 0}
+        # Only warm-up frames so far: their latencies are the only ones available
+        latencies = np.asarray(self.latencies or self.warmup_latencies)
+        compute = np.asarray(self.compute)
+        interval = float(np.median(np.diff(self.arrivals))) if len(self.arrivals) > 1 else None
+        return {
+            'frames': len(compute),
+            'warmup_frames': len(self.warmup_latencies),
+            'warmup_latency_max_s': float(max(self.warmup_latencies)) if self.warmup_latencies else None,
+            'frames_per_second': len(compute) / max(time.perf_counter() - self.start, 1e-9),
+            'compute_per_frame_s': float(compute.mean()),
+            'latency_p50_s': float(np.percentile(latencies, 50)),
+            'latency_p95_s': float(np.percentile(latencies, 95)),
+            'latency_max_s': float(latencies.max()),
+            'acquisition_interval_s': interval,
+            # Keeping up: a frame is computed faster than the next one is acquired
+            'keeps_up': None if interval is None else bool(compute.mean() <= interval),
+        }
+
+    def print(self):
+        s = self.summary()
+        if not s['frames']:
+            return
+        line = (f"En ligne : {s['frames']} volumes, {s['frames_per_second']:.2f} volumes/s, "
+                f"calcul {s['compute_per_frame_s'] * 1000:.0f} ms/volume, latence p50 "
+                f"{s['latency_p50_s']:.2f} s, p95 {s['latency_p95_s']:.2f} s, max {s['latency_max_s']:.2f} s")
+        if s['warmup_frames']:
+            line += (f" (hors préchauffage : {s['warmup_frames']} volumes, latence max "
+                     f"{s['warmup_latency_max_s']:.2f} s)")
+        if s['acquisition_interval_s'] is not None:
+            line += (f", acquisition toutes les {s['acquisition_interval_s']:.2f} s"
+                     + ("" if s['keeps_up'] else " (RETARD : le calcul est plus lent que l'acquisition)"))
+        print(line)
+
+
+class OnlineEvents:
+    """
+    Détection des événements sur un flux de volumes de voxels actifs.
+
+    Paramètres :
+        detect : detect_calcium_events_opti
+        params : paramètres transmis à detect
+        window : nombre de nouveaux volumes par appel de detect
+        overlap : nombre de volumes précédents ajoutés comme contexte (au moins 1)
+        on_event : fonction appelée avec la description (dict) de chaque événement terminé
+    """
+
+    # Per label statistics: t, z, y, x min/max and voxel count
+    _COLUMNS = 9
+
+    def __init__(self, detect, params, window, overlap, on_event):
+        if overlap < 1:
+            raise ValueError("Le recouvrement des fenêtres doit être d'au moins un instant pour raccorder les événements.")
+        self.detect = detect
+        self.params = params
+        self.window = max(1, int(window))
+        self.overlap = int(overlap)
+        self.on_event = on_event
+        self.uf = UnionFind(1)  # label 0 is the background
+        self.stats = np.zeros((1, self._COLUMNS), dtype=np.int64)
+        self.pending_labels = set()
+        self.frames = []
+        self.arrivals = []
+        self.context = []
+        self.context_labels = None
+        self.arrival_of = {}
+        self.t = 0
+        self.n_events = 0
+
+    def push(self, active_frame, arrival):
+        """ Ajoute le volume de voxels actifs suivant. """
+        self.frames.append(np.asarray(active_frame))
+        self.arrivals.append(arrival)
+        if len(self.frames) >= self.window:
+            self._detect()
+
+    def flush(self):
+        """ Traite les volumes restants et émet tous les événements en cours (fin d'acquisition). """
+        if self.frames:
+            self._detect()
+        self._close(final=True)
+
+    def _detect(self):
+        block = np.stack(self.context + self.frames)
+        labels, n_events = self.detect(block, self.params)
+        offset = len(self.uf.parent) - 1
+        self.uf.grow(offset + int(n_events) + 1)
+        labels = np.where(labels > 0, labels.astype(np.int64) + offset, 0)
+        n_context = len(self.context)
+
+        if self.context_labels is not None and n_context:
+            # Context frames were labelled by the previous window too: same voxel, same event
+            mine = labels[:n_context]
+            both = (mine > 0) & (self.context_labels > 0)
+            if both.any():
+                pairs = np.unique(np.stack([mine[both], self.context_labels[both]], axis=1), axis=0)
+                for a, b in pairs:
+                    self.uf.union(int(a), int(b))
+
+        self._accumulate(labels[n_context:])
+        for k, arrival in enumerate(self.arrivals):
+            self.arrival_of[self.t + k] = arrival
+        self.t += len(self.frames)
+
+        frames = self.context + self.frames
+        self.context = frames[-self.overlap:]
+        self.context_labels = labels[-len(self.context):]
+        self.frames, self.arrivals = [], []
+        self._close()
+
+    def _accumulate(self, core):
+        if len(self.stats) < len(self.uf.parent):
+            grown = np.zeros((len(self.uf.parent), self._COLUMNS), dtype=np.int64)
+            grown[:len(self.stats)] = self.stats
+            grown[len(self.stats):, 0:8:2] = np.iinfo(np.int64).max
+            self.stats = grown
+        for k in range(core.shape[0]):
+            frame = core[k]
+            z, y, x = np.nonzero(frame)
+            if len(z) == 0:
+                continue
+            ids = frame[z, y, x]
+            t = np.full(len(ids), self.t + k)
+            for column, values in enumerate((t, z, y, x)):
+                np.minimum.at(self.stats[:, 2 * column], ids, values)
+                np.maximum.at(self.stats[:, 2 * column + 1], ids, values)
+            np.add.at(self.stats[:, 8], ids, 1)
+            self.pending_labels.update(np.unique(ids).tolist())
+
+    def _close(self, final=False):
+        open_roots = set()
+        if not final and self.context_labels is not None:
+            open_roots = {self.uf.find(int(label)) for label in np.unique(self.context_labels) if label > 0}
+        groups = {}
+        for label in self.pending_labels:
+            groups.setdefault(self.uf.find(label), []).append(label)
+        closed = []
+        for root, labels in groups.items():
+            if root in open_roots:
+                continue
+            rows = self.stats[labels]
+            closed.append((int(rows[:, 0].min()), rows))
+            self.pending_labels.difference_update(labels)
+        for _, rows in sorted(closed, key=lambda item: item[0]):
+            self._emit(rows)
+        # Arrival times are only needed for frames that open events may still end on
+        oldest = min((int(self.stats[label, 1]) for label in self.pending_labels), default=self.t)
+        for t in [t for t in self.arrival_of if t < oldest]:
+            del self.arrival_of[t]
+
+    def _emit(self, rows):
+        self.n_events += 1
+        t_end = int(rows[:, 1].max())
+        event = {
+            'event': self.n_events,
+            't_start': int(rows[:, 0].min()),
+            't_end': t_end,
+            'n_voxels': int(rows[:, 8].sum()),
+            'z': [int(rows[:, 2].min()), int(rows[:, 3].max())],
+            'y': [int(rows[:, 4].min()), int(rows[:, 5].max())],
+            'x': [int(rows[:, 6].min()), int(rows[:, 7].max())],
+        }
+        arrival = self.arrival_of.get(t_end)
+        if arrival is not None:
+            event['latency_s'] = time.time() - arrival
+        self.on_event(event)
+
+
+class OnlineRunner:
+    """
+    Chaîne astroca appliquée volume par volume aux fichiers d'un dossier d'acquisition.
+
+    Paramètres :
+        output_dir : dossier des résultats
+        params : paramètres (voir pipeline.default_parameters), fusionnés avec les valeurs par défaut
+        background : chemin d'un F0 déjà estimé (1,Z,Y,X) ou None (estimé sur les premiers volumes)
+        noise_stats : chemin d'un noise_stats.json ou None
+        warmup : nombre de volumes utilisés pour estimer F0 et le bruit
+        window, overlap : fenêtres de détection des événements (voir OnlineEvents)
+        keep : étapes de ONLINE_STAGES écrites volume par volume
+        report_every : période (en volumes) de l'affichage du débit et de la latence
+    """
+
+    def __init__(self, output_dir, params=None, background=None, noise_stats=None, warmup=20,
+                 window=10, overlap=20, keep=(), report_every=50):
+        from .resolver import astroca_functions
+
+        (self.load_data, self.crop_boundaries, self.background_estimation_single_block,
+         self.compute_variance_stabilization, self.compute_dynamic_image, self.closing_morphology_in_space,
+         self.unified_median_filter_3d, self.voxels_finder, detect) = astroca_functions(
+            'tools.loadData.load_data',
+            'croppingBoundaries.cropper.crop_boundaries',
+            'dynamicImage.dynamicImage.background_estimation_single_block',
+            'varianceStabilization.varianceStabilization.compute_variance_stabilization',
+            'dynamicImage.dynamicImage.compute_dynamic_image',
+            'activeVoxels.spaceMorphology.closing_morphology_in_space',
+            'activeVoxels.medianFilter.unified_median_filter_3d',
+            'activeVoxels.activeVoxelsFinder.voxels_finder',
+            'events.eventDetectorCorrected.detect_calcium_events_opti',
+        )
+        self.params = merge_parameters(default_parameters(), params)
+        for key in ('x_min', 'x_max', 'pixel_cropped'):
+            if self.params['preprocessing'][key] is None:
+                raise ValueError(f"Le paramètre preprocessing.{key} est obligatoire.")
+        unknown = set(keep) - set(ONLINE_STAGES)
+        if unknown:
+            raise ValueError(f"Étapes inconnues : {sorted(unknown)}. Étapes possibles : {', '.join(ONLINE_STAGES)}")
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = str(output_dir)
+        self.keep = tuple(keep)
+        self.warmup = max(0, int(warmup))
+        self.report_every = max(1, int(report_every))
+        self.boundaries_params = stage_params('preprocessing', self.params['preprocessing'])
+
+        self.F0 = self.load_data(str(background)) if background else None
+        if self.F0 is not None and self.F0.ndim == 3:
+            self.F0 = self.F0[np.newaxis, ...]
+        self.std_noise = self.params['z_score']['std_noise']
+        self.mean_noise = self.params['z_score']['mean_noise']
+        if noise_stats:
+            with open(str(noise_stats)) as f:
+                record = json.load(f)
+            self.std_noise, self.mean_noise = float(record['std_noise']), float(record['mean_noise'])
+        self.av_std_noise = self.params['active_voxels']['std_noise']
+
+        self.index_xmin = self.index_xmax = self.fill = None
+        self.pending = []  # (frame, arrival, load seconds) waiting for the warm-up estimates
+        self.t = 0
+        self.report = LatencyReport()
+        self.events_path = os.path.join(self.output_dir, EVENTS_FILE)
+        self._events_file = open(self.events_path, 'w')
+        self.events = OnlineEvents(detect, stage_params('events_extraction', self.params['events_extraction']),
+                                   window, overlap, self._write_event)
+
+    @property
+    def ready(self):
+        """ F0 et bruit sont connus : les volumes sont traités dès leur arrivée. """
+        return self.F0 is not None and self.std_noise is not None and self.mean_noise is not None
+
+    def _write_event(self, event):
+        self._events_file.write(json.dumps(event) + '\n')
+        self._events_file.flush()
+
+    def _bounded(self, frame):
+        """ Volume recadré et borné (1,Z,Y,X) ; les bornes sont calculées sur le premier volume. """
+        from .boundaries import apply_boundaries, compute_boundaries_4d, learn_fill
+
+        cropped = self.crop_boundaries(frame[np.newaxis, ...], self.boundaries_params)
+        if self.index_xmin is None:
+            self.index_xmin, self.index_xmax, bounded = compute_boundaries_4d(cropped, self.boundaries_params)
+            self.fill = learn_fill(cropped, bounded, self.index_xmin, self.index_xmax)
+            self.bounded_dtype = bounded.dtype
+            if self.fill is None:
+                print("Bornes : compute_boundaries ne se réduit pas à un remplissage constant, "
+                      "elle est appelée sur chaque volume.")
+            np.save(os.path.join(self.output_dir, 'index_xmin.npy'), self.index_xmin)
+            np.save(os.path.join(self.output_dir, 'index_xmax.npy'), self.index_xmax)
+            return bounded
+        if self.fill is None:
+            return compute_boundaries_4d(cropped, self.boundaries_params)[2]
+        return apply_boundaries(cropped, self.index_xmin, self.index_xmax, self.fill, self.bounded_dtype)
+
+    def _estimate(self):
+        """ F0 et bruit estimés sur les volumes de préchauffage, traités ensemble. """
+        from .noise import NoiseStats
+
+        block = np.concatenate([bounded for bounded, _, _ in self.pending])
+        no_save = stage_params()
+        stabilized = self.compute_variance_stabilization(block, self.index_xmin, self.index_xmax, no_save)
+        if self.F0 is None:
+            background = self.background_estimation_single_block(
+                stabilized, self.index_xmin, self.index_xmax,
+                stage_params('background_estimation', self.params['background_estimation']))
+            self.F0 = background[0][np.newaxis, ...]
+            np.save(os.path.join(self.output_dir, 'F0_estimated.npy'), self.F0)
+        dF, mean_noise = self.compute_dynamic_image(stabilized, self.F0, self.index_xmin, self.index_xmax,
+                                                    block.shape[0], no_save)
+        noise = NoiseStats.from_sequence(dF, self.index_xmin, self.index_xmax)
+        if self.mean_noise is None:
+            self.mean_noise = float(mean_noise)
+        if self.std_noise is None:
+            self.std_noise = noise.std
+        print(f"Préchauffage sur {block.shape[0]} volumes : mean_noise={self.mean_noise:.6g}, "
+              f"std_noise={self.std_noise:.6g}")
+
+    def _process(self, bounded, arrival, load_seconds, warmup=False):
+        from .fused import fused_frame
+        from .stacks import export_frame
+
+        start = time.perf_counter()
+        zscore, dF = fused_frame(bounded[0], self.F0, self.index_xmin, self.index_xmax,
+                                 self.std_noise, self.mean_noise, self.params['z_score']['threshold'])
+        closing = self.params['space_closing']
+        closed = self.closing_morphology_in_space(zscore[np.newaxis, ...], closing['radius'], closing['border_mode'])
+        median = self.params['median_filter']
+        filtered = self.unified_median_filter_3d(closed, median['radius'], median['border_mode'])
+        av_std_noise = self.std_noise if self.av_std_noise is None else self.av_std_noise
+        active = self.voxels_finder(filtered, dF[np.newaxis, ...], av_std_noise, self.index_xmin, self.index_xmax)
+
+        results = {'boundaries': bounded[0], 'dynamic_image': dF, 'zscore': zscore, 'active_voxels': active[0]}
+        for stage in self.keep:
+            export_frame(results[stage], os.path.join(self.output_dir, ONLINE_STAGES[stage]), self.t)
+        self.t += 1
+        self.report.record(arrival, load_seconds + time.perf_counter() - start, warmup)
+        self.events.push(active[0], arrival)
+        if self.t % self.report_every == 0:
+            self.report.print()
+
+    def add(self, path, arrival):
+        """ Traite le volume `path`, écrit à la date `arrival` (time.time()). """
+        start = time.perf_counter()
+        frame = self.load_data(str(path))
+        if frame.ndim != 3:
+            raise ValueError(f"Le volume {path} doit être 3D (Z,Y,X), mais a une forme {frame.shape}.")
+        bounded = self._bounded(frame)
+        load_seconds = time.perf_counter() - start
+        if not self.ready:
+            self.pending.append((bounded, arrival, load_seconds))
+            if len(self.pending) < max(1, self.warmup):
+                return
+            self._estimate()
+        if self.pending:
+            self._process_pending()
+        else:
+            self._process(bounded, arrival, load_seconds)
+
+    def _process_pending(self):
+        """ Volumes de préchauffage, traités une fois F0 et le bruit estimés. """
+        pending, self.pending = self.pending, []
+        for bounded, arrival, load_seconds in pending:
+            self._process(bounded, arrival, load_seconds, warmup=True)
+
+    def close(self):
+        """ Fin d'acquisition : émet les événements en cours et écrit le rapport. Retour : rapport. """
+        if self.pending:
+            self._estimate()
+            self._process_pending()
+        self.events.flush()
+        self._events_file.close()
+        summary = dict(self.report.summary(), events=self.events.n_events)
+        with open(os.path.join(self.output_dir, REPORT_FILE), 'w') as f:
+            json.dump(summary, f, indent=2)
+        self.report.print()
+        print(f"Événements émis : {self.events.n_events} -> {self.events_path}")
+        return summary
+
+
+def watch(directory, runner, pattern='*.tif', poll_interval=0.2, settle=0.5, idle_timeout=None, max_frames=None):
+    """
+    Transmet à `runner` les volumes écrits dans `directory` jusqu'à `max_frames` volumes, `idle_timeout`
+    secondes sans nouveau volume ou une interruption (Ctrl+C).
+
+    Retour :
+        rapport de runner.close()
+    """
+    watcher = FolderWatcher(directory, pattern, settle)
+    last_frame = time.perf_counter()
+    n_frames = 0
+    try:
+        while max_frames is None or n_frames < max_frames:
+            ready = watcher.poll()
+            for path, arrival in ready:
+                runner.add(path, arrival)
+                n_frames += 1
+                if max_frames is not None and n_frames >= max_frames:
+                    break
+            if ready:
+                last_frame = time.perf_counter()
+            elif idle_timeout is not None and time.perf_counter() - last_frame > idle_timeout:
+                print(f"Aucun nouveau volume depuis {idle_timeout} s : fin de l'acquisition.")
+                break
+            else:
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("Interruption : fin de l'acquisition.")
+    return runner.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', help="Dossier où le microscope écrit les volumes 3D")
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--x-min', type=int, required=True, help='Minimum x coordinate for cropping')
+    parser.add_argument('--x-max', type=int, required=True, help='Maximum x coordinate for cropping')
+    parser.add_argument('--pixel-cropped', type=int, required=True,
+                        help='Number of pixels to crop from the height dimension.')
+    parser.add_argument('--params', help='Fichier JSON surchargeant les paramètres par défaut')
+    parser.add_argument('--pattern', default='*.tif', help='Motif des noms des volumes')
+    parser.add_argument('--background', default=None, help='F0 déjà estimé ; sinon estimé sur les premiers volumes')
+    parser.add_argument('--noise-stats', default=None, help='noise_stats.json de Dynamic_Image')
+    parser.add_argument('--warmup', type=int, default=20, help='Volumes utilisés pour estimer F0 et le bruit')
+    parser.add_argument('--window', type=int, default=10, help='Nouveaux volumes par détection des événements')
+    parser.add_argument('--overlap', type=int, default=20,
+                        help='Volumes de contexte de chaque détection ; doit couvrir la durée des événements')
+    parser.add_argument('--keep', nargs='*', default=[], choices=sorted(ONLINE_STAGES),
+                        help='Résultats écrits volume par volume')
+    parser.add_argument('--poll-interval', type=float, default=0.2, help='Période de scrutation du dossier (s)')
+    parser.add_argument('--settle', type=float, default=0.5, help='Délai sans modification avant de lire un volume (s)')
+    parser.add_argument('--idle-timeout', type=float, default=None, help='Arrêt après ce délai sans nouveau volume (s)')
+    parser.add_argument('--max-frames', type=int, default=None, help='Arrêt après ce nombre de volumes')
+    parser.add_argument('--report-every', type=int, default=50, help='Période d\'affichage de la latence (volumes)')
+    args = parser.parse_args(argv)
+
+    params = default_parameters()
+    if args.params:
+        with open(args.params) as f:
+            merge_parameters(params, json.load(f))
+    params['preprocessing'].update(x_min=args.x_min, x_max=args.x_max, pixel_cropped=args.pixel_cropped)
+
+    runner = OnlineRunner(args.output_dir, params, args.background, args.noise_stats, args.warmup,
+                          args.window, args.overlap, args.keep, args.report_every)
+    watch(args.directory, runner, args.pattern, args.poll_interval, args.settle, args.idle_timeout, args.max_frames)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""
+Lecture des options facultatives passées aux outils par BioImageIT.
+"""
+
+# Options choosing the layout of a tool's outputs (or how they are produced): all part of the cache key
+OUTPUT_FORMAT_FLAGS = ('single_stack', 'band_output', 'streaming', 'sparse_output', 'packed_mask',
+                       'label_spans', 'dynamic_output', 'all_windows', 'incremental')
+
+
+def tool_flag(arg, name, default=False):
+    """
+    Retourne l'option booléenne `name` de l'argument d'un outil.
+
+    BioImageIT peut transmettre les booléens sous forme de chaîne ('True', '0', ...),
+    l'attribut peut aussi être absent quand l'outil est appelé hors de BioImageIT.
+    """
+    value = getattr(arg, name, default)
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'oui', 'on')
+    return bool(value)
+
+
+def output_format(arg):
+    """ Valeur de chaque option de OUTPUT_FORMAT_FLAGS pour l'argument d'un outil (False si absente). """
+    return {name: tool_flag(arg, name) for name in OUTPUT_FORMAT_FLAGS}
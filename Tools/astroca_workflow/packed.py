@@ -0,0 +1,95 @@
+"""
+Masques 4D (T,Z,Y,X) stockés à 1 bit par voxel.
+
+Les sorties seuillées (Zscore, Space_closing, Median_Filter) ne contiennent que des 0 et des 1 :
+np.packbits selon X les stocke dans 8 fois moins de mémoire qu'en uint8 (32 fois moins qu'en
+float32). Un PackedMask expose shape, dtype, ndim et l'accès par volume (mask[t]), ce qui suffit
+à stacks.export_sequence pour l'écrire sans reconstruire la séquence dense.
+"""
+import numpy as np
+
+
+def is_binary(array):
+    """ Indique si `array` ne contient que des 0 et des 1. """
+    if array.dtype == bool:
+        return True
+    return bool(np.all((array == 0) | (array == 1)))
+
+
+class PackedMask:
+    """
+    Masque 4D à 1 bit par voxel.
+
+    Paramètres :
+        bits : tableau uint8 (T,Z,Y,ceil(X/8)), np.packbits du masque selon X
+        shape : forme (T,Z,Y,X) du masque
+        dtype : type des volumes reconstruits (celui de la séquence d'origine)
+    """
+
+    def __init__(self, bits, shape, dtype=np.uint8):
+        self.bits = bits
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.ndim = len(self.shape)
+
+    @classmethod
+    def empty(cls, shape, dtype=np.uint8, scratch_dir=None):
+        """ Masque non initialisé ; les bits sont stockés dans un memmap si scratch_dir est renseigné. """
+        from .store import allocate_4d
+
+        shape = tuple(shape)
+        bits = allocate_4d(shape[:-1] + ((shape[-1] + 7) // 8,), np.uint8, scratch_dir)
+        return cls(bits, shape, dtype)
+
+    @classmethod
+    def from_frames(cls, frames, time_length, scratch_dir=None):
+        """
+        Compresse une séquence binaire à partir d'un itérateur de volumes (Z,Y,X), sans l'assembler.
+
+        Retour :
+            PackedMask, ou None si un volume contient d'autres valeurs que 0 et 1
+        """
+        mask = None
+        for t, frame in enumerate(frames):
+            frame = np.asarray(frame)
+            if not is_binary(frame):
+                return None
+            if mask is None:
+                mask = cls.empty((time_length,) + frame.shape, frame.dtype, scratch_dir)
+            mask.bits[t] = np.packbits(frame != 0, axis=-1)
+        return mask
+
+    @classmethod
+    def from_dense(cls, data4D, scratch_dir=None):
+        """ Compresse une séquence binaire (T,Z,Y,X) ; None si elle contient d'autres valeurs que 0 et 1. """
+        return cls.from_frames((data4D[t] for t in range(data4D.shape[0])), data4D.shape[0], scratch_dir)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def unpack(self, start, stop, dtype=None):
+        """ Volumes [start, stop) sous forme dense (stop - start, Z, Y, X). """
+        frames = np.unpackbits(self.bits[start:stop], axis=-1, count=self.shape[-1])
+        return frames if dtype is None or frames.dtype == dtype else frames.astype(dtype)
+
+    def pack(self, start, frames):
+        """ Écrit les volumes denses `frames` à partir de l'instant `start`. """
+        self.bits[start:start + len(frames)] = np.packbits(np.asarray(frames) != 0, axis=-1)
+
+    def __getitem__(self, t):
+        if not isinstance(t, (int, np.integer)):
+            raise TypeError("Un PackedMask s'indexe par instant : mask[t].")
+        return self.unpack(t, t + 1, self.dtype)[0]
+
+    def to_dense(self, scratch_dir=None):
+        """ Séquence dense (T,Z,Y,X) du type d'origine. """
+        from .store import allocate_4d
+
+        data4D = allocate_4d(self.shape, self.dtype, scratch_dir)
+        for t in range(self.shape[0]):
+            data4D[t] = self[t]
+        return data4D
@@ -0,0 +1,295 @@
+"""
+Exécution de la chaîne astroca complète en mémoire, sans TIFF intermédiaires.
+
+Les étapes sont celles des outils BioImageIT, dans l'ordre documenté :
+BoundariesComputation → Anscombe → Baseline_fluorescence_estimation → Dynamic_Image
+→ Zscore → Space_closing → Median_Filter → AV_finder → Event_Finder → Image_Amplitude
+→ Features_Extraction. Seules les étapes listées dans `keep` sont écrites sur disque.
+
+Usage :
+    python -m astroca_workflow.pipeline frames/*.tif --output-dir results \\
+        --x-min 0 --x-max 319 --pixel-cropped 2 --keep events
+"""
+import argparse
+import copy
+import json
+import os
+import time
+
+# Stages whose 4D result can be persisted with `keep`
+STAGES = (
+    'boundaries',
+    'variance_stabilization',
+    'background',
+    'dynamic_image',
+    'zscore',
+    'space_closing',
+    'median_filter',
+    'active_voxels',
+    'events',
+    'image_amplitude',
+)
+
+# Output file names, identical to the defaults of the BioImageIT tools
+STAGE_FILES = {
+    'boundaries': 'data_cropped.tif',
+    'variance_stabilization': 'data_variance_stabilized.tif',
+    'background': 'F0_estimated.tif',
+    'dynamic_image': 'dynamic_image.tif',
+    'zscore': 'Zscore.tif',
+    'space_closing': 'filledSpaceMorphology.tif',
+    'median_filter': 'medianFiltered.tif',
+    'active_voxels': 'activeVoxels.tif',
+    'events': 'calciumEvents.tif',
+    'image_amplitude': 'inverse_anscombe_transformed_volume.tif',
+}
+
+DEFAULT_PARAMETERS = {
+    'preprocessing': {'x_min': None, 'x_max': None, 'pixel_cropped': None},
+    'background_estimation': {
+        'moving_window': 2,
+        'method': 'percentile',
+        'method2': 'Med',
+        'percentile': 10,
+    },
+    # mean_noise None: use the value estimated by compute_dynamic_image;
+    # std_noise None: use the robust (MAD) noise level of dF in the [xmin, xmax] band (see noise.NoiseStats)
+    'z_score': {'std_noise': 1.17, 'mean_noise': None, 'threshold': 2.8},
+    'space_closing': {'radius': 1, 'border_mode': 'reflect'},
+    'median_filter': {'radius': 1.5, 'border_mode': 'ignore'},
+    'active_voxels': {'std_noise': 1.1696291},
+    'events_extraction': {
+        'threshold_size_3d': 400,
+        'threshold_corr': 0.6,
+        'threshold_size_3d_removed': 20,
+    },
+    'features_extraction': {
+        'voxel_size_x': 0.1025,
+        'voxel_size_y': 0.1025,
+        'voxel_size_z': 0.1344,
+        'threshold_median_localized': 4.0,
+        'threshold_distance_localized': 6.0,
+        'volume_localized': 0.0434,
+    },
+}
+
+
+def default_parameters():
+    """ Copie des paramètres par défaut, identiques aux valeurs par défaut des outils. """
+    return copy.deepcopy(DEFAULT_PARAMETERS)
+
+
+def merge_parameters(params, overrides):
+    """ Fusionne récursivement `overrides` dans `params` (modifié en place) et le retourne. """
+    for key, value in (overrides or {}).items():
+        if isinstance(value, dict) and isinstance(params.get(key), dict):
+            merge_parameters(params[key], value)
+        else:
+            params[key] = value
+    return params
+
+
+def stage_params(section=None, values=None, output_dir=None, save_results=0):
+    """ Paramètres d'une fonction astroca : section `section` et options d'enregistrement des résultats. """
+    params = {
+        'files': {'save_results': save_results},
+        'paths': {'output_dir': output_dir},
+    }
+    if section is not None:
+        params[section] = values
+    return params
+
+
+def _crop_and_bound(crop_boundaries, compute_boundaries, data4D, params):
+    # The cropped sequence is only referenced here, so it is freed as soon as the bounds are computed
+    return compute_boundaries(crop_boundaries(data4D, params), params)
+
+
+def run_pipeline(input_paths, output_dir, params=None, keep=(), single_stack=False, scratch_dir=None):
+    """
+    Exécute toute la chaîne astroca sur une séquence et écrit les caractéristiques des événements.
+
+    Paramètres :
+        input_paths : chemins des volumes 3D dans l'ordre temporel, ou chemin unique d'une pile 4D
+        output_dir : dossier des résultats
+        params : paramètres (voir default_parameters), fusionnés avec les valeurs par défaut
+        keep : étapes de STAGES dont le résultat 4D doit être écrit
+        single_stack : écrit les étapes conservées en une pile TIFF 4D plutôt qu'un fichier par volume
+        scratch_dir : dossier des memmap (voir store.allocate_4d) pour la séquence d'entrée et
+                      les résultats 4D conservés d'une étape à l'autre ; seul le résultat de
+                      l'étape en cours, alloué par astroca, reste en mémoire
+
+    Retour :
+        dict avec 'ids_events', 'mean_noise', 'index_xmin', 'index_xmax' et 'timings' (s par étape)
+    """
+    import numpy as np
+
+    from .frames import load_frames
+    from .noise import NOISE_FILE, NoiseStats, save_noise
+    from .resolver import astroca_functions
+    from .stacks import export_sequence, is_stack, load_stack
+    from .store import allocate_4d
+
+    (save_numpy_tab, compute_boundaries, crop_boundaries, compute_variance_stabilization,
+     background_estimation_single_block, compute_dynamic_image, compute_image_amplitude, compute_z_score,
+     closing_morphology_in_space, unified_median_filter_3d, voxels_finder, detect_calcium_events_opti,
+     save_features_from_events) = astroca_functions(
+        'tools.exportData.save_numpy_tab',
+        'croppingBoundaries.computeBoundaries.compute_boundaries',
+        'croppingBoundaries.cropper.crop_boundaries',
+        'varianceStabilization.varianceStabilization.compute_variance_stabilization',
+        'dynamicImage.dynamicImage.background_estimation_single_block',
+        'dynamicImage.dynamicImage.compute_dynamic_image',
+        'dynamicImage.dynamicImage.compute_image_amplitude',
+        'activeVoxels.zScore.compute_z_score',
+        'activeVoxels.spaceMorphology.closing_morphology_in_space',
+        'activeVoxels.medianFilter.unified_median_filter_3d',
+        'activeVoxels.activeVoxelsFinder.voxels_finder',
+        'events.eventDetectorCorrected.detect_calcium_events_opti',
+        'features.featuresComputation.save_features_from_events',
+    )
+
+    params = merge_parameters(default_parameters(), params)
+    unknown = set(keep) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Étapes inconnues : {sorted(unknown)}. Étapes possibles : {', '.join(STAGES)}")
+    for key in ('x_min', 'x_max', 'pixel_cropped'):
+        if params['preprocessing'][key] is None:
+            raise ValueError(f"Le paramètre preprocessing.{key} est obligatoire.")
+    os.makedirs(output_dir, exist_ok=True)
+    timings = {}
+
+    def persist(stage, data4D):
+        if stage in keep:
+            export_sequence(data4D, os.path.join(output_dir, STAGE_FILES[stage]), single_stack)
+
+    def spill(data4D):
+        # Stage results kept for later stages are moved to scratch_dir as soon as they are computed
+        if scratch_dir is None or isinstance(data4D, np.memmap) or np.ndim(data4D) != 4:
+            return data4D
+        stored = allocate_4d(data4D.shape, data4D.dtype, scratch_dir)
+        stored[...] = data4D
+        return stored
+
+    def timed(stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        timings[stage] = time.perf_counter() - start
+        print(f"{stage} : {timings[stage]:.2f} s")
+        return result
+
+    if isinstance(input_paths, (str, os.PathLike)) and is_stack(input_paths):
+        data4D = timed('load', load_stack, input_paths, scratch_dir)
+    else:
+        if isinstance(input_paths, (str, os.PathLike)):
+            input_paths = [input_paths]
+        data4D = timed('load', load_frames, input_paths, None, True, scratch_dir)
+    time_length = data4D.shape[0]
+
+    boundaries_params = stage_params('preprocessing', params['preprocessing'])
+    index_xmin, index_xmax, _, bounded = timed('boundaries', _crop_and_bound, crop_boundaries, compute_boundaries,
+                                               data4D, boundaries_params)
+    del data4D
+    bounded = spill(bounded)
+    persist('boundaries', bounded)
+    save_numpy_tab(index_xmin, output_dir, file_name="index_xmin.npy")
+    save_numpy_tab(index_xmax, output_dir, file_name="index_xmax.npy")
+
+    stabilized = spill(timed('variance_stabilization', compute_variance_stabilization,
+                             bounded, index_xmin, index_xmax, stage_params()))
+    persist('variance_stabilization', stabilized)
+
+    background = timed('background', background_estimation_single_block, stabilized, index_xmin, index_xmax,
+                       stage_params('background_estimation', params['background_estimation']))
+    # The BioImageIT chain only exports the first F0 estimate
+    F0 = background[0][np.newaxis, ...]
+    del background
+    persist('background', F0)
+
+    dF, mean_noise = timed('dynamic_image', compute_dynamic_image,
+                           stabilized, F0, index_xmin, index_xmax, time_length, stage_params())
+    del stabilized
+    dF = spill(dF)
+    persist('dynamic_image', dF)
+
+    # Same artifact as the Dynamic_Image tool
+    noise = timed('noise', NoiseStats.from_sequence, dF, index_xmin, index_xmax)
+    save_noise(os.path.join(output_dir, NOISE_FILE), mean_noise, noise)
+
+    z_params = params['z_score']
+    z_mean_noise = mean_noise if z_params['mean_noise'] is None else z_params['mean_noise']
+    z_std_noise = noise.std if z_params['std_noise'] is None else z_params['std_noise']
+    zscore = spill(timed('zscore', compute_z_score, dF, z_std_noise, z_mean_noise,
+                         z_params['threshold'], index_xmin, index_xmax))
+    persist('zscore', zscore)
+
+    closing = params['space_closing']
+    closed = spill(timed('space_closing', closing_morphology_in_space, zscore, closing['radius'],
+                         closing['border_mode']))
+    del zscore
+    persist('space_closing', closed)
+
+    median = params['median_filter']
+    filtered = spill(timed('median_filter', unified_median_filter_3d, closed, median['radius'],
+                           median['border_mode']))
+    del closed
+    persist('median_filter', filtered)
+
+    av_std_noise = noise.std if params['active_voxels']['std_noise'] is None else params['active_voxels']['std_noise']
+    active = spill(timed('active_voxels', voxels_finder, filtered, dF, av_std_noise,
+                         index_xmin, index_xmax))
+    del filtered, dF
+    persist('active_voxels', active)
+
+    events, ids_events = timed('events', detect_calcium_events_opti, active,
+                               stage_params('events_extraction', params['events_extraction']))
+    del active
+    ids_events = int(ids_events)
+    events = spill(events)
+    persist('events', events)
+
+    amplitude = timed('image_amplitude', compute_image_amplitude,
+                      bounded, F0, index_xmin, index_xmax, stage_params())
+    del bounded
+    persist('image_amplitude', amplitude)
+
+    features_params = dict(params['features_extraction'], ids_events=ids_events)
+    timed('features', save_features_from_events, events, ids_events, amplitude,
+          stage_params('features_extraction', features_params, output_dir.rstrip('/') + '/', 1))
+
+    print(f"Nombre d'événements détectés : {ids_events}")
+    return {
+        'ids_events': ids_events,
+        'mean_noise': mean_noise,
+        'index_xmin': index_xmin,
+        'index_xmax': index_xmax,
+        'timings': timings,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help="Volumes 3D dans l'ordre temporel, ou une pile TIFF 4D")
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--x-min', type=int, required=True, help='Minimum x coordinate for cropping')
+    parser.add_argument('--x-max', type=int, required=True, help='Maximum x coordinate for cropping')
+    parser.add_argument('--pixel-cropped', type=int, required=True,
+                        help='Number of pixels to crop from the height dimension.')
+    parser.add_argument('--params', help='Fichier JSON surchargeant les paramètres par défaut')
+    parser.add_argument('--keep', nargs='*', default=[], choices=STAGES, help='Étapes à écrire sur disque')
+    parser.add_argument('--single-stack', action='store_true', help='Écrit chaque étape en une pile TIFF 4D')
+    parser.add_argument('--scratch-dir', default=None, help='Dossier des memmap pour la séquence d\'entrée')
+    args = parser.parse_args(argv)
+
+    params = default_parameters()
+    if args.params:
+        with open(args.params) as f:
+            merge_parameters(params, json.load(f))
+    params['preprocessing'].update(x_min=args.x_min, x_max=args.x_max, pixel_cropped=args.pixel_cropped)
+
+    inputs = args.inputs[0] if len(args.inputs) == 1 else args.inputs
+    run_pipeline(inputs, args.output_dir, params, args.keep, args.single_stack, args.scratch_dir)
+
+
+if __name__ == '__main__':
+    main()
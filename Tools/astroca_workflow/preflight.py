@@ -0,0 +1,141 @@
+"""
+Vérification des entrées d'un outil avant l'assemblage de la séquence 4D.
+
+Sans cette vérification, un volume manquant ou de forme différente n'est découvert qu'au
+moment de sa lecture, après le décodage de tous les volumes qui le précèdent. Ici, tous les
+chemins sont examinés en parallèle (stat), seuls les en-têtes TIFF / .npy sont lus pour
+comparer formes et types, et la mémoire nécessaire est estimée : une entrée invalide est
+signalée en quelques millisecondes, avant toute lecture de données.
+"""
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Number of offending paths quoted in an error message
+MAX_REPORTED = 5
+
+
+def squeeze_shape(shape, ndim=3):
+    """ Forme sans ses axes de tête de taille 1 au-delà de `ndim` axes, comme à la lecture par load_data. """
+    shape = tuple(int(n) for n in shape)
+    while len(shape) > ndim and shape[0] == 1:
+        shape = shape[1:]
+    return shape
+
+
+def read_header(path, ndim=3):
+    """
+    (forme, dtype) lus dans l'en-tête d'un volume, ou None si le format n'est pas reconnu.
+
+    Les volumes écrits par stacks.export_frame ont un axe de temps de taille 1, (1,Z,Y,X) :
+    les axes de tête de taille 1 au-delà de `ndim` axes sont retirés de la forme.
+    """
+    lower = path.lower()
+    if lower.endswith(('.tif', '.tiff')):
+        import tifffile
+
+        with tifffile.TiffFile(path) as tif:
+            if len(tif.series) == 0:
+                return None
+            series = tif.series[0]
+            return squeeze_shape(series.shape, ndim), np.dtype(series.dtype)
+    if lower.endswith('.npy'):
+        # Mapping the file only parses its header
+        array = np.load(path, mmap_mode='r')
+        return squeeze_shape(array.shape, ndim), array.dtype
+    return None
+
+
+def _inspect(path):
+    if not os.path.isfile(path):
+        return path, False, None
+    return path, True, read_header(path)
+
+
+def _quote(paths):
+    quoted = ', '.join(paths[:MAX_REPORTED])
+    if len(paths) > MAX_REPORTED:
+        quoted += f", ... (+{len(paths) - MAX_REPORTED})"
+    return quoted
+
+
+def available_memory():
+    """ Mémoire disponible en octets (MemAvailable sous Linux), ou None si elle est inconnue. """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def check_inputs(paths, scratch_dir=None, max_workers=None, estimate=True):
+    """
+    Vérifie les volumes d'entrée sans lire leurs données.
+
+    Paramètres :
+        paths : liste des chemins des volumes 3D, dans l'ordre temporel
+        scratch_dir : dossier du memmap de la séquence, ou None si elle est assemblée en mémoire
+        max_workers : nombre de threads (défaut : frames.default_workers())
+        estimate : compare la taille de la séquence 4D à la mémoire (ou au disque) disponible
+
+    Retour :
+        (forme (T,Z,Y,X), dtype) lus dans les en-têtes, ou None si le format n'est pas reconnu
+
+    Lève :
+        FileNotFoundError si des volumes manquent, ValueError si leurs formes ou types
+        diffèrent, MemoryError si la séquence ne tient pas dans l'espace disponible
+    """
+    from .frames import default_workers
+
+    paths = [str(path) for path in paths]
+    if len(paths) == 0:
+        raise ValueError("Aucun volume d'entrée à charger.")
+
+    with ThreadPoolExecutor(max_workers=max_workers or default_workers()) as executor:
+        results = list(executor.map(_inspect, paths))
+
+    missing = [path for path, exists, _ in results if not exists]
+    if missing:
+        raise FileNotFoundError(f"{len(missing)} fichier(s) d'entrée introuvable(s) sur {len(paths)} : "
+                                f"{_quote(missing)}")
+
+    headers = [(path, header) for path, _, header in results if header is not None]
+    if not headers:
+        return None
+    reference_path, (shape, dtype) = headers[0]
+    if len(shape) != 3:
+        raise ValueError(f"Le volume {reference_path} doit être 3D (Z,Y,X), mais a une forme {shape}.")
+    mismatched = [f"{path} {header[0]} {header[1]}" for path, header in headers
+                  if header != (shape, dtype)]
+    if mismatched:
+        raise ValueError(f"{len(mismatched)} volume(s) diffèrent de {reference_path} {shape} {dtype} : "
+                         f"{_quote(mismatched)}")
+
+    shape4D = (len(paths),) + shape
+    if estimate:
+        check_space(shape4D, dtype, scratch_dir)
+    return shape4D, dtype
+
+
+def check_space(shape4D, dtype, scratch_dir=None):
+    """ Affiche la taille de la séquence 4D et lève MemoryError si elle dépasse l'espace disponible. """
+    dtype = np.dtype(dtype)
+    required = int(np.prod(shape4D)) * dtype.itemsize
+    if scratch_dir is not None:
+        available, where = shutil.disk_usage(scratch_dir).free, f"sur le disque ({scratch_dir})"
+    else:
+        available, where = available_memory(), "en mémoire"
+    print(f"Séquence {shape4D} {dtype} : {required / 1e9:.2f} Go nécessaires {where}"
+          + (f", {available / 1e9:.2f} Go disponibles" if available is not None else ""))
+    if available is not None and required > available:
+        hint = "" if scratch_dir is not None else " Renseignez scratch_dir pour l'assembler sur disque."
+        raise MemoryError(f"La séquence {shape4D} {dtype} nécessite {required / 1e9:.2f} Go, "
+                          f"{available / 1e9:.2f} Go disponibles {where}.{hint}")
@@ -0,0 +1,109 @@
+"""
+Résolution unique et mise en cache du paquet astroca, avec import paresseux des fonctions.
+
+Le dossier contenant le paquet `astroca` est cherché une seule fois par processus, dans l'ordre :
+    1. le paquet est déjà importable (installé ou déjà dans sys.path) ;
+    2. la variable d'environnement ASTROCA_PATH ;
+    3. le dossier Tools (lien symbolique Tools/astroca) ;
+    4. Tools/astroca, puis les dossiers parents du dépôt (copie du dépôt AstrocytesSegmentation).
+Seul le sous-module astroca demandé est importé : un outil ne paie pas l'import de numba ou
+scipy s'il n'utilise aucune fonction qui en dépend. Le cache disque des noyaux numba est activé
+avant le premier import (voir jit.enable_jit_cache).
+"""
+import importlib
+import importlib.util
+import os
+import sys
+import time
+from functools import lru_cache
+
+ASTROCA_PATH_ENV = 'ASTROCA_PATH'
+# Startup budget of a tool on a small stack (resolution + imports)
+STARTUP_BUDGET_S = 1.0
+
+_TOOLS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+_startup = {'resolve': 0.0, 'imports': 0.0}
+
+
+def _candidate_dirs():
+    env_path = os.environ.get(ASTROCA_PATH_ENV)
+    if env_path:
+        yield env_path
+    yield _TOOLS_DIR
+    yield os.path.join(_TOOLS_DIR, 'astroca')
+    yield os.path.join(_TOOLS_DIR, '..')
+    yield os.path.join(_TOOLS_DIR, '..', '..')
+
+
+@lru_cache(maxsize=None)
+def astroca_root():
+    """
+    Rend le paquet astroca importable et retourne le dossier qui le contient.
+
+    Le résultat est mis en cache : la recherche n'a lieu qu'une fois par processus.
+    """
+    from .jit import enable_jit_cache
+
+    start = time.perf_counter()
+    enable_jit_cache()
+    try:
+        spec = importlib.util.find_spec('astroca')
+        if spec is not None and spec.submodule_search_locations:
+            return os.path.dirname(os.path.abspath(list(spec.submodule_search_locations)[0]))
+
+        searched = []
+        for candidate in _candidate_dirs():
+            candidate = os.path.abspath(candidate)
+            searched.append(candidate)
+            if os.path.isfile(os.path.join(candidate, 'astroca', '__init__.py')) \
+                    or os.path.isdir(os.path.join(candidate, 'astroca', 'tools')):
+                if candidate not in sys.path:
+                    sys.path.append(candidate)
+                importlib.invalidate_caches()
+                return candidate
+        raise ImportError("Impossible d'importer les modules nécessaires. "
+                          "Vérifiez que le module 'astroca' est présent "
+                          f"(ou définissez {ASTROCA_PATH_ENV}). Dossiers examinés : {', '.join(searched)}")
+    finally:
+        _startup['resolve'] += time.perf_counter() - start
+
+
+@lru_cache(maxsize=None)
+def astroca_function(qualified_name):
+    """
+    Importe et retourne une fonction astroca à partir de son nom qualifié.
+
+    Paramètres :
+        qualified_name : chemin sous astroca, ex. 'activeVoxels.zScore.compute_z_score'
+    """
+    astroca_root()
+    module_name, function_name = qualified_name.rsplit('.', 1)
+    start = time.perf_counter()
+    try:
+        module = importlib.import_module(f'astroca.{module_name}')
+    except ImportError as e:
+        raise ImportError(f"Impossible d'importer astroca.{module_name} "
+                          f"(paquet astroca trouvé dans {astroca_root()}).") from e
+    finally:
+        _startup['imports'] += time.perf_counter() - start
+    return getattr(module, function_name)
+
+
+def astroca_functions(*qualified_names):
+    """ Importe plusieurs fonctions astroca, voir astroca_function. """
+    return tuple(astroca_function(name) for name in qualified_names)
+
+
+def startup_report(tool_name=None):
+    """
+    Affiche le temps passé à résoudre et importer astroca depuis le démarrage du processus.
+
+    Retour :
+        dict des durées en secondes ('resolve', 'imports', 'total')
+    """
+    report = dict(_startup, total=_startup['resolve'] + _startup['imports'])
+    label = f"{tool_name} : " if tool_name else ''
+    status = 'OK' if report['total'] <= STARTUP_BUDGET_S else f"au-delà du budget de {STARTUP_BUDGET_S:.1f} s"
+    print(f"{label}démarrage {1e3 * report['total']:.0f} ms (résolution astroca "
+          f"{1e3 * report['resolve']:.0f} ms, imports {1e3 * report['imports']:.0f} ms) — {status}")
+    return report
@@ -0,0 +1,189 @@
+"""
+Étiquettes des événements : type entier minimal et stockage par plages (run-length) par événement.
+
+Dans la séquence 4D (T,Z,Y,X) parcourue à plat, un événement occupe des plages de voxels
+consécutifs de même étiquette. Un fichier .events.npz stocke ces plages regroupées par
+événement, avec un index identifiant -> plages : les voxels d'un événement se lisent sans
+parcourir la séquence.
+
+Format .events.npz :
+    - shape : forme (T,Z,Y,X)
+    - n_events : nombre d'événements
+    - starts : indice à plat (dans la séquence 4D) du premier voxel de chaque plage
+    - lengths : nombre de voxels de chaque plage
+    - offsets : (n_events+2,) les plages de l'événement i sont starts[offsets[i]:offsets[i + 1]]
+"""
+import os
+
+import numpy as np
+
+SPANS_SUFFIX = '.events.npz'
+
+
+def spans_path(output_image):
+    """ Chemin du fichier de plages correspondant à la sortie .tif d'un outil. """
+    return os.path.splitext(str(output_image))[0] + SPANS_SUFFIX
+
+
+def label_dtype(n_events):
+    """ Plus petit type entier non signé contenant les étiquettes 0..n_events. """
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n_events <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def compact_labels(labels, n_events, scratch_dir=None):
+    """
+    Convertit les étiquettes au type minimal (voir label_dtype), volume par volume.
+
+    Retour :
+        étiquettes converties ; `labels` inchangé s'il est déjà de ce type ou si des valeurs
+        sortent de 0..n_events (la conversion les altérerait)
+    """
+    from .store import allocate_4d
+
+    dtype = label_dtype(int(n_events))
+    if labels.dtype == dtype:
+        return labels
+    out = allocate_4d(labels.shape, dtype, scratch_dir)
+    for t in range(labels.shape[0]):
+        frame = np.asarray(labels[t])
+        if frame.size and (frame.min() < 0 or frame.max() > n_events or
+                           (np.issubdtype(frame.dtype, np.floating) and not np.array_equal(frame, np.floor(frame)))):
+            print(f"Étiquettes hors de 0..{n_events} : le type {labels.dtype} est conservé.")
+            return labels
+        out[t] = frame
+    return out
+
+
+def _frame_runs(frame):
+    """ Début, longueur et étiquette des plages d'étiquette constante d'un volume mis à plat. """
+    if frame.size == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, frame
+    starts = np.concatenate([[0], np.flatnonzero(frame[1:] != frame[:-1]) + 1])
+    lengths = np.diff(np.concatenate([starts, [frame.size]]))
+    return starts, lengths, frame[starts]
+
+
+def _expand(starts, lengths):
+    """ Indices des voxels des plages (starts, lengths), plage après plage. """
+    if len(starts) == 0:
+        return np.empty(0, dtype=np.int64)
+    # Each voxel is its run start plus its rank within the run
+    run_first = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    return np.repeat(starts - run_first, lengths) + np.arange(int(lengths.sum()), dtype=np.int64)
+
+
+class EventSpans:
+    """
+    Plages de voxels de chaque événement d'un étiquetage 4D.
+
+    Paramètres :
+        shape : forme (T,Z,Y,X)
+        n_events : nombre d'événements
+        starts, lengths : plages, regroupées par événement (dans l'ordre de la séquence)
+        offsets : (n_events+2,) début des plages de chaque identifiant 0..n_events (0 est vide)
+    """
+
+    def __init__(self, shape, n_events, starts, lengths, offsets):
+        self.shape = tuple(int(n) for n in shape)
+        self.n_events = int(n_events)
+        self.starts = starts
+        self.lengths = lengths
+        self.offsets = offsets
+
+    @classmethod
+    def from_labels(cls, labels, n_events):
+        """ Plages d'un étiquetage (T,Z,Y,X), calculées volume par volume. """
+        n_events = int(n_events)
+        frame_size = int(np.prod(labels.shape[1:]))
+        starts, lengths, ids = [], [], []
+        for t in range(labels.shape[0]):
+            run_starts, run_lengths, run_ids = _frame_runs(np.asarray(labels[t]).reshape(-1))
+            keep = (run_ids > 0) & (run_ids <= n_events)
+            starts.append(run_starts[keep].astype(np.int64) + t * frame_size)
+            lengths.append(run_lengths[keep])
+            ids.append(run_ids[keep].astype(np.int64))
+        starts = np.concatenate(starts) if starts else np.empty(0, dtype=np.int64)
+        lengths = np.concatenate(lengths) if lengths else np.empty(0, dtype=np.int64)
+        ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+        # Runs are in raster order: a stable sort keeps them ordered within each event
+        order = np.argsort(ids, kind='stable')
+        counts = np.bincount(ids, minlength=n_events + 1)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(labels.shape, n_events, starts[order], lengths[order].astype(np.uint32), offsets)
+
+    def __len__(self):
+        return self.n_events
+
+    def size(self, event_id):
+        """ Nombre de voxels de l'événement. """
+        return int(self.lengths[self.offsets[event_id]:self.offsets[event_id + 1]].sum())
+
+    def flat_indices(self, event_id=None):
+        """
+        Indices plats (dans la séquence 4D) des voxels d'un événement, dans l'ordre de la séquence.
+
+        Sans identifiant : les voxels de tous les événements, groupés par identifiant croissant.
+        """
+        if event_id is None:
+            starts, lengths = self.starts, self.lengths.astype(np.int64)
+        else:
+            run = slice(self.offsets[event_id], self.offsets[event_id + 1])
+            starts, lengths = self.starts[run], self.lengths[run].astype(np.int64)
+        return _expand(starts, lengths)
+
+    def coords(self, event_id):
+        """ Coordonnées (t, z, y, x) des voxels de l'événement. """
+        return np.unravel_index(self.flat_indices(event_id), self.shape)
+
+    def to_dense(self, scratch_dir=None):
+        """ Étiquetage dense (T,Z,Y,X), du type minimal pour n_events. """
+        from .store import allocate_4d
+
+        labels = allocate_4d(self.shape, label_dtype(self.n_events), scratch_dir)
+        frame_size = int(np.prod(self.shape[1:]))
+        run_ids = np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))
+        # Runs sorted by position: those of frame t are a contiguous range
+        order = np.argsort(self.starts, kind='stable')
+        starts, lengths, run_ids = self.starts[order], self.lengths[order].astype(np.int64), run_ids[order]
+        bounds = np.searchsorted(starts, np.arange(self.shape[0] + 1, dtype=np.int64) * frame_size)
+        for t in range(self.shape[0]):
+            frame = labels[t].reshape(-1)
+            frame[:] = 0
+            runs = slice(bounds[t], bounds[t + 1])
+            frame[_expand(starts[runs] - t * frame_size, lengths[runs])] = np.repeat(run_ids[runs], lengths[runs])
+        return labels
+
+    def save(self, path):
+        """
+        Écrit les plages au format .events.npz.
+
+        Retour :
+            liste contenant le chemin écrit
+        """
+        path = str(path)
+        with open(path, 'wb') as f:
+            np.savez(f, shape=np.asarray(self.shape, dtype=np.int64), n_events=np.asarray(self.n_events),
+                     starts=self.starts, lengths=self.lengths, offsets=self.offsets)
+        print(f"Événements écrits par plages : {self.n_events} événements, {len(self.starts)} plages -> {path}")
+        return [path]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(str(path)) as spans:
+            return cls(spans['shape'], int(spans['n_events']), spans['starts'], spans['lengths'], spans['offsets'])
+
+
+def is_spans(path):
+    """ Indique si `path` est un fichier écrit par EventSpans.save. """
+    path = str(path)
+    if not path.endswith(SPANS_SUFFIX) or not os.path.exists(path):
+        return False
+    try:
+        with np.load(path) as spans:
+            return {'shape', 'n_events', 'starts', 'lengths', 'offsets'} <= set(spans.files)
+    except (OSError, ValueError):
+        return False
@@ -0,0 +1,96 @@
+"""
+Stockage creux des séquences 4D (T,Z,Y,X) majoritairement nulles (voxels actifs).
+
+Format .npz, équivalent d'une matrice CSR dont les lignes sont les instants :
+    - shape : forme (T,Z,Y,X)
+    - frame_offsets : (T+1,) début de chaque instant dans flat_index / values
+    - flat_index : indice à plat (Z,Y,X) de chaque voxel non nul, croissant par instant
+    - values : valeur de chaque voxel non nul
+"""
+import os
+
+import numpy as np
+
+SPARSE_SUFFIX = '.npz'
+
+
+def sparse_path(output_image):
+    """ Chemin du fichier creux correspondant à la sortie .tif d'un outil. """
+    return os.path.splitext(str(output_image))[0] + SPARSE_SUFFIX
+
+
+def _index_dtype(frame_size):
+    return np.uint32 if frame_size < 2 ** 32 else np.uint64
+
+
+def save_sparse_4d(data4D, path):
+    """
+    Écrit les voxels non nuls de data4D au format creux, instant par instant.
+
+    Paramètres :
+        data4D : séquence (T,Z,Y,X), en mémoire ou np.memmap
+        path : chemin du fichier .npz
+
+    Retour :
+        liste contenant le chemin écrit
+    """
+    T = data4D.shape[0]
+    frame_size = int(np.prod(data4D.shape[1:]))
+    frame_offsets = np.zeros(T + 1, dtype=np.int64)
+    indices, values = [], []
+    for t in range(T):
+        frame = np.asarray(data4D[t]).ravel()
+        nonzero = np.flatnonzero(frame)
+        indices.append(nonzero.astype(_index_dtype(frame_size)))
+        values.append(frame[nonzero])
+        frame_offsets[t + 1] = frame_offsets[t] + nonzero.size
+
+    path = str(path)
+    with open(path, 'wb') as f:
+        np.savez(f,
+                 shape=np.asarray(data4D.shape, dtype=np.int64),
+                 frame_offsets=frame_offsets,
+                 flat_index=np.concatenate(indices) if T else np.empty(0, _index_dtype(frame_size)),
+                 values=np.concatenate(values) if T else np.empty(0, data4D.dtype))
+    density = frame_offsets[-1] / max(1, T * frame_size)
+    print(f"Séquence creuse écrite : {frame_offsets[-1]} voxels non nuls ({100 * density:.2f} %) -> {path}")
+    return [path]
+
+
+def load_sparse_4d(path, scratch_dir=None):
+    """
+    Reconstruit la séquence dense (T,Z,Y,X) d'un fichier écrit par save_sparse_4d.
+
+    Paramètres :
+        path : chemin du fichier .npz
+        scratch_dir : si renseigné, la séquence est reconstruite dans un memmap .npy de ce dossier
+
+    Retour :
+        data4D : np.ndarray (ou np.memmap), nul hors des voxels stockés
+    """
+    from .store import allocate_4d
+
+    with np.load(str(path)) as sparse:
+        shape = tuple(int(n) for n in sparse['shape'])
+        frame_offsets = sparse['frame_offsets']
+        flat_index = sparse['flat_index']
+        values = sparse['values']
+    data4D = allocate_4d(shape, values.dtype, scratch_dir)
+    for t in range(shape[0]):
+        frame = data4D[t].reshape(-1)
+        frame[:] = 0
+        start, stop = frame_offsets[t], frame_offsets[t + 1]
+        frame[flat_index[start:stop]] = values[start:stop]
+    return data4D
+
+
+def is_sparse(path):
+    """ Indique si `path` est un fichier écrit par save_sparse_4d. """
+    path = str(path)
+    if not path.endswith(SPARSE_SUFFIX):
+        return False
+    try:
+        with np.load(path) as sparse:
+            return {'shape', 'frame_offsets', 'flat_index', 'values'} <= set(sparse.files)
+    except (OSError, ValueError):
+        return False
@@ -0,0 +1,183 @@
+"""
+Lecture et écriture des séquences 4D (T,Z,Y,X) produites par les outils.
+
+Deux dispositions sont possibles :
+    - un fichier .tif par volume (comportement historique, `{nom}{t}.tif`) ;
+    - une seule pile 4D multi-pages, BigTIFF si elle dépasse 4 Go.
+"""
+import os
+
+# Classic TIFF offsets are 32 bits; keep some room for the IFDs and metadata
+BIGTIFF_THRESHOLD = 2 ** 32 - 2 ** 25
+
+
+def frame_file_prefix(output_image):
+    """ Préfixe des fichiers par volume, identique à celui utilisé historiquement par les outils. """
+    file_name = str(os.path.basename(output_image))
+    # remove .tif extension if present
+    if file_name.endswith('.tif'):
+        file_name = file_name[:-5]
+    return file_name
+
+
+def export_frames(data4D, output_image):
+    """
+    Écrit chaque volume de data4D dans un fichier `{nom}{t}.tif` à côté de output_image.
+
+    Retour :
+        liste des chemins écrits
+    """
+    return [export_frame(data4D[t], output_image, t) for t in range(data4D.shape[0])]
+
+
+def export_frame(frame, output_image, t):
+    """
+    Écrit le volume (Z,Y,X) de l'instant t dans `{nom}{t}.tif` à côté de output_image.
+
+    Retour :
+        chemin écrit
+    """
+    import numpy as np
+    from .resolver import astroca_function
+    export_data = astroca_function('tools.exportData.export_data')
+
+    output_dir = os.path.dirname(str(output_image))
+    file_name_t = f"{frame_file_prefix(output_image)}{t}.tif"
+    data_to_export = frame[np.newaxis, ...]  # Add a new axis for time
+    export_data(data_to_export, output_dir, export_as_single_tif=True, file_name=file_name_t)
+    return os.path.join(output_dir, file_name_t)
+
+
+def export_stack(data4D, output_image, bigtiff=None):
+    """
+    Écrit data4D dans une seule pile TIFF 4D (axes TZYX) au chemin output_image.
+
+    Paramètres :
+        data4D : tableau (T,Z,Y,X), éventuellement un np.memmap
+        output_image : chemin du fichier .tif à écrire
+        bigtiff : force (True) ou interdit (False) le format BigTIFF ; None choisit selon la taille
+
+    Retour :
+        liste contenant le chemin écrit
+    """
+    import tifffile
+
+    output_image = str(output_image)
+    if data4D.ndim != 4:
+        raise ValueError(f"La séquence doit être 4D (T,Z,Y,X), mais a une forme {data4D.shape}.")
+    if bigtiff is None:
+        bigtiff = data4D.nbytes >= BIGTIFF_THRESHOLD
+    output_dir = os.path.dirname(output_image)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with tifffile.TiffWriter(output_image, bigtiff=bigtiff) as tif:
+        tif.write(data4D, photometric='minisblack', metadata={'axes': 'TZYX'})
+    return [output_image]
+
+
+def export_stack_frames(frames, shape, dtype, output_image, bigtiff=None):
+    """
+    Écrit une pile TIFF 4D à partir d'un itérateur de volumes (Z,Y,X), sans assembler la séquence.
+
+    Paramètres :
+        frames : itérateur de volumes (Z,Y,X), dans l'ordre temporel
+        shape : forme (T,Z,Y,X) de la pile
+        dtype : type des données
+        output_image : chemin du fichier .tif à écrire
+        bigtiff : voir export_stack
+
+    Retour :
+        liste contenant le chemin écrit
+    """
+    import numpy as np
+    import tifffile
+
+    output_image = str(output_image)
+    if bigtiff is None:
+        bigtiff = int(np.prod(shape)) * np.dtype(dtype).itemsize >= BIGTIFF_THRESHOLD
+    output_dir = os.path.dirname(output_image)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    def planes():
+        # tifffile consumes an iterator of (Y,X) pages
+        for frame in frames:
+            yield from frame
+
+    with tifffile.TiffWriter(output_image, bigtiff=bigtiff) as tif:
+        tif.write(planes(), shape=tuple(shape), dtype=dtype, photometric='minisblack', metadata={'axes': 'TZYX'})
+    return [output_image]
+
+
+def export_sequence(data4D, output_image, single_stack=False, bigtiff=None):
+    """
+    Écrit la séquence produite par un outil selon la disposition demandée.
+
+    Retour :
+        liste des chemins écrits
+    """
+    import numpy as np
+
+    if single_stack:
+        if not isinstance(data4D, np.ndarray):
+            # Volume-indexable sequences (packed.PackedMask) are written without being made dense
+            frames = (data4D[t] for t in range(data4D.shape[0]))
+            return export_stack_frames(frames, data4D.shape, data4D.dtype, output_image, bigtiff)
+        return export_stack(data4D, output_image, bigtiff)
+    return export_frames(data4D, output_image)
+
+
+def is_stack(path):
+    """ Indique si le TIFF `path` contient une pile 4D (T,Z,Y,X), en ne lisant que l'en-tête. """
+    import tifffile
+
+    path = str(path)
+    if not path.lower().endswith(('.tif', '.tiff')) or not os.path.exists(path):
+        return False
+    with tifffile.TiffFile(path) as tif:
+        return len(tif.series) > 0 and tif.series[0].ndim == 4
+
+
+def load_stack(path, scratch_dir=None):
+    """
+    Lit une pile TIFF 4D écrite par export_stack.
+
+    Paramètres :
+        path : chemin du fichier .tif
+        scratch_dir : si renseigné, la pile est décodée dans un memmap .npy de ce dossier
+
+    Retour :
+        data4D : np.ndarray (ou np.memmap) de forme (T,Z,Y,X)
+    """
+    import tifffile
+    from .preflight import check_space
+    from .store import allocate_4d
+
+    path = str(path)
+    with tifffile.TiffFile(path) as tif:
+        series = tif.series[0]
+        if series.ndim != 4:
+            raise ValueError(f"Le fichier {path} doit contenir une pile 4D (T,Z,Y,X), "
+                             f"mais a une forme {series.shape}.")
+        check_space(tuple(series.shape), series.dtype, scratch_dir)
+        data4D = allocate_4d(series.shape, series.dtype, scratch_dir)
+        series.asarray(out=data4D)
+    return data4D
+
+
+def stack_shape(path):
+    """ Forme (T,Z,Y,X) d'une pile TIFF 4D, lue dans l'en-tête. """
+    import tifffile
+
+    with tifffile.TiffFile(str(path)) as tif:
+        return tuple(tif.series[0].shape)
+
+
+def iter_stack_frames(path):
+    """ Itère sur les volumes (Z,Y,X) d'une pile TIFF 4D sans la charger entièrement. """
+    import tifffile
+
+    with tifffile.TiffFile(str(path)) as tif:
+        T, Z = tif.series[0].shape[:2]
+        for t in range(T):
+            yield tif.asarray(key=range(t * Z, (t + 1) * Z), series=0)
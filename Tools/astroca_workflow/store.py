@@ -0,0 +1,63 @@
+"""
+Stockage des séquences 4D (T,Z,Y,X) de travail : en mémoire ou sur disque (memmap .npy).
+
+Un tableau sur disque est un np.memmap, donc une sous-classe de np.ndarray : les
+fonctions astroca le consomment sans modification, et le système ne garde en RAM
+que les pages en cours d'utilisation.
+"""
+import atexit
+import os
+import tempfile
+
+import numpy as np
+
+SCRATCH_ENV = 'ASTROCA_SCRATCH_DIR'
+
+_scratch_files = []
+
+
+def resolve_scratch_dir(arg=None):
+    """
+    Retourne le dossier de travail sur disque demandé, ou None pour rester en mémoire.
+
+    L'attribut `scratch_dir` de l'argument de l'outil est prioritaire sur la
+    variable d'environnement ASTROCA_SCRATCH_DIR.
+    """
+    scratch_dir = getattr(arg, 'scratch_dir', None) if arg is not None else None
+    if scratch_dir is None or str(scratch_dir).strip() in ('', 'None'):
+        scratch_dir = os.environ.get(SCRATCH_ENV)
+    if not scratch_dir:
+        return None
+    scratch_dir = str(scratch_dir)
+    os.makedirs(scratch_dir, exist_ok=True)
+    return scratch_dir
+
+
+def allocate_4d(shape, dtype, scratch_dir=None):
+    """
+    Alloue un tableau 4D non initialisé.
+
+    Paramètres :
+        shape : forme (T,Z,Y,X)
+        dtype : type des données
+        scratch_dir : dossier du fichier .npy temporaire, ou None pour np.empty
+
+    Retour :
+        np.ndarray ou np.memmap de forme `shape`
+    """
+    if scratch_dir is None:
+        return np.empty(shape, dtype=dtype)
+    fd, path = tempfile.mkstemp(prefix='astroca_', suffix='.npy', dir=scratch_dir)
+    os.close(fd)
+    _scratch_files.append(path)
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=tuple(shape))
+
+
+@atexit.register
+def _remove_scratch_files():
+    for path in _scratch_files:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    _scratch_files.clear()
@@ -0,0 +1,89 @@
+"""
+Traitement volume par volume des étapes sans dépendance temporelle (Anscombe, Z-score).
+
+Chaque volume est lu (avec lecture anticipée en arrière-plan), transformé puis écrit :
+la séquence 4D complète n'est jamais assemblée, la mémoire utilisée est de l'ordre de
+quelques volumes et les entrées/sorties se recouvrent avec le calcul.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+
+from .band import BandPackedArray, BandWriter, band_path, is_band, margin_value
+from .frames import iter_frames
+from .preflight import check_inputs
+from .stacks import export_frame, export_stack_frames, is_stack, iter_stack_frames, stack_shape
+
+# Frame files being written concurrently before the producer waits
+MAX_PENDING_WRITES = 4
+
+
+def iter_tool_frames(argsList, attribute='input_image'):
+    """
+    Volumes (Z,Y,X) de l'entrée `attribute` d'un outil, dans l'ordre temporel.
+
+    Retour :
+        (nombre de volumes, itérateur de volumes)
+    """
+    paths = [str(getattr(arg, attribute)) for arg in argsList]
+    if len(paths) == 1 and is_band(paths[0]):
+        band = BandPackedArray.load(paths[0])
+        return len(band), (band[t] for t in range(len(band)))
+    if len(paths) == 1 and is_stack(paths[0]):
+        return stack_shape(paths[0])[0], iter_stack_frames(paths[0])
+    # Frames are streamed, so only their presence and headers are checked up front
+    check_inputs(paths, estimate=False)
+    return len(paths), iter_frames(paths)
+
+
+def stream_transform(argsList, transform, output_image, single_stack=False, attribute='input_image',
+                     band=None):
+    """
+    Applique `transform` à chaque volume de l'entrée d'un outil et écrit le résultat au fil de l'eau.
+
+    Paramètres :
+        argsList : arguments reçus par processAllData
+        transform : fonction volume (Z,Y,X) -> volume (Z,Y,X)
+        output_image : chemin de sortie de l'outil
+        single_stack : écrit une pile TIFF 4D plutôt qu'un fichier par volume
+        attribute : attribut de argsList désignant l'entrée
+        band : (index_xmin, index_xmax) pour écrire seulement la bande de chaque Z (.band.npz),
+               volume par volume, ou None
+
+    Retour :
+        liste des chemins écrits
+    """
+    time_length, frames = iter_tool_frames(argsList, attribute)
+    results = (transform(frame) for frame in frames)
+
+    if band is not None:
+        index_xmin, index_xmax = band
+        first = next(results)
+        writer = BandWriter(band_path(output_image), (time_length,) + first.shape, first.dtype, index_xmin,
+                            index_xmax, margin_value(first, index_xmin, index_xmax))
+        results = chain([first], results)
+        for t, result in enumerate(results):
+            if not writer.write(result):
+                writer.discard()
+                print("Les marges hors de [xmin, xmax] ne sont pas constantes : la séquence est écrite en entier.")
+                # The frames already written to the band file are read and transformed again
+                _, frames = iter_tool_frames(argsList, attribute)
+                results = chain((transform(frame) for frame in islice(frames, t)), [result], results)
+                break
+        else:
+            return writer.close()
+
+    if single_stack:
+        first = next(results)
+        return export_stack_frames(chain([first], results), (time_length,) + first.shape, first.dtype,
+                                   output_image)
+
+    written = []
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pending = deque()
+        for t, result in enumerate(results):
+            pending.append(executor.submit(export_frame, result, output_image, t))
+            if len(pending) >= MAX_PENDING_WRITES:
+                written.append(pending.popleft().result())
+        written.extend(future.result() for future in pending)
+    return written
@@ -0,0 +1,180 @@
+"""
+Découpage d'une séquence 4D (T,Z,Y,X) en blocs traités en parallèle par un pool de processus.
+
+Les processus ne reçoivent pas les données par sérialisation :
+    - une séquence stockée dans un memmap .npy (voir store.allocate_4d) est rouverte
+      en lecture par chaque processus, qui ne lit que son bloc ;
+    - une séquence en mémoire est héritée par fork (copie à l'écriture, Linux) ;
+    - à défaut de fork, le bloc lui-même est envoyé au processus.
+fork n'est plus employé une fois le pool de threads de numba démarré dans ce processus (noyaux
+parallel=True, ex. le chemin rapide du filtre médian) : les processus sont alors lancés par spawn.
+Avec map_blocks_into, les résultats ne reviennent pas non plus par sérialisation : chaque
+processus écrit son bloc dans la sortie, un memmap .npy ou un segment de mémoire partagée.
+"""
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Sequence inherited by forked workers when it is not backed by a file
+_inherited = None
+
+
+def block_bounds(length, n_blocks):
+    """ Bornes [début, fin) de `n_blocks` blocs contigus couvrant range(length). """
+    n_blocks = max(1, min(int(n_blocks), length))
+    edges = np.linspace(0, length, n_blocks + 1).astype(int)
+    return [(int(edges[i]), int(edges[i + 1])) for i in range(n_blocks)]
+
+
+def _memmap_source(data4D):
+    """ Description permettant de rouvrir data4D dans un autre processus, ou None. """
+    if not isinstance(data4D, np.memmap) or data4D.filename is None or not data4D.flags.c_contiguous:
+        return None
+    # Views into a larger memmap keep the parent's offset: only accept whole-file arrays
+    if data4D.offset + data4D.nbytes != os.path.getsize(data4D.filename):
+        return None
+    return data4D.filename, data4D.offset, data4D.shape, data4D.dtype.str
+
+
+def _run_block(func, source, block, axis, bounds, sliced_args, args):
+    if block is None:
+        if source is not None:
+            filename, offset, shape, dtype = source
+            data4D = np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape)
+        else:
+            data4D = _inherited
+        index = [slice(None)] * data4D.ndim
+        index[axis] = slice(*bounds)
+        block = np.ascontiguousarray(data4D[tuple(index)])
+    return func(block, *[arg[bounds[0]:bounds[1]] for arg in sliced_args], *args)
+
+
+def _fork_safe():
+    """ Indique si ce processus peut être forké : pas de pool de threads numba démarré. """
+    # numba's threading layers (tbb, omp, workqueue) are not fork-safe: a forked pool can
+    # deadlock the workers or the parent at exit
+    parallel = sys.modules.get('numba.np.ufunc.parallel')
+    return not getattr(parallel, '_is_initialized', False)
+
+
+def _plan(data4D, axis):
+    """ Source memmap, emploi de fork, contexte du pool et fonction donnant le bloc à envoyer (ou None). """
+    source = _memmap_source(data4D)
+    safe = _fork_safe()
+    use_fork = source is None and safe and 'fork' in multiprocessing.get_all_start_methods()
+    if use_fork:
+        context = multiprocessing.get_context('fork')
+    elif not safe:
+        # The default start method is fork on Linux: spawn explicitly
+        context = multiprocessing.get_context('spawn')
+    else:
+        context = None
+
+    def block_for(start, stop):
+        if source is not None or use_fork:
+            return None
+        index = [slice(None)] * data4D.ndim
+        index[axis] = slice(start, stop)
+        return np.ascontiguousarray(data4D[tuple(index)])
+    return source, use_fork, context, block_for
+
+
+def map_blocks(func, data4D, axis, n_workers, n_blocks=None, sliced_args=(), args=()):
+    """
+    Applique `func` à des blocs contigus de data4D selon `axis` et concatène les résultats.
+
+    Paramètres :
+        func : fonction picklable (niveau module), appelée func(bloc, *sliced_args_bloc, *args)
+        data4D : séquence (T,Z,Y,X), en mémoire ou np.memmap
+        axis : axe de découpage (0 : temps, 1 : Z)
+        n_workers : nombre de processus
+        n_blocks : nombre de blocs (défaut : n_workers)
+        sliced_args : tableaux indexés par l'axe découpé (ex. index_xmin par Z), découpés avec le bloc
+        args : autres arguments, transmis tels quels
+
+    Retour :
+        np.ndarray, concaténation des résultats selon `axis`
+    """
+    global _inherited
+
+    bounds = block_bounds(data4D.shape[axis], n_blocks or n_workers)
+    source, use_fork, context, block_for = _plan(data4D, axis)
+
+    if use_fork:
+        _inherited = data4D
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as executor:
+            futures = [executor.submit(_run_block, func, source, block_for(*b), axis, b, sliced_args, args)
+                       for b in bounds]
+            results = [future.result() for future in futures]
+    finally:
+        _inherited = None
+    return np.concatenate(results, axis=axis)
+
+
+def _write_block(func, source, block, axis, bounds, sliced_args, args, target):
+    result = _run_block(func, source, block, axis, bounds, sliced_args, args)
+    kind, location, offset, shape, dtype = target
+    if kind == 'memmap':
+        out = np.memmap(location, dtype=dtype, mode='r+', offset=offset, shape=shape)
+    else:
+        segment = shared_memory.SharedMemory(name=location)
+        out = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+    index = [slice(None)] * len(shape)
+    index[axis] = slice(*bounds)
+    out[tuple(index)] = result
+    if kind == 'memmap':
+        out.flush()
+    else:
+        del out
+        segment.close()
+
+
+def map_blocks_into(func, data4D, out, axis, n_workers, n_blocks=None, sliced_args=(), args=()):
+    """
+    Comme map_blocks, mais chaque processus écrit son résultat directement dans `out`.
+
+    `func` doit retourner un bloc de même étendue selon `axis` que le bloc reçu. Si `out` est un
+    memmap .npy (voir store.allocate_4d), les processus l'ouvrent en écriture ; sinon ils écrivent
+    dans un segment de mémoire partagée, recopié dans `out` à la fin.
+
+    Paramètres :
+        out : tableau de sortie, de la forme du résultat complet
+        (autres paramètres : voir map_blocks)
+
+    Retour :
+        out
+    """
+    global _inherited
+
+    bounds = block_bounds(data4D.shape[axis], n_blocks or n_workers)
+    source, use_fork, context, block_for = _plan(data4D, axis)
+
+    out_source = _memmap_source(out)
+    segment = None
+    if out_source is not None:
+        target = ('memmap',) + out_source
+    else:
+        segment = shared_memory.SharedMemory(create=True, size=max(1, out.nbytes))
+        target = ('shm', segment.name, 0, out.shape, out.dtype.str)
+
+    if use_fork:
+        _inherited = data4D
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as executor:
+            futures = [executor.submit(_write_block, func, source, block_for(*b), axis, b, sliced_args, args, target)
+                       for b in bounds]
+            for future in futures:
+                future.result()
+        if segment is not None:
+            out[...] = np.ndarray(out.shape, dtype=out.dtype, buffer=segment.buf)
+    finally:
+        _inherited = None
+        if segment is not None:
+            segment.close()
+            segment.unlink()
+    return out
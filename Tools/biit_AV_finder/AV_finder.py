@@ -19,7 +19,7 @@ class Tool():
     # Dépendances (tu peux adapter si besoin)
     dependencies = dict(
         python='==3.10',
-        conda=['tqdm', 'numpy', 'pandas', 'scipy', 'scikit-image', 'numba'],
+        conda=['tqdm', 'numpy', 'pandas', 'scipy', 'scikit-image', 'numba', 'tifffile'],
         pip=[]
     )
 
@@ -29,8 +29,15 @@ class Tool():
              autoColumn=True),
         dict(name='dynamic_image', help='Chemin vers le fichier .tif 4D (T,Z,Y,X) représentant les changements dynamiques.', required=True, type='Path'),
         dict(name='std_noise', help='Écart type du bruit pour le calcul du Z-score.', required=True, type='Float', default=1.1696291),
+        dict(name='noise_stats', help='Fichier noise_stats.json écrit par Dynamic Image : sa valeur remplace std_noise. Vide : valeur saisie.', required=False, type='Path', default=''),
+        dict(name='use_noise_stats', help='Lit std_noise dans le noise_stats.json écrit par Dynamic Image à côté de l\'image dynamique.', required=False, type='Bool', default=False),
         dict(name='index_xmin', help='Chemin vers le fichier .npy contenant les xmin par Z.', required=True, type='Path'),
         dict(name='index_xmax', help='Chemin vers le fichier .npy contenant les xmax par Z.', required=True, type='Path'),
+        dict(name='scratch_dir', help='Dossier où assembler les séquences 4D sur disque (memmap) au lieu de la RAM. Vide : en mémoire.', required=False, type='Path', default=''),
+        dict(name='sparse_output', help='Écrit les voxels actifs au format creux .npz (indices et valeurs non nuls par instant) au lieu de TIFF denses.', required=False, type='Bool', default=False),
+        dict(name='band_output', help='Écrit, volume par volume, uniquement la bande [xmin, xmax] de chaque Z dans un fichier .band.npz au lieu des TIFF pleine largeur. L\'outil suivant le relit et reconstruit des volumes denses pour le calcul.', required=False, type='Bool', default=False),
+        dict(name='single_stack', help='Lit/écrit la séquence sous forme d\'une seule pile TIFF 4D (BigTIFF au-delà de 4 Go) au lieu d\'un fichier par volume.', required=False, type='Bool', default=False),
+        dict(name='cache_dir', help='Dossier du cache des résultats (clé : entrées + paramètres). Vide : pas de cache.', required=False, type='Path', default=''),
     ]
 
     outputs = [
@@ -48,135 +55,71 @@ class Tool():
         Retour :
             None
         """
+        # Resolve astroca once and import only the submodules this tool uses
+        tools_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        if tools_dir not in sys.path:
+            sys.path.append(tools_dir)
+
+        from astroca_workflow.resolver import astroca_functions, startup_report
+        voxels_finder, = astroca_functions('activeVoxels.activeVoxelsFinder.voxels_finder')
+        startup_report(self.name)
+
+        from astroca_workflow.frames import read_stack
+        from astroca_workflow.options import tool_flag
+        from astroca_workflow.stacks import export_sequence
+        from astroca_workflow.cache import open_stage_cache
+        from astroca_workflow.indices import load_tool_indices
+        from astroca_workflow.band import band_path, save_band_4d
+        from astroca_workflow.jit import kernel_timing
+        from astroca_workflow.sparse import save_sparse_4d, sparse_path
+        from astroca_workflow.noise import resolve_noise
+
+        # Resolve and map the boundary indices before any 4D stack is loaded
+        xmin_path, xmax_path, index_xmin, index_xmax = load_tool_indices(argsList[0])
 
-        try:
-            import numpy as np
-            from astroca.tools.loadData import load_data
-            from astroca.tools.exportData import export_data
-            from astroca.activeVoxels.activeVoxelsFinder import voxels_finder
-        except ImportError as e:
-            base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'astroca'))
-
-            if base_dir not in sys.path:
-                sys.path.append(base_dir)
-
-            try:
-                import numpy as np
-                from astroca.tools.loadData import load_data
-                from astroca.tools.exportData import export_data
-                from astroca.activeVoxels.activeVoxelsFinder import voxels_finder
-            except ImportError as e:
-
-                possible_paths = [
-                    os.path.join(os.path.dirname(__file__), '..', '..', 'astroca'),
-                    os.path.join(os.path.dirname(__file__), '..', '..', '..', 'astroca'),
-                    os.path.join(os.path.dirname(__file__), 'astroca'),
-                    '/home/matteo/Bureau/INRIA/codePython/astroca',  # Chemin absolu basé sur votre structure
-                ]
-
-                for path in possible_paths:
-                    abs_path = os.path.abspath(path)
-                    if os.path.exists(abs_path):
-                        if abs_path not in sys.path:
-                            sys.path.append(abs_path)
-                        try:
-                            from astroca.tools.loadData import load_data
-                            from astroca.tools.exportData import export_data
-                            from astroca.dynamicImage.backgroundEstimator import background_estimation_single_block
-                            break
-                        except ImportError as e2:
-                            continue
-                else:
-                    raise ImportError("Impossible d'importer les modules nécessaires. "
-                                      "Vérifiez que le module 'astroca' est présent.") from e
-
-        time_length = len(argsList)
-        first_volume = argsList[0].input_image
-        first_volume = str(first_volume)  # Ensure it's a string path
-        # Vérification du fichier d'entrée
-        if not os.path.exists(first_volume):
-            raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {first_volume}")
-        data = load_data(first_volume)
-        # print(f"Shape of loaded data: {data.shape}")
-
-        Z, Y, X = data.shape
-        data4D = np.empty((time_length, Z, Y, X), dtype=data.dtype)
-        data4D[0] = data  # Initialize the first time frame
-
-        # Merge all the others input data into one 4D array
-        for t, arg in enumerate(argsList[1:], start=1):
-            input_path = arg.input_image
-            input_path = str(input_path)
-
-            # check files
-            if not os.path.exists(input_path):
-                raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {input_path}")
-            data = load_data(input_path)
-            # print(f"Data shape for time {t}: {data.shape}")
-            data4D[t] = data
+        std_noise = float(argsList[0].std_noise)
+        # The value estimated by Dynamic_Image replaces the hand-entered one only when requested
+        std_noise, _, noise_file = resolve_noise(argsList[0], 'dynamic_image', std_noise)
+        output_image = argsList[0].output_image
 
-        # print(f"Shape of merged data: {data4D.shape}")
+        sparse_output = tool_flag(argsList[0], 'sparse_output')
+        stage_cache, cache_key = open_stage_cache(self.name, argsList, ('input_image', 'dynamic_image'),
+                                                  {'std_noise': std_noise},
+                                                  [xmin_path, xmax_path] + ([noise_file] if noise_file else []))
+        if stage_cache is not None and stage_cache.restore(cache_key, os.path.dirname(str(output_image))) is not None:
+            return
 
-        xmin_path = argsList[0].index_xmin
-        xmax_path = argsList[0].index_xmax
-        xmin_path = str(xmin_path)
-        xmax_path = str(xmax_path)
-        # we have xmin_path = ..../index_xmin0.npy lets remove the 0 at the end
-        if xmin_path.endswith('0.npy'):
-            xmin_path = xmin_path[:-5] + '.npy'
-        if xmax_path.endswith('0.npy'):
-            xmax_path = xmax_path[:-5] + '.npy'
-        if not os.path.exists(xmin_path):
-            raise FileNotFoundError(f"Le fichier index_xmin est introuvable : {xmin_path}")
-        if not os.path.exists(xmax_path):
-            raise FileNotFoundError(f"Le fichier index_xmax est introuvable : {xmax_path}")
-        index_xmin = np.load(xmin_path)
-        index_xmax = np.load(xmax_path)
+        # Merge all the input data into one 4D array
+        data4D = read_stack(argsList, 'input_image')
 
-        std_noise = float(argsList[0].std_noise)
-        first_volume_dF = argsList[0].dynamic_image # Dynamic image for dF
-        first_volume_dF = str(first_volume_dF)
-        # Vérification du fichier d'entrée pour dF
-        if not os.path.exists(first_volume_dF):
-            raise FileNotFoundError(f"Le fichier d'entrée pour dF est introuvable : {first_volume_dF}")
-        dF = load_data(first_volume_dF)
-        # print(f"Shape of dF data: {dF.shape}")
-        Z, Y, X = dF.shape
-        dF4D = np.empty((time_length, Z, Y, X), dtype=dF.dtype)
-        dF4D[0] = dF
-        # Merge all the others input dF data into one 4D array
-        for t, arg in enumerate(argsList[1:], start=1):
-            input_path_dF = arg.dynamic_image
-            input_path_dF = str(input_path_dF)
-
-            # check files
-            if not os.path.exists(input_path_dF):
-                raise FileNotFoundError(f"Le fichier d'entrée pour dF est introuvable : {input_path_dF}")
-            dF = load_data(input_path_dF)
-            # print(f"Data shape for dF at time {t}: {dF.shape}")
-            dF4D[t] = dF
-        # print(f"Shape of merged dF data: {dF4D.shape}")
+        # print(f"Shape of merged data: {data4D.shape}")
 
-        output_image = argsList[0].output_image
+        # Merge all the input dF data into one 4D array
+        dF4D = read_stack(argsList, 'dynamic_image')
+        # print(f"Shape of merged dF data: {dF4D.shape}")
 
         # Apply the active voxel finder
-        processed_data = voxels_finder(
-            data4D,
-            dF4D,
-            std_noise,
-            index_xmin,
-            index_xmax
-        )
-
-        # Save each time frame as a separate image
-        file_name = str(os.path.basename(output_image))
-        # remove .tif extension if present
-        if file_name.endswith('.tif'):
-            file_name = file_name[:-5]
-        for t in range(time_length):
-            file_name_t = f"{file_name}{t}.tif"
-            data_to_export = processed_data[t][np.newaxis, ...]  # Add a new axis for time
-            export_data(data_to_export, os.path.dirname(output_image), export_as_single_tif=True, file_name=file_name_t)
+        with kernel_timing(self.name):
+            processed_data = voxels_finder(
+                data4D,
+                dF4D,
+                std_noise,
+                index_xmin,
+                index_xmax
+            )
+
+        written = None
+        if sparse_output:
+            # Active voxels are a small fraction of the volume: store only their coordinates and values
+            written = save_sparse_4d(processed_data, sparse_path(output_image))
+        elif tool_flag(argsList[0], 'band_output'):
+            # Only the [xmin, xmax] band of each Z carries data: store that span alone
+            written = save_band_4d(processed_data, index_xmin, index_xmax, band_path(output_image))
+        if written is None:
+            # Save the sequence, one file per time frame or as a single 4D stack
+            written = export_sequence(processed_data, output_image, tool_flag(argsList[0], 'single_stack'))
+        if stage_cache is not None:
+            stage_cache.store(cache_key, written)
 
 
 
@@ -16,7 +16,7 @@ class Tool():
     # Dépendances (tu peux adapter si besoin)
     dependencies = dict(
         python='==3.10',
-        conda=['tqdm', 'numpy', 'pandas'],
+        conda=['tqdm', 'numpy', 'pandas', 'tifffile'],
         pip=[]
     )
 
@@ -25,6 +25,11 @@ class Tool():
         dict(name='input_image', help='Chemin vers le fichier .tif 4D (T,Z,Y,X).', required=True, type='Path', autoColumn=True),
         dict(name='index_xmin', help='Chemin vers le fichier .npy contenant les xmin par Z.', required=True, type='Path'),
         dict(name='index_xmax', help='Chemin vers le fichier .npy contenant les xmax par Z.', required=True, type='Path'),
+        dict(name='scratch_dir', help='Dossier où assembler les séquences 4D sur disque (memmap) au lieu de la RAM. Vide : en mémoire.', required=False, type='Path', default=''),
+        dict(name='streaming', help='Traite la séquence volume par volume (lecture, calcul, écriture) sans assembler la séquence 4D en mémoire.', required=False, type='Bool', default=False),
+        dict(name='band_output', help='Écrit, volume par volume, uniquement la bande [xmin, xmax] de chaque Z dans un fichier .band.npz au lieu des TIFF pleine largeur. L\'outil suivant le relit et reconstruit des volumes denses pour le calcul.', required=False, type='Bool', default=False),
+        dict(name='single_stack', help='Lit/écrit la séquence sous forme d\'une seule pile TIFF 4D (BigTIFF au-delà de 4 Go) au lieu d\'un fichier par volume.', required=False, type='Bool', default=False),
+        dict(name='cache_dir', help='Dossier du cache des résultats (clé : entrées + paramètres). Vide : pas de cache.', required=False, type='Path', default=''),
     ]
 
     outputs = [
@@ -43,68 +48,26 @@ class Tool():
         Retour :
             None
         """
-        # Import avec fallback si lancement local
-        try:
-            import numpy as np
-            from astroca.tools.loadData import load_data
-            from astroca.tools.exportData import export_data
-            from astroca.varianceStabilization.varianceStabilization import compute_variance_stabilization
-        except ImportError as e:
-            base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'astroca'))
-            if base_dir not in sys.path:
-                sys.path.append(base_dir)
-            try:
-                import numpy as np
-                from astroca.tools.loadData import load_data
-                from astroca.tools.exportData import export_data
-                from astroca.varianceStabilization.varianceStabilization import compute_variance_stabilization
-            except ImportError as e:
-                raise ImportError("Impossible d'importer les modules nécessaires. "
-                                  "Vérifiez que le module 'astroca' est présent.") from e
-                
-        time_length = len(argsList)     
-        first_volume = argsList[0].input_image
-        first_volume = str(first_volume)  # Ensure it's a string path
-        # Vérification du fichier d'entrée
-        if not os.path.exists(first_volume):
-            raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {first_volume}")
-        data = load_data(first_volume)
-        print(f"Shape of loaded data: {data.shape}")
-        
-        Z, Y, X = data.shape
-        data4D = np.empty((time_length, Z, Y, X), dtype=data.dtype)
-        data4D[0] = data  # Initialize the first time frame
-                
-        # Merge all the others input data into one 4D array
-        for t, arg in enumerate(argsList[1:], start=1):
-            input_path = arg.input_image
-            input_path = str(input_path)
-            
-            # check files
-            if not os.path.exists(input_path):
-                raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {input_path}")
-            data = load_data(input_path)
-            print(f"Data shape for time {t}: {data.shape}")
-            data4D[t] = data
+        # Resolve astroca once and import only the submodules this tool uses
+        tools_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        if tools_dir not in sys.path:
+            sys.path.append(tools_dir)
 
-        print(f"Shape of merged data: {data4D.shape}")
-        
-        # Load xmin and xmax indices
-        xmin_path = argsList[0].index_xmin
-        xmax_path = argsList[0].index_xmax
-        xmin_path = str(xmin_path)
-        xmax_path = str(xmax_path)
-        # we have xmin_path = ..../index_xmin0.npy lets remove the 0 at the end
-        if xmin_path.endswith('0.npy'):
-            xmin_path = xmin_path[:-5] + '.npy'
-        if xmax_path.endswith('0.npy'):
-            xmax_path = xmax_path[:-5] + '.npy'
-        if not os.path.exists(xmin_path):
-            raise FileNotFoundError(f"Le fichier index_xmin est introuvable : {xmin_path}")
-        if not os.path.exists(xmax_path):
-            raise FileNotFoundError(f"Le fichier index_xmax est introuvable : {xmax_path}")
-        index_xmin = np.load(xmin_path)
-        index_xmax = np.load(xmax_path)
+        import numpy as np
+        from astroca_workflow.resolver import astroca_functions, startup_report
+        compute_variance_stabilization, = astroca_functions('varianceStabilization.varianceStabilization.compute_variance_stabilization')
+        startup_report(self.name)
+
+        from astroca_workflow.frames import read_stack
+        from astroca_workflow.options import tool_flag
+        from astroca_workflow.stacks import export_sequence
+        from astroca_workflow.cache import open_stage_cache
+        from astroca_workflow.indices import load_tool_indices
+        from astroca_workflow.band import band_path, save_band_4d
+        from astroca_workflow.streaming import stream_transform
+
+        # Resolve and map the boundary indices before any 4D stack is loaded
+        xmin_path, xmax_path, index_xmin, index_xmax = load_tool_indices(argsList[0])
         
         output_image = argsList[0].output_image
         
@@ -112,24 +75,45 @@ class Tool():
             'files': {'save_results': 0},
             'paths': {'output_dir': None}
         }
-        
-        # Apply the Anscombe variance stabilization
-        processed_data = compute_variance_stabilization(
-            data4D,
-            index_xmin,
-            index_xmax,
-            param_anscombe
-        )
-        
-        # Save each time frame as a separate image
-        file_name = str(os.path.basename(output_image))
-        # remove .tif extension if present
-        if file_name.endswith('.tif'):
-            file_name = file_name[:-5]
-        for t in range(time_length):
-            file_name_t = f"{file_name}{t}.tif"
-            data_to_export = processed_data[t][np.newaxis, ...]  # Add a new axis for time
-            export_data(data_to_export, os.path.dirname(output_image), export_as_single_tif=True, file_name=file_name_t)
+
+        stage_cache, cache_key = open_stage_cache(self.name, argsList, ('input_image',), param_anscombe,
+                                                  [xmin_path, xmax_path])
+        if stage_cache is not None and stage_cache.restore(cache_key, os.path.dirname(str(output_image))) is not None:
+            return
+
+        if tool_flag(argsList[0], 'streaming'):
+            # The variance stabilization is a per-voxel transform: one time frame at a time
+            written = stream_transform(
+                argsList,
+                lambda frame: compute_variance_stabilization(frame[np.newaxis, ...], index_xmin, index_xmax,
+                                                             param_anscombe)[0],
+                output_image,
+                tool_flag(argsList[0], 'single_stack'),
+                band=(index_xmin, index_xmax) if tool_flag(argsList[0], 'band_output') else None
+            )
+        else:
+            # Merge all the input data into one 4D array
+            data4D = read_stack(argsList, 'input_image')
+
+            print(f"Shape of merged data: {data4D.shape}")
+
+            # Apply the Anscombe variance stabilization
+            processed_data = compute_variance_stabilization(
+                data4D,
+                index_xmin,
+                index_xmax,
+                param_anscombe
+            )
+
+            written = None
+            if tool_flag(argsList[0], 'band_output'):
+                # Only the [xmin, xmax] band of each Z carries data: store that span alone
+                written = save_band_4d(processed_data, index_xmin, index_xmax, band_path(output_image))
+            if written is None:
+                # Save the sequence, one file per time frame or as a single 4D stack
+                written = export_sequence(processed_data, output_image, tool_flag(argsList[0], 'single_stack'))
+        if stage_cache is not None:
+            stage_cache.store(cache_key, written)
         
         
         
@@ -10,7 +10,7 @@ class Tool():
 
     dependencies = dict(
         python='==3.10',
-        conda=['tqdm', 'numpy', 'pandas', 'numba'],
+        conda=['tqdm', 'numpy', 'pandas', 'numba', 'tifffile'],
         pip=[]
     )
 
@@ -19,6 +19,12 @@ class Tool():
         dict(name='index_xmin', help='Chemin vers le fichier .npy contenant les xmin par Z.', required=True, type='Path'),
         dict(name='index_xmax', help='Chemin vers le fichier .npy contenant les xmax par Z.', required=True, type='Path'),
         dict(name='moving_window', help="Window size for background estimation.", required=False, type='Int', default=2),
+        dict(name='n_workers', help="Number of processes estimating the background on Z slabs in parallel (1: single block).", required=False, type='Int', default=1),
+        dict(name='scratch_dir', help='Dossier où assembler les séquences 4D sur disque (memmap) au lieu de la RAM. Vide : en mémoire.', required=False, type='Path', default=''),
+        dict(name='single_stack', help='Lit/écrit la séquence sous forme d\'une seule pile TIFF 4D (BigTIFF au-delà de 4 Go) au lieu d\'un fichier par volume.', required=False, type='Bool', default=False),
+        dict(name='incremental', help="Keeps the per-window F0 next to the output: when frames are appended to the sequence, only the new windows are estimated. The new windows reach the output with all_windows.", required=False, type='Bool', default=False),
+        dict(name='all_windows', help="Exports every F0 estimate (nbF0,Z,Y,X) instead of the first one only.", required=False, type='Bool', default=False),
+        dict(name='cache_dir', help='Dossier du cache des résultats (clé : entrées + paramètres). Vide : pas de cache.', required=False, type='Path', default=''),
     ]
 
     outputs = [
@@ -28,107 +34,28 @@ class Tool():
 
     def processAllData(self, argsList):
         """ Apply background estimation on the input image sequence. """
-        # print(f"DEBUG: Current working directory: {os.getcwd()}")
-        # print(f"DEBUG: __file__ location: {__file__}")
-        # print(f"DEBUG: sys.path: {sys.path[:3]}...")  # Afficher les 3 premiers éléments
-        
-        try:
-            import numpy as np
-            # print("DEBUG: numpy imported successfully")
-            from astroca.tools.loadData import load_data
-            # print("DEBUG: load_data imported successfully")
-            from astroca.tools.exportData import export_data
-            # print("DEBUG: export_data imported successfully")
-            from astroca.dynamicImage.dynamicImage import background_estimation_single_block
-            # print("DEBUG: background_estimation_single_block imported successfully")
-        except ImportError as e:
-            # print(f"DEBUG: First import failed: {e}")
-            base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'astroca'))
-            # print(f"DEBUG: Trying to add to path: {base_dir}")
-            # print(f"DEBUG: Directory exists: {os.path.exists(base_dir)}")
-            # if os.path.exists(base_dir):
-                # print(f"DEBUG: Contents of {base_dir}: {os.listdir(base_dir)[:5]}...")  # Afficher les 5 premiers éléments
-            
-            if base_dir not in sys.path:
-                sys.path.append(base_dir)
-                # print(f"DEBUG: Added {base_dir} to sys.path")
-            # else:
-                # print(f"DEBUG: {base_dir} already in sys.path")
-                
-            try:
-                import numpy as np
-                # print("DEBUG: numpy imported successfully (second try)")
-                from astroca.tools.loadData import load_data
-                # print("DEBUG: load_data imported successfully (second try)")
-                from astroca.tools.exportData import export_data
-                # print("DEBUG: export_data imported successfully (second try)")
-                from astroca.dynamicImage.backgroundEstimator import background_estimation_single_block
-                # print("DEBUG: background_estimation_single_block imported successfully (second try)")
-            except ImportError as e:
-                # print(f"DEBUG: Second import also failed: {e}")
-                
-                # Essayons une approche différente pour trouver astroca
-                possible_paths = [
-                    os.path.join(os.path.dirname(__file__), '..', '..', 'astroca'),
-                    os.path.join(os.path.dirname(__file__), '..', '..', '..', 'astroca'),
-                    os.path.join(os.path.dirname(__file__), 'astroca'),
-                    '/home/matteo/Bureau/INRIA/codePython/astroca',  # Chemin absolu basé sur votre structure
-                ]
-                
-                for path in possible_paths:
-                    abs_path = os.path.abspath(path)
-                    # print(f"DEBUG: Checking path: {abs_path}")
-                    if os.path.exists(abs_path):
-                        # print(f"DEBUG: Found astroca at: {abs_path}")
-                        if abs_path not in sys.path:
-                            sys.path.append(abs_path)
-                        try:
-                            from astroca.tools.loadData import load_data
-                            from astroca.tools.exportData import export_data
-                            from astroca.dynamicImage.backgroundEstimator import background_estimation_single_block
-                            # print("DEBUG: Successfully imported astroca modules!")
-                            break
-                        except ImportError as e2:
-                            # print(f"DEBUG: Import failed even with path {abs_path}: {e2}")
-                            continue
-                else:
-                    raise ImportError("Impossible d'importer les modules nécessaires. "
-                                    "Vérifiez que le module 'astroca' est présent.") from e
-
-        # Le reste du code reste identique
-        time_length = len(argsList)
-        first_volume = str(argsList[0].input_image)
+        # Resolve astroca once and import only the submodules this tool uses
+        tools_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        if tools_dir not in sys.path:
+            sys.path.append(tools_dir)
 
-        if not os.path.exists(first_volume):
-            raise FileNotFoundError(f"Fichier d'entrée introuvable : {first_volume}")
+        import numpy as np
+        from astroca_workflow.resolver import astroca_functions, startup_report
+        export_data, = astroca_functions('tools.exportData.export_data')
+        startup_report(self.name)
 
-        data = load_data(first_volume)
-        Z, Y, X = data.shape
-        data4D = np.empty((time_length, Z, Y, X), dtype=data.dtype)
-        data4D[0] = data
+        from astroca_workflow.frames import read_stack
+        from astroca_workflow.cache import open_stage_cache
+        from astroca_workflow.indices import load_tool_indices
+        from astroca_workflow.jit import kernel_timing
+        from astroca_workflow.options import tool_flag
+        from astroca_workflow.baseline import IncrementalBaseline, background_estimation_tiled, state_path
 
-        for t, arg in enumerate(argsList[1:], start=1):
-            input_path = str(arg.input_image)
-            if not os.path.exists(input_path):
-                raise FileNotFoundError(f"Fichier d'entrée introuvable : {input_path}")
-            data = load_data(input_path)
-            data4D[t] = data
-            
-        xmin_path = str(argsList[0].index_xmin)
-        xmax_path = str(argsList[0].index_xmax)
-        if xmin_path.endswith('0.npy'):
-            xmin_path = xmin_path[:-5] + '.npy'
-        if xmax_path.endswith('0.npy'):
-            xmax_path = xmax_path[:-5] + '.npy'
-        if not os.path.exists(xmin_path):
-            raise FileNotFoundError(f"Fichier index_xmin introuvable : {xmin_path}")    
-        if not os.path.exists(xmax_path):
-            raise FileNotFoundError(f"Fichier index_xmax introuvable : {xmax_path}")
-        
-        xmin = np.load(xmin_path)
-        xmax = np.load(xmax_path)
+        # Resolve and map the boundary indices before any 4D stack is loaded
+        xmin_path, xmax_path, xmin, xmax = load_tool_indices(argsList[0])
         output_image = str(argsList[0].output_image)
         moving_window = argsList[0].moving_window
+        n_workers = int(getattr(argsList[0], 'n_workers', 1) or 1)
 
         param_background_estimation = {
             'background_estimation': {
@@ -141,10 +68,44 @@ class Tool():
             'paths': {'output_dir': None}
         }
 
-        processed_data = background_estimation_single_block(
-            data4D, xmin, xmax, param_background_estimation
-        )
+        all_windows = tool_flag(argsList[0], 'all_windows')
+        stage_cache, cache_key = open_stage_cache(self.name, argsList, ('input_image',),
+                                                  param_background_estimation, [xmin_path, xmax_path])
+        if stage_cache is not None and stage_cache.restore(cache_key, os.path.dirname(output_image)) is not None:
+            return
+
+        engine = None
+        done = 0
+        if tool_flag(argsList[0], 'incremental'):
+            # Frames already estimated by a previous run are neither read nor recomputed
+            paths = [str(args.input_image) for args in argsList]
+            engine = IncrementalBaseline(state_path(output_image), param_background_estimation, xmin, xmax, n_workers)
+            done = engine.load(paths)
+
+        with kernel_timing(self.name):
+            if done:
+                processed_data = engine.update(read_stack(argsList[done:], 'input_image') if done < len(argsList)
+                                               else engine.tail[:0], paths[done:])
+            else:
+                data4D = read_stack(argsList, 'input_image')
+                if engine is not None:
+                    processed_data = engine.initialize(data4D, paths)
+                else:
+                    # Each voxel's baseline only depends on its own time series: Z slabs are independent
+                    processed_data = background_estimation_tiled(
+                        data4D, xmin, xmax, param_background_estimation, n_workers
+                    )
+        if engine is not None:
+            engine.save()
 
         file_name = str(os.path.basename(output_image))
-        data_to_export = processed_data[0][np.newaxis, ...]
-        export_data(data_to_export, os.path.dirname(output_image), export_as_single_tif=True, file_name=file_name)
\ No newline at end of file
+        # Only the first estimate is exported by default, as before; all_windows keeps the others
+        # (with incremental, the windows completed by the appended frames)
+        data_to_export = processed_data if all_windows else processed_data[0][np.newaxis, ...]
+        export_data(data_to_export, os.path.dirname(output_image), export_as_single_tif=True, file_name=file_name)
+        if stage_cache is not None:
+            written = [os.path.join(os.path.dirname(output_image), file_name)]
+            if engine is not None:
+                # A restored incremental run can then be extended like the original one
+                written.append(state_path(output_image))
+            stage_cache.store(cache_key, written)
@@ -17,13 +17,20 @@ class Tool():
     # - the python version
     # - the conda packages which will be installed with 'conda install packageName'
     # - the pip packages which will be installed with 'pip install packageName'
-    dependencies = dict(python='==3.10', conda=['tqdm', 'skimage'], pip=[])
+    dependencies = dict(python='==3.10', conda=['tqdm', 'skimage', 'tifffile'], pip=[])
     # The inputs
     inputs = [
         dict(name='input_image', help='Chemin vers le fichier .tif 4D (T,Z,Y,X).', required=True, type='Path', autoColumn=True),
         dict(name='x_min', help='Minimum x coordinate for cropping', required=True, type='Int'),
         dict(name='x_max', help='Maximum x coordinate for cropping', required=True, type='Int'),
         dict(name='pixel_cropped', help='Number of pixels to crop from the height dimension.', required=True, type='Int'),
+        dict(name='sample_frames', help='Number of frames, spread over the sequence, used to compute the boundaries (0: all frames).', required=False, type='Int', default=0),
+        dict(name='verify_boundaries', help='Also compute the boundaries on all frames and keep that result if it differs from the sampled one.', required=False, type='Bool', default=False),
+        dict(name='geometry_cache', help='Dossier où enregistrer les bornes par géométrie du microscope, pour les réutiliser sans les recalculer. Vide : pas de réutilisation.', required=False, type='Path', default=''),
+        dict(name='scratch_dir', help='Dossier où assembler les séquences 4D sur disque (memmap) au lieu de la RAM. Vide : en mémoire.', required=False, type='Path', default=''),
+        dict(name='band_output', help='Écrit, volume par volume, uniquement la bande [xmin, xmax] de chaque Z dans un fichier .band.npz au lieu des TIFF pleine largeur. L\'outil suivant le relit et reconstruit des volumes denses pour le calcul.', required=False, type='Bool', default=False),
+        dict(name='single_stack', help='Lit/écrit la séquence sous forme d\'une seule pile TIFF 4D (BigTIFF au-delà de 4 Go) au lieu d\'un fichier par volume.', required=False, type='Bool', default=False),
+        dict(name='cache_dir', help='Dossier du cache des résultats (clé : entrées + paramètres). Vide : pas de cache.', required=False, type='Path', default=''),
     ]
 
     outputs = [
@@ -34,51 +41,27 @@ class Tool():
     
     
     def processAllData(self, argsList):
-        try:
-            import numpy as np
-            from astroca.tools.loadData import load_data
-            from astroca.tools.exportData import export_data, save_numpy_tab
-            from astroca.croppingBoundaries.computeBoundaries import compute_boundaries
-            from astroca.croppingBoundaries.cropper import crop_boundaries
-        except ImportError as e:
-            base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'astroca'))
-            if base_dir not in sys.path:
-                sys.path.append(base_dir)
-            try:
-                import numpy as np
-                from astroca.tools.loadData import load_data
-                from astroca.croppingBoundaries.computeBoundaries import compute_boundaries
-                from astroca.tools.exportData import export_data, save_numpy_tab
-                from astroca.croppingBoundaries.cropper import crop_boundaries
-            except ImportError as e:
-                raise ImportError("Impossible d'importer les modules nécessaires. "
-                                "Vérifiez que le module 'astroca' est présent.") from e
-                
-        time_length = len(argsList)
-        first_volume = argsList[0].input_image
-        first_volume = str(first_volume)  # Ensure it's a string path
-        # Vérification du fichier d'entrée
-        if not os.path.exists(first_volume):
-            raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {first_volume}")
-        # Chargement des données
-        data = load_data(first_volume)
-        Z, Y, X = data.shape
-        data4D = np.empty((time_length, Z, Y, X), dtype=data.dtype)
-        data4D[0] = data  # Initialize the first time frame
-        # Merge all the others input data into one 4D array
-        # Merge all the others input data into one 4D array
-        for t, arg in enumerate(argsList[1:], start=1):
-            input_path = arg.input_image
-            input_path = str(input_path)
-            
-            # check files
-            if not os.path.exists(input_path):
-                raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {input_path}")
-            data = load_data(input_path)
-            # print(f"Data shape for time {t}: {data.shape}")
-            data4D[t] = data
-            
-        print(f"Shape of merged data: {data4D.shape}")
+        # Resolve astroca once and import only the submodules this tool uses
+        tools_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        if tools_dir not in sys.path:
+            sys.path.append(tools_dir)
+
+        from astroca_workflow.resolver import astroca_functions, startup_report
+        save_numpy_tab, crop_boundaries = astroca_functions(
+            'tools.exportData.save_numpy_tab',
+            'croppingBoundaries.cropper.crop_boundaries'
+        )
+        # Imported here so that the startup report covers it; it is called by boundaries_sampled
+        astroca_functions('croppingBoundaries.computeBoundaries.compute_boundaries')
+        startup_report(self.name)
+
+        from astroca_workflow.frames import read_stack
+        from astroca_workflow.options import tool_flag
+        from astroca_workflow.stacks import export_sequence
+        from astroca_workflow.cache import open_stage_cache
+        from astroca_workflow.band import band_path, save_band_4d
+        from astroca_workflow.boundaries import GeometryStore, boundaries_sampled
+        from astroca_workflow.store import resolve_scratch_dir
 
         x_min = argsList[0].x_min
         x_max = argsList[0].x_max
@@ -95,20 +78,44 @@ class Tool():
             'files': {'save_results': 0},
             'paths': {'output_dir': None}
         }
-        index_xmin, index_xmax, _, processed_data = compute_boundaries( crop_boundaries(data4D, params), params)
-        # Save each time frame as a separate image
-        file_name = str(os.path.basename(output_image))
-        # remove .tif extension if present
-        if file_name.endswith('.tif'):
-            file_name = file_name[:-5]
-        for t in range(time_length):
-            file_name_t = f"{file_name}{t}.tif"
-            data_to_export = processed_data[t][np.newaxis, ...]  # Add a new axis for time
-            # print(f"Export Data shape: {data_to_export.shape}, File Name: {file_name_t}")
-            export_data(data_to_export, os.path.dirname(output_image), export_as_single_tif=True, file_name=file_name_t)
+
+        sample_frames = int(getattr(argsList[0], 'sample_frames', 0) or 0)
+        verify_boundaries = tool_flag(argsList[0], 'verify_boundaries')
+        geometry_store = GeometryStore.for_tool(argsList[0])
+        # Sampling and reused geometries may change the boundaries: they belong to the key
+        key_params = dict(params, sample_frames=sample_frames, verify_boundaries=verify_boundaries,
+                          geometry_cache=os.path.abspath(str(geometry_store.directory)) if geometry_store else '')
+        stage_cache, cache_key = open_stage_cache(self.name, argsList, ('input_image',), key_params)
+        if stage_cache is not None and stage_cache.restore(cache_key, os.path.dirname(str(output_image))) is not None:
+            return
+
+        # Merge all the input data into one 4D array
+        data4D = read_stack(argsList, 'input_image')
+
+        print(f"Shape of merged data: {data4D.shape}")
+
+        # The boundaries only depend on the geometry: sample frames or reuse known indices
+        index_xmin, index_xmax, processed_data = boundaries_sampled(
+            crop_boundaries(data4D, params), params,
+            n_samples=sample_frames,
+            store=geometry_store,
+            verify=verify_boundaries,
+            scratch_dir=resolve_scratch_dir(argsList[0])
+        )
+        written = None
+        if tool_flag(argsList[0], 'band_output'):
+            # Only the [xmin, xmax] band of each Z carries data: store that span alone
+            written = save_band_4d(processed_data, index_xmin, index_xmax, band_path(output_image))
+        if written is None:
+            # Save the sequence, one file per time frame or as a single 4D stack
+            written = export_sequence(processed_data, output_image, tool_flag(argsList[0], 'single_stack'))
             
         save_numpy_tab(index_xmin, os.path.dirname(output_image), file_name="index_xmin.npy")
         save_numpy_tab(index_xmax, os.path.dirname(output_image), file_name="index_xmax.npy")
+        if stage_cache is not None:
+            written += [os.path.join(os.path.dirname(str(output_image)), name)
+                        for name in ("index_xmin.npy", "index_xmax.npy")]
+            stage_cache.store(cache_key, written)
 
         
 
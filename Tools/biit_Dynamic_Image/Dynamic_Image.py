@@ -16,7 +16,7 @@ class Tool():
     # Dépendances (tu peux adapter si besoin)
     dependencies = dict(
         python='==3.10',
-        conda=['tqdm', 'numpy', 'pandas'],
+        conda=['tqdm', 'numpy', 'pandas', 'tifffile'],
         pip=[]
     )
 
@@ -26,11 +26,16 @@ class Tool():
         dict(name='background_image', help='Chemin vers le fichier .tif contenant l\'image de fond.', required=True, type='Path', autoColumn=True),
         dict(name='index_xmin', help='Chemin vers le fichier .npy contenant les xmin par Z.', required=True, type='Path'),
         dict(name='index_xmax', help='Chemin vers le fichier .npy contenant les xmax par Z.', required=True, type='Path'),
-        dict(name='time_length', help='Longueur temporelle de la séquence.', required=False, type='Int', default=1),
+        dict(name='time_length', help='Longueur temporelle attendue de la séquence, vérifiée à la lecture (1 : déduite des données).', required=False, type='Int', default=1),
+        dict(name='scratch_dir', help='Dossier où assembler les séquences 4D sur disque (memmap) au lieu de la RAM. Vide : en mémoire.', required=False, type='Path', default=''),
+        dict(name='band_output', help='Écrit, volume par volume, uniquement la bande [xmin, xmax] de chaque Z dans un fichier .band.npz au lieu des TIFF pleine largeur. L\'outil suivant le relit et reconstruit des volumes denses pour le calcul.', required=False, type='Bool', default=False),
+        dict(name='single_stack', help='Lit/écrit la séquence sous forme d\'une seule pile TIFF 4D (BigTIFF au-delà de 4 Go) au lieu d\'un fichier par volume.', required=False, type='Bool', default=False),
+        dict(name='cache_dir', help='Dossier du cache des résultats (clé : entrées + paramètres). Vide : pas de cache.', required=False, type='Path', default=''),
     ]
 
     outputs = [
-        dict(name='output_image', help='Image transformée sauvegardée.', default='{input_image.stem}_variance_stabilized.tif', type='Path')
+        dict(name='output_image', help='Image transformée sauvegardée.', default='{input_image.stem}_variance_stabilized.tif', type='Path'),
+        dict(name='noise_stats', help='Statistiques du bruit estimées dans la bande [xmin, xmax], lues sur demande par Zscore, Active Voxel Finder et Fused Z-score. std_noise est un écart-type robuste (1.4826 × MAD, signal actif écarté) et non l\'écart-type de Welford de toutes les valeurs, enregistré à part sous std_all.', default='noise_stats.json', type='Path')
     ]
  
         
@@ -45,82 +50,55 @@ class Tool():
         Retour :
             None
         """
-        # Import avec fallback si lancement local
-        try:
-            import numpy as np
-            from astroca.tools.loadData import load_data
-            from astroca.tools.exportData import export_data
-            from astroca.dynamicImage.dynamicImage import compute_dynamic_image
-        except ImportError as e:
-            base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'astroca'))
-            if base_dir not in sys.path:
-                sys.path.append(base_dir)
-            try:
-                import numpy as np
-                from astroca.tools.loadData import load_data
-                from astroca.tools.exportData import export_data
-                from astroca.dynamicImage.dynamicImage import compute_dynamic_image
-            except ImportError as e:
-                raise ImportError("Impossible d'importer les modules nécessaires. "
-                                  "Vérifiez que le module 'astroca' est présent.") from e
-                
-        time_length = len(argsList)     
-        first_volume = argsList[0].input_image
-        first_volume = str(first_volume)  # Ensure it's a string path
-        # Vérification du fichier d'entrée
-        if not os.path.exists(first_volume):
-            raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {first_volume}")
-        data = load_data(first_volume)
-        # print(f"Shape of loaded data: {data.shape}")
+        # Resolve astroca once and import only the submodules this tool uses
+        tools_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        if tools_dir not in sys.path:
+            sys.path.append(tools_dir)
 
-        Z, Y, X = data.shape
-        data4D = np.empty((time_length, Z, Y, X), dtype=data.dtype)
-        data4D[0] = data  # Initialize the first time frame
-                
-        # Merge all the others input data into one 4D array
-        for t, arg in enumerate(argsList[1:], start=1):
-            input_path = arg.input_image
-            input_path = str(input_path)
-            
-            # check files
-            if not os.path.exists(input_path):
-                raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {input_path}")
-            data = load_data(input_path)
-            # print(f"Data shape for time {t}: {data.shape}")
-            data4D[t] = data
+        import numpy as np
+        from astroca_workflow.resolver import astroca_functions, startup_report
+        load_data, compute_dynamic_image = astroca_functions(
+            'tools.loadData.load_data',
+            'dynamicImage.dynamicImage.compute_dynamic_image'
+        )
+        startup_report(self.name)
+
+        from astroca_workflow.frames import read_stack
+        from astroca_workflow.options import tool_flag
+        from astroca_workflow.stacks import export_sequence
+        from astroca_workflow.cache import open_stage_cache
+        from astroca_workflow.indices import load_tool_indices
+        from astroca_workflow.band import band_path, save_band_4d
+        from astroca_workflow.noise import ObservedSequence, noise_path, save_noise
+
+        # Resolve and map the boundary indices before any 4D stack is loaded
+        xmin_path, xmax_path, index_xmin, index_xmax = load_tool_indices(argsList[0])
 
-        # print(f"Shape of merged data: {data4D.shape}")
-        
-        # Load xmin and xmax indices
         F0 = argsList[0].background_image
         F0 = str(F0)  # Ensure it's a string path
         # Vérification du fichier d'entrée
         if not os.path.exists(F0):
             raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {F0}")
         dataF0 = load_data(F0)
-        
-        xmin_path = argsList[0].index_xmin
-        xmax_path = argsList[0].index_xmax
-        xmin_path = str(xmin_path)
-        xmax_path = str(xmax_path)
-        # we have xmin_path = ..../index_xmin0.npy lets remove the 0 at the end
-        if xmin_path.endswith('0.npy'):
-            xmin_path = xmin_path[:-5] + '.npy'
-        if xmax_path.endswith('0.npy'):
-            xmax_path = xmax_path[:-5] + '.npy'
-        if not os.path.exists(xmin_path):
-            raise FileNotFoundError(f"Le fichier index_xmin est introuvable : {xmin_path}")
-        if not os.path.exists(xmax_path):
-            raise FileNotFoundError(f"Le fichier index_xmax est introuvable : {xmax_path}")
-        index_xmin = np.load(xmin_path)
-        index_xmax = np.load(xmax_path)
-        
-        # Ensure the time_length matches the number of time frames in data4D
-        if time_length != data4D.shape[0]:
-            raise ValueError(f"La longueur temporelle spécifiée ({time_length}) ne correspond pas au nombre de trames temporelles dans les données ({data4D.shape[0]}).")
-        
-        
+
         output_image = argsList[0].output_image
+        stage_cache, cache_key = open_stage_cache(self.name, argsList, ('input_image',), {},
+                                                  [F0, xmin_path, xmax_path])
+        if stage_cache is not None and stage_cache.restore(cache_key, os.path.dirname(str(output_image))) is not None:
+            return
+
+        # Merge all the input data into one 4D array
+        data4D = read_stack(argsList, 'input_image')
+        time_length = data4D.shape[0]
+
+        # print(f"Shape of merged data: {data4D.shape}")
+
+        # Ensure the time_length entered by the user (default 1: not set) matches the loaded frames
+        requested_length = int(getattr(argsList[0], 'time_length', 1) or 1)
+        if requested_length != 1 and requested_length != time_length:
+            raise ValueError(f"La longueur temporelle spécifiée ({requested_length}) ne correspond pas au nombre de trames temporelles dans les données ({time_length}).")
+
+
         if dataF0.ndim == 3:
             # If dataF0 is 3D, we need to expand it to 4D by adding a new axis for time
             dataF0 = dataF0[np.newaxis, ...]
@@ -145,16 +123,20 @@ class Tool():
         
         # print(f"Processed data shape: {processed_data.shape}")
         
-        # Save each time frame as a separate image
-        file_name = str(os.path.basename(output_image))
-        # remove .tif extension if present
-        if file_name.endswith('.tif'):
-            file_name = file_name[:-5]
-        for t in range(time_length):
-            file_name_t = f"{file_name}{t}.tif"
-            data_to_export = processed_data[t][np.newaxis, ...]  # Add a new axis for time
-            # print(f"Export Data shape: {data_to_export.shape}, File Name: {file_name_t}")
-            export_data(data_to_export, os.path.dirname(output_image), export_as_single_tif=True, file_name=file_name_t)
+        # The noise statistics are accumulated while the frames are written, in the same pass
+        observed = ObservedSequence(processed_data, index_xmin, index_xmax)
+        written = None
+        if tool_flag(argsList[0], 'band_output'):
+            # Only the [xmin, xmax] band of each Z carries data: store that span alone
+            written = save_band_4d(observed, index_xmin, index_xmax, band_path(output_image))
+        if written is None:
+            # Save the sequence, one file per time frame or as a single 4D stack
+            written = export_sequence(observed, output_image, tool_flag(argsList[0], 'single_stack'))
+
+        # Keep the noise level instead of discarding it: Zscore and AV_finder can read it from this file
+        written += save_noise(noise_path(output_image), mean_noise, observed.finish())
+        if stage_cache is not None:
+            stage_cache.store(cache_key, written)
         
         
         
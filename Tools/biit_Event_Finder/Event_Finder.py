@@ -19,13 +19,13 @@ class Tool():
     # Dépendances (tu peux adapter si besoin)
     dependencies = dict(
         python='==3.10',
-        conda=['tqdm', 'numpy', 'pandas', 'numba', 'matplotlib'],
+        conda=['tqdm', 'numpy', 'pandas', 'numba', 'matplotlib', 'tifffile'],
         pip=[]
     )
 
     # Définition des entrées attendues
     inputs = [
-        dict(name='input_image', help='Chemin vers le fichier .tif 4D (T,Z,Y,X).', required=True, type='Path',
+        dict(name='input_image', help='Chemin vers le fichier .tif 4D (T,Z,Y,X), ou vers le fichier .npz creux produit par Active Voxel Finder.', required=True, type='Path',
              autoColumn=True),
         dict(name='threshold_size_3d', help='Taille minimale des composants connexes en 3D pour être considérées actives.',
              default=400, type='Integer', autoColumn=True),
@@ -34,6 +34,13 @@ class Tool():
         dict(name='threshold_size_3d_remove',
              help='Taille minimale des composants connexes en 3D pour être retirées de la détection.',
              default=20, type='Integer', autoColumn=True),
+        dict(name='time_window', help='Nombre d\'instants traités à la fois ; les fenêtres recouvrantes sont raccordées (union-find). 0 : séquence entière en une fois.', required=False, type='Int', default=0),
+        dict(name='window_overlap', help='Nombre d\'instants de recouvrement de chaque côté d\'une fenêtre ; doit couvrir la durée des événements (seuls threshold_size_3d et threshold_size_3d_remove, par instant, ne dépendent pas de la fenêtre). Si deux fenêtres ne s\'accordent pas à leur raccord, la détection est refaite d\'un seul tenant.', required=False, type='Int', default=20),
+        dict(name='verify_tiling', help='Calcule aussi la détection d\'un seul tenant et la garde si le résultat par fenêtres diffère.', required=False, type='Bool', default=False),
+        dict(name='label_spans', help='Écrit les événements par plages de voxels (fichier .events.npz indexé par identifiant) au lieu de TIFF denses : les voxels d\'un événement se lisent sans parcourir la séquence.', required=False, type='Bool', default=False),
+        dict(name='scratch_dir', help='Dossier où assembler les séquences 4D sur disque (memmap) au lieu de la RAM. Vide : en mémoire.', required=False, type='Path', default=''),
+        dict(name='single_stack', help='Lit/écrit la séquence sous forme d\'une seule pile TIFF 4D (BigTIFF au-delà de 4 Go) au lieu d\'un fichier par volume.', required=False, type='Bool', default=False),
+        dict(name='cache_dir', help='Dossier du cache des résultats (clé : entrées + paramètres). Vide : pas de cache.', required=False, type='Path', default=''),
     ]
 
     outputs = [
@@ -52,100 +59,24 @@ class Tool():
         Retour :
             None
         """
-        # print(f"DEBUG: Current working directory: {os.getcwd()}")
-        # print(f"DEBUG: __file__ location: {__file__}")
-        # print(f"DEBUG: sys.path: {sys.path[:3]}...")  # Afficher les 3 premiers éléments
-
-        try:
-            import numpy as np
-            # print("DEBUG: numpy imported successfully")
-            from astroca.tools.loadData import load_data
-            # print("DEBUG: load_data imported successfully")
-            from astroca.tools.exportData import export_data
-            # print("DEBUG: export_data imported successfully")
-            from astroca.events.eventDetectorCorrected import detect_calcium_events_opti
-            # print("DEBUG: closing_morphology_in_space imported successfully")
-        except ImportError as e:
-            # print(f"DEBUG: First import failed: {e}")
-            base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'astroca'))
-            # print(f"DEBUG: Trying to add to path: {base_dir}")
-            # print(f"DEBUG: Directory exists: {os.path.exists(base_dir)}")
-            # if os.path.exists(base_dir):
-            #     print(
-            #         f"DEBUG: Contents of {base_dir}: {os.listdir(base_dir)[:5]}...")  # Afficher les 5 premiers éléments
-
-            if base_dir not in sys.path:
-                sys.path.append(base_dir)
-                # print(f"DEBUG: Added {base_dir} to sys.path")
-            # else:
-                # print(f"DEBUG: {base_dir} already in sys.path")
-
-            try:
-                import numpy as np
-                # print("DEBUG: numpy imported successfully (second try)")
-                from astroca.tools.loadData import load_data
-                # print("DEBUG: load_data imported successfully (second try)")
-                from astroca.tools.exportData import export_data
-                # print("DEBUG: export_data imported successfully (second try)")
-                from astroca.events.eventDetectorCorrected import detect_calcium_events_opti
-                # print("DEBUG: detect_calcium_events_opti imported successfully (second try)")
-            except ImportError as e:
-                # print(f"DEBUG: Second import also failed: {e}")
-
-                # Essayons une approche différente pour trouver astroca
-                possible_paths = [
-                    os.path.join(os.path.dirname(__file__), '..', '..', 'astroca'),
-                    os.path.join(os.path.dirname(__file__), '..', '..', '..', 'astroca'),
-                    os.path.join(os.path.dirname(__file__), 'astroca'),
-                    '/home/matteo/Bureau/INRIA/codePython/astroca',  # Chemin absolu basé sur votre structure
-                ]
-
-                for path in possible_paths:
-                    abs_path = os.path.abspath(path)
-                    # print(f"DEBUG: Checking path: {abs_path}")
-                    if os.path.exists(abs_path):
-                        # print(f"DEBUG: Found astroca at: {abs_path}")
-                        if abs_path not in sys.path:
-                            sys.path.append(abs_path)
-                        try:
-                            from astroca.tools.loadData import load_data
-                            from astroca.tools.exportData import export_data
-                            from astroca.dynamicImage.backgroundEstimator import background_estimation_single_block
-                            # print("DEBUG: Successfully imported astroca modules!")
-                            break
-                        except ImportError as e2:
-                            # print(f"DEBUG: Import failed even with path {abs_path}: {e2}")
-                            continue
-                else:
-                    raise ImportError("Impossible d'importer les modules nécessaires. "
-                                      "Vérifiez que le module 'astroca' est présent.") from e
-
-        time_length = len(argsList)
-        first_volume = argsList[0].input_image
-        first_volume = str(first_volume)  # Ensure it's a string path
-        # Vérification du fichier d'entrée
-        if not os.path.exists(first_volume):
-            raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {first_volume}")
-        data = load_data(first_volume)
-        # print(f"Shape of loaded data: {data.shape}")
-
-        Z, Y, X = data.shape
-        data4D = np.empty((time_length, Z, Y, X), dtype=data.dtype)
-        data4D[0] = data  # Initialize the first time frame
-
-        # Merge all the others input data into one 4D array
-        for t, arg in enumerate(argsList[1:], start=1):
-            input_path = arg.input_image
-            input_path = str(input_path)
-
-            # check files
-            if not os.path.exists(input_path):
-                raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {input_path}")
-            data = load_data(input_path)
-            # print(f"Data shape for time {t}: {data.shape}")
-            data4D[t] = data
-
-        # print(f"Shape of merged data: {data4D.shape}")
+        # Resolve astroca once and import only the submodules this tool uses
+        tools_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        if tools_dir not in sys.path:
+            sys.path.append(tools_dir)
+
+        import numpy as np
+        from astroca_workflow.resolver import astroca_functions, startup_report
+        detect_calcium_events_opti, = astroca_functions('events.eventDetectorCorrected.detect_calcium_events_opti')
+        startup_report(self.name)
+
+        from astroca_workflow.frames import read_stack
+        from astroca_workflow.options import tool_flag
+        from astroca_workflow.stacks import export_sequence
+        from astroca_workflow.cache import open_stage_cache
+        from astroca_workflow.jit import kernel_timing
+        from astroca_workflow.events import TilingMismatch, detect_events_tiled, same_partition
+        from astroca_workflow.store import resolve_scratch_dir
+        from astroca_workflow.spans import EventSpans, compact_labels, spans_path
 
         threshold_size_3d = int(argsList[0].threshold_size_3d)
         threshold_correlation = float(argsList[0].threshold_correlation)
@@ -163,21 +94,59 @@ class Tool():
             'paths' : {'output_dir': None}
         }
 
+        time_window = int(getattr(argsList[0], 'time_window', 0) or 0)
+        window_overlap = int(getattr(argsList[0], 'window_overlap', 20) or 0)
+        label_spans = tool_flag(argsList[0], 'label_spans')
+        key_params = param_event_finder
+        if time_window > 0:
+            key_params = dict(param_event_finder, tiling={'time_window': time_window, 'overlap': window_overlap,
+                                                          'verify': tool_flag(argsList[0], 'verify_tiling')})
+
+        stage_cache, cache_key = open_stage_cache(self.name, argsList, ('input_image',), key_params)
+        if stage_cache is not None:
+            cached = stage_cache.restore(cache_key, os.path.dirname(str(output_image)))
+            if cached is not None:
+                self.outputs[1]['ids_events'] = int(cached['ids_events'])
+                print(f"Nombre d'événements détectés (cache) : {cached['ids_events']}")
+                return
+
+        # Merge all the input data into one 4D array
+        data4D = read_stack(argsList, 'input_image')
+
+        # print(f"Shape of merged data: {data4D.shape}")
+
         # Apply the active voxel finder
-        processed_data, ids_events = detect_calcium_events_opti(data4D, param_event_finder)
-
-        # Save each time frame as a separate image
-        file_name = str(os.path.basename(output_image))
-        # remove .tif extension if present
-        if file_name.endswith('.tif'):
-            file_name = file_name[:-5]
-        for t in range(time_length):
-            file_name_t = f"{file_name}{t}.tif"
-            data_to_export = processed_data[t][np.newaxis, ...]  # Add a new axis for time
-            export_data(data_to_export, os.path.dirname(output_image), export_as_single_tif=True, file_name=file_name_t)
+        with kernel_timing(self.name):
+            # Overlapping time windows bound the memory by the window size
+            try:
+                processed_data, ids_events = detect_events_tiled(
+                    detect_calcium_events_opti, data4D, param_event_finder, time_window, window_overlap,
+                    resolve_scratch_dir(argsList[0]), strict=True
+                )
+            except TilingMismatch as error:
+                print(f"{error} Calcul d'un seul tenant.")
+                processed_data, ids_events = detect_calcium_events_opti(data4D, param_event_finder)
+        if time_window > 0 and tool_flag(argsList[0], 'verify_tiling'):
+            reference, reference_ids = detect_calcium_events_opti(data4D, param_event_finder)
+            if not np.array_equal(processed_data, reference):
+                print("Détection par fenêtres : résultat différent du calcul d'un seul tenant "
+                      f"({'mêmes événements, numérotés autrement' if same_partition(processed_data, reference) else 'événements différents'}), "
+                      "le calcul d'un seul tenant est conservé.")
+                processed_data, ids_events = reference, reference_ids
 
         output_ids_events = int(ids_events)
+        if label_spans:
+            # One entry per event: its runs of voxels, readable without scanning the sequence
+            written = EventSpans.from_labels(processed_data, output_ids_events).save(spans_path(output_image))
+        else:
+            # Labels 0..ids_events fit in the smallest unsigned type (uint16 below 65536 events)
+            processed_data = compact_labels(processed_data, output_ids_events, resolve_scratch_dir(argsList[0]))
+            # Save the sequence, one file per time frame or as a single 4D stack
+            written = export_sequence(processed_data, output_image, tool_flag(argsList[0], 'single_stack'))
+
         self.outputs[1]['ids_events'] = output_ids_events
+        if stage_cache is not None:
+            stage_cache.store(cache_key, written, extra={'ids_events': output_ids_events})
         print(f"DEBUG: Number of detected events: {output_ids_events}")
 
 
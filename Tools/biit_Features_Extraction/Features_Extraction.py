@@ -19,13 +19,13 @@ class Tool():
     # Dépendances (tu peux adapter si besoin)
     dependencies = dict(
         python='==3.10',
-        conda=['tqdm', 'numpy', 'pandas', 'openpyxl'],
+        conda=['tqdm', 'numpy', 'pandas', 'openpyxl', 'pyarrow', 'tifffile'],
         pip=[]
     )
 
     # Définition des entrées attendues
     inputs = [
-        dict(name='input_image', help='Chemin vers le fichier .tif 4D (T,Z,Y,X).', required=True, type='Path',
+        dict(name='input_image', help='Chemin vers le fichier .tif 4D (T,Z,Y,X), ou vers le fichier .events.npz produit par Calcium Active Voxel Finder.', required=True, type='Path',
              autoColumn=True),
         dict(name='image_amplitude', help='Chemin vers le fichier .tif 4D (T,Z,Y,X) représentant l\'amplitude de l\'image.', required=True, type='Path'),
         dict(name='ids_events', help='Identifiants des événements détectés (de 1 à ids_events)', required=True, type='int', default=6),
@@ -35,6 +35,11 @@ class Tool():
         dict(name='threshold_median_localized', help='Seuil de la médiane localisée pour la détection des caractéristiques.', required=True, type='Float', default=4.0),
         dict(name='threshold_distance_localized', help='Seuil de la distance localisée pour la détection des caractéristiques.', required=True, type='Float', default=6.0),
         dict(name='volume_localized', help='Volume localisé pour la détection des caractéristiques.', required=True, type='Float', default=0.0434),
+        dict(name='n_workers', help="Nombre de processus calculant les caractéristiques événement par événement, écrites dans le fichier features (1 : un seul passage d'astroca, qui écrit ses propres fichiers).", required=False, type='Int', default=1),
+        dict(name='features_format', help="Format du fichier de caractéristiques : csv (avec n_workers=1 : fichiers écrits par astroca), parquet ou feather (colonnes, écrites dans le fichier features par blocs de lignes au fil du calcul ; nécessite pyarrow).", required=False, type='Str', default='csv'),
+        dict(name='scratch_dir', help='Dossier où assembler les séquences 4D sur disque (memmap) au lieu de la RAM. Vide : en mémoire.', required=False, type='Path', default=''),
+        dict(name='single_stack', help='Lit/écrit la séquence sous forme d\'une seule pile TIFF 4D (BigTIFF au-delà de 4 Go) au lieu d\'un fichier par volume.', required=False, type='Bool', default=False),
+        dict(name='cache_dir', help='Dossier du cache des résultats (clé : entrées + paramètres). Vide : pas de cache.', required=False, type='Path', default=''),
     ]
 
     outputs = [
@@ -46,125 +51,23 @@ class Tool():
         """
         Traite toutes les données en extrayant les caractéristiques d'une séquence d'images 4D.
         """
-        # print(f"DEBUG: Current working directory: {os.getcwd()}")
-        # print(f"DEBUG: __file__ location: {__file__}")
-        # print(f"DEBUG: sys.path: {sys.path[:3]}...")  # Afficher les 3 premiers éléments
-
-        try:
-            import numpy as np
-            # print("DEBUG: numpy imported successfully")
-            from astroca.tools.loadData import load_data
-            # print("DEBUG: load_data imported successfully")
-            from astroca.tools.exportData import export_data
-            # print("DEBUG: export_data imported successfully")
-            from astroca.features.featuresComputation import save_features_from_events
-            # print("DEBUG: closing_morphology_in_space imported successfully")
-        except ImportError as e:
-            # print(f"DEBUG: First import failed: {e}")
-            base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'astroca'))
-            # print(f"DEBUG: Trying to add to path: {base_dir}")
-            # print(f"DEBUG: Directory exists: {os.path.exists(base_dir)}")
-            # if os.path.exists(base_dir):
-                # print(
-                    # f"DEBUG: Contents of {base_dir}: {os.listdir(base_dir)[:5]}...")  # Afficher les 5 premiers éléments
-
-            if base_dir not in sys.path:
-                sys.path.append(base_dir)
-                # print(f"DEBUG: Added {base_dir} to sys.path")
-            # else:
-                # print(f"DEBUG: {base_dir} already in sys.path")
-
-            try:
-                import numpy as np
-                # print("DEBUG: numpy imported successfully (second try)")
-                from astroca.tools.loadData import load_data
-                # print("DEBUG: load_data imported successfully (second try)")
-                from astroca.tools.exportData import export_data
-                # print("DEBUG: export_data imported successfully (second try)")
-                from astroca.features.featuresComputation import save_features_from_events
-                # print("DEBUG: closing_morphology_in_space imported successfully (second try)")
-            except ImportError as e:
-                # print(f"DEBUG: Second import also failed: {e}")
-
-                # Essayons une approche différente pour trouver astroca
-                possible_paths = [
-                    os.path.join(os.path.dirname(__file__), '..', '..', 'astroca'),
-                    os.path.join(os.path.dirname(__file__), '..', '..', '..', 'astroca'),
-                    os.path.join(os.path.dirname(__file__), 'astroca'),
-                    '/home/matteo/Bureau/INRIA/codePython/astroca',  # Chemin absolu basé sur votre structure
-                ]
-
-                for path in possible_paths:
-                    abs_path = os.path.abspath(path)
-                    # print(f"DEBUG: Checking path: {abs_path}")
-                    if os.path.exists(abs_path):
-                        # print(f"DEBUG: Found astroca at: {abs_path}")
-                        if abs_path not in sys.path:
-                            sys.path.append(abs_path)
-                        try:
-                            from astroca.tools.loadData import load_data
-                            from astroca.tools.exportData import export_data
-                            from astroca.features.featuresComputation import save_features_from_events
-                            # print("DEBUG: Successfully imported astroca modules!")
-                            break
-                        except ImportError as e2:
-                            # print(f"DEBUG: Import failed even with path {abs_path}: {e2}")
-                            continue
-                else:
-                    raise ImportError("Impossible d'importer les modules nécessaires. "
-                                      "Vérifiez que le module 'astroca' est présent.") from e
-
-        time_length = len(argsList)
-        first_volume = argsList[0].input_image
-        first_volume = str(first_volume)  # Ensure it's a string path
-        # Vérification du fichier d'entrée
-        if not os.path.exists(first_volume):
-            raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {first_volume}")
-        data = load_data(first_volume)
-        # print(f"Shape of loaded data: {data.shape}")
-
-        Z, Y, X = data.shape
-        data4D = np.empty((time_length, Z, Y, X), dtype=data.dtype)
-        data4D[0] = data  # Initialize the first time frame
-
-        # Merge all the others input data into one 4D array
-        for t, arg in enumerate(argsList[1:], start=1):
-            input_path = arg.input_image
-            input_path = str(input_path)
-
-            # check files
-            if not os.path.exists(input_path):
-                raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {input_path}")
-            data = load_data(input_path)
-            # print(f"Data shape for time {t}: {data.shape}")
-            data4D[t] = data
+        # Resolve astroca once and import only the submodules this tool uses
+        tools_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        if tools_dir not in sys.path:
+            sys.path.append(tools_dir)
+
+        from astroca_workflow.resolver import astroca_functions, startup_report
+        save_features_from_events, = astroca_functions('features.featuresComputation.save_features_from_events')
+        startup_report(self.name)
+
+        from astroca_workflow.frames import read_stack
+        from astroca_workflow.cache import open_stage_cache, snapshot_dir, written_since
+        from astroca_workflow.features import features_parallel, features_table
+        from astroca_workflow.columnar import FeatureWriter
+        from astroca_workflow.features import EventIndex
+        from astroca_workflow.spans import EventSpans, is_spans
+        from astroca_workflow.store import resolve_scratch_dir
 
-        # print(f"Shape of merged data: {data4D.shape}")
-        
-        # Load image amplitude
-        first_volume_amplitude = argsList[0].image_amplitude
-        first_volume_amplitude = str(first_volume_amplitude)
-        # Vérification du fichier d'entrée pour l'amplitude
-        if not os.path.exists(first_volume_amplitude):
-            raise FileNotFoundError(f"Le fichier d'entrée pour l'amplitude est introuvable : {first_volume_amplitude}")
-        image_amplitude = load_data(first_volume_amplitude)
-        # print(f"Shape of loaded image amplitude: {image_amplitude.shape}")
-        Z, Y, X = image_amplitude.shape
-        image_amplitude_4D = np.empty((time_length, Z, Y, X), dtype=image_amplitude.dtype)
-        image_amplitude_4D[0] = image_amplitude
-        # Merge all the others input image amplitude data into one 4D array
-        for t, arg in enumerate(argsList[1:], start=1):
-            input_path_amplitude = arg.image_amplitude
-            input_path_amplitude = str(input_path_amplitude)
-
-            # check files
-            if not os.path.exists(input_path_amplitude):
-                raise FileNotFoundError(f"Le fichier d'entrée pour l'amplitude est introuvable : {input_path_amplitude}")
-            image_amplitude = load_data(input_path_amplitude)
-            # print(f"Image amplitude shape for time {t}: {image_amplitude.shape}")
-            image_amplitude_4D[t] = image_amplitude
-        # print(f"Shape of merged image amplitude data: {image_amplitude_4D.shape}")
-        
         # load other parameters
         ids_events = int(argsList[0].ids_events)
         voxel_size_x = float(argsList[0].voxel_size_x)
@@ -173,6 +76,8 @@ class Tool():
         threshold_median_localized = float(argsList[0].threshold_median_localized)
         threshold_distance_localized = float(argsList[0].threshold_distance_localized)
         volume_localized = float(argsList[0].volume_localized)
+        n_workers = int(getattr(argsList[0], 'n_workers', 1) or 1)
+        features_format = str(getattr(argsList[0], 'features_format', 'csv') or 'csv').strip().lower()
         
         output_feature = argsList[0].features
 
@@ -193,8 +98,63 @@ class Tool():
             'paths': {'output_dir': os.path.dirname(output_feature)+"/"}
         }
 
+        output_dir = os.path.dirname(str(output_feature))
+        key_params = param_features_extraction['features_extraction']
+        if features_format != 'csv':
+            key_params = dict(key_params, features_format=features_format)
+        if n_workers > 1:
+            # Per-event rows go to the features output, not to the files named by astroca
+            key_params = dict(key_params, per_event=True)
+        stage_cache, cache_key = open_stage_cache(self.name, argsList, ('input_image', 'image_amplitude'),
+                                                  key_params, output_attribute='features')
+        if stage_cache is not None and stage_cache.restore(cache_key, output_dir) is not None:
+            return
+
+        # Events stored by runs also give the event index without sorting the label volume
+        event_index = None
+        if len(argsList) == 1 and is_spans(argsList[0].input_image):
+            spans = EventSpans.load(argsList[0].input_image)
+            data4D = spans.to_dense(resolve_scratch_dir(argsList[0]))
+            event_index = EventIndex.from_spans(spans)
+            del spans
+        else:
+            # Merge all the input data into one 4D array
+            data4D = read_stack(argsList, 'input_image')
+
+        # print(f"Shape of merged data: {data4D.shape}")
+
+        # Load image amplitude
+        image_amplitude_4D = read_stack(argsList, 'image_amplitude')
+        # print(f"Shape of merged image amplitude data: {image_amplitude_4D.shape}")
+
+        # Default (one process, csv): astroca computes and writes its own files, as before.
+        # Per-event processes or a columnar format are opt-in and write the features output
+        written = None
+        if n_workers > 1 or features_format != 'csv':
+            writer = FeatureWriter(output_feature, features_format)
+            n_rows = table = None
+            if n_workers > 1:
+                # Events are processed one by one and their rows appended to the output as they
+                # come; None if that differs from astroca
+                n_rows = features_parallel(data4D, ids_events, image_amplitude_4D, param_features_extraction,
+                                           n_workers, sink=writer.append, index=event_index)
+            if n_rows is None and features_format != 'csv':
+                table = features_table(data4D, ids_events, image_amplitude_4D, param_features_extraction)
+                if table is not None:
+                    writer.append(table)
+            if n_rows is not None or table is not None:
+                written = writer.close()
+            else:
+                writer.close()
+                print("Caractéristiques : fichiers écrits par astroca sous ses propres noms.")
+        if written is None:
+            # The feature files are named by astroca: cache whatever it writes in the output folder
+            before = snapshot_dir(output_dir)
+            save_features_from_events(data4D, ids_events, image_amplitude_4D, param_features_extraction)
+            written = written_since(output_dir, before)
+        if stage_cache is not None:
+            stage_cache.store(cache_key, written)
 
-        save_features_from_events(data4D, ids_events, image_amplitude_4D, param_features_extraction)
 
         
 
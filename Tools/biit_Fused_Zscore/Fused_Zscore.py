@@ -0,0 +1,130 @@
+import os
+import sys
+class Tool():
+    # Nom affiché dans BioImageIT
+    name = "Fused Anscombe, Dynamic Image and Z-score"
+
+    # Description visible pour l'utilisateur
+    description = "Computes the variance stabilization, the dynamic image against F0 and the thresholded Z-score of a 4D sequence (T,Z,Y,X) frame by frame, without the intermediate 4D images."
+
+    # Catégorie dans laquelle l'outil apparaîtra
+    categories = ['Astroca', 'Active Voxels']
+
+    # Environnement conda spécifique
+    environment = 'astroca-env'
+
+    # Dépendances (tu peux adapter si besoin)
+    dependencies = dict(
+        python='==3.10',
+        conda=['tqdm', 'numpy', 'pandas', 'tifffile'],
+        pip=[]
+    )
+
+    # Définition des entrées attendues
+    inputs = [
+        dict(name='input_image', help='Chemin vers le fichier .tif 4D (T,Z,Y,X) recadré (sortie de BoundariesComputation).', required=True, type='Path', autoColumn=True),
+        dict(name='background_image', help='Chemin vers le fichier .tif contenant l\'image de fond (F0).', required=True, type='Path', autoColumn=True),
+        dict(name='index_xmin', help='Chemin vers le fichier .npy contenant les xmin par Z.', required=True, type='Path'),
+        dict(name='index_xmax', help='Chemin vers le fichier .npy contenant les xmax par Z.', required=True, type='Path'),
+        dict(name='std_noise', help='Écart-type du bruit pour la normalisation.', required=True, type='Float', default=1.17),
+        dict(name='mean_noise', help='Moyenne du bruit pour la normalisation.', required=True, type='Float', default=0.93),
+        dict(name='noise_stats', help='Fichier noise_stats.json écrit par Dynamic Image : ses valeurs remplacent std_noise et mean_noise. Vide : valeurs saisies.', required=False, type='Path', default=''),
+        dict(name='threshold', help='Seuil pour la détection des voxels actifs.', required=True, type='Float', default=2.8),
+        dict(name='dynamic_output', help='Écrit aussi l\'image dynamique (ΔF), utilisée par Active Voxel Finder.', required=False, type='Bool', default=False),
+        dict(name='scratch_dir', help='Dossier où assembler les séquences 4D sur disque (memmap) au lieu de la RAM. Vide : en mémoire.', required=False, type='Path', default=''),
+        dict(name='band_output', help='Écrit, volume par volume, uniquement la bande [xmin, xmax] de chaque Z dans un fichier .band.npz au lieu des TIFF pleine largeur. L\'outil suivant le relit et reconstruit des volumes denses pour le calcul.', required=False, type='Bool', default=False),
+        dict(name='single_stack', help='Lit/écrit la séquence sous forme d\'une seule pile TIFF 4D (BigTIFF au-delà de 4 Go) au lieu d\'un fichier par volume.', required=False, type='Bool', default=False),
+        dict(name='cache_dir', help='Dossier du cache des résultats (clé : entrées + paramètres). Vide : pas de cache.', required=False, type='Path', default=''),
+    ]
+
+    outputs = [
+        dict(name='output_image', help='Z-score seuillé sauvegardé.', default='Zscore.tif', type='Path'),
+        dict(name='dynamic_image', help='Image dynamique (ΔF) sauvegardée si dynamic_output est coché.', default='dynamic_image.tif', type='Path'),
+    ]
+
+    def processAllData(self, argsList):
+        """
+        Enchaîne Anscombe, image dynamique et Z-score volume par volume.
+
+        Paramètres :
+            argsList : liste d'objets avec les attributs nécessaires pour chaque image
+
+        Retour :
+            None
+        """
+        # Resolve astroca once and import only the submodules this tool uses
+        tools_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        if tools_dir not in sys.path:
+            sys.path.append(tools_dir)
+
+        import numpy as np
+        from astroca_workflow.resolver import astroca_functions, startup_report
+        from astroca_workflow.fused import FUSED_FUNCTIONS
+        load_data, = astroca_functions('tools.loadData.load_data')
+        astroca_functions(*FUSED_FUNCTIONS)
+        startup_report(self.name)
+
+        from astroca_workflow.frames import read_stack
+        from astroca_workflow.options import tool_flag
+        from astroca_workflow.stacks import export_sequence
+        from astroca_workflow.cache import open_stage_cache
+        from astroca_workflow.indices import load_tool_indices
+        from astroca_workflow.band import band_path, save_band_4d
+        from astroca_workflow.fused import chained_zscore, fused_zscore
+        from astroca_workflow.store import resolve_scratch_dir
+        from astroca_workflow.jit import kernel_timing
+        from astroca_workflow.noise import resolve_noise
+
+        # Resolve and map the boundary indices before any 4D stack is loaded
+        xmin_path, xmax_path, index_xmin, index_xmax = load_tool_indices(argsList[0])
+
+        F0 = str(argsList[0].background_image)
+        if not os.path.exists(F0):
+            raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {F0}")
+        dataF0 = load_data(F0)
+        if dataF0.ndim == 3:
+            dataF0 = dataF0[np.newaxis, ...]
+        if dataF0.ndim != 4:
+            raise ValueError(f"Le fichier de fond doit être un tableau 4D (nbF0, Z, Y, X), mais a une forme {dataF0.shape}.")
+
+        std_noise = float(argsList[0].std_noise)
+        mean_noise = float(argsList[0].mean_noise)
+        # ΔF is not written before the Z-score here: the noise file can only be given explicitly
+        std_noise, mean_noise, noise_file = resolve_noise(argsList[0], None, std_noise, mean_noise)
+        threshold = float(argsList[0].threshold)
+        dynamic_output = tool_flag(argsList[0], 'dynamic_output')
+        output_image = argsList[0].output_image
+
+        stage_cache, cache_key = open_stage_cache(
+            self.name, argsList, ('input_image',),
+            {'std_noise': std_noise, 'mean_noise': mean_noise, 'threshold': threshold},
+            [F0, xmin_path, xmax_path] + ([noise_file] if noise_file else []))
+        if stage_cache is not None and stage_cache.restore(cache_key, os.path.dirname(str(output_image))) is not None:
+            return
+
+        # Merge all the input data into one 4D array
+        data4D = read_stack(argsList, 'input_image')
+
+        with kernel_timing(self.name):
+            # One frame at a time: the stabilized volume and ΔF never exist as 4D arrays
+            result = fused_zscore(data4D, dataF0, index_xmin, index_xmax, std_noise, mean_noise, threshold,
+                                  dynamic_output, resolve_scratch_dir(argsList[0]))
+            if result is None:
+                result = chained_zscore(data4D, dataF0, index_xmin, index_xmax, std_noise, mean_noise, threshold)
+        zscore, dF = result
+
+        written = []
+        outputs = [(zscore, output_image)]
+        if dynamic_output:
+            outputs.append((dF, argsList[0].dynamic_image))
+        for data, path in outputs:
+            saved = None
+            if tool_flag(argsList[0], 'band_output'):
+                # Only the [xmin, xmax] band of each Z carries data: store that span alone
+                saved = save_band_4d(data, index_xmin, index_xmax, band_path(path))
+            if saved is None:
+                # Save the sequence, one file per time frame or as a single 4D stack
+                saved = export_sequence(data, path, tool_flag(argsList[0], 'single_stack'))
+            written += saved
+        if stage_cache is not None:
+            stage_cache.store(cache_key, written)
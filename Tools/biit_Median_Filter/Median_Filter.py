@@ -18,7 +18,7 @@ class Tool():
     # Dépendances (tu peux adapter si besoin)
     dependencies = dict(
         python='==3.10',
-        conda=['tqdm', 'numpy', 'pandas', 'scipy', 'scikit-image', 'numba'],
+        conda=['tqdm', 'numpy', 'pandas', 'scipy', 'scikit-image', 'numba', 'tifffile'],
         pip=[]
     )
 
@@ -29,6 +29,11 @@ class Tool():
         dict(name='radius', help='Rayon pour l\'opération de fermeture.', required=True, type='Float', default=1.5),
         dict(name='border_mode', help='Mode de gestion des bords (reflect, constant, etc.).', required=False,
              type='Str', default='ignore'),
+        dict(name='n_workers', help="Nombre de processus filtrant les volumes en parallèle (1 : un seul processus).", required=False, type='Int', default=1),
+        dict(name='fast_median', help="Utilise le noyau numba rapide (tri par insertion du voisinage, comptage pour les masques binaires) pour les petits rayons avec border_mode 'ignore' ; vérifié au bit près contre le filtre de référence sur le volume central et sur des volumes aléatoires.", required=False, type='Bool', default=False),
+        dict(name='scratch_dir', help='Dossier où assembler les séquences 4D sur disque (memmap) au lieu de la RAM. Vide : en mémoire.', required=False, type='Path', default=''),
+        dict(name='single_stack', help='Lit/écrit la séquence sous forme d\'une seule pile TIFF 4D (BigTIFF au-delà de 4 Go) au lieu d\'un fichier par volume.', required=False, type='Bool', default=False),
+        dict(name='cache_dir', help='Dossier du cache des résultats (clé : entrées + paramètres). Vide : pas de cache.', required=False, type='Path', default=''),
     ]
 
     outputs = [
@@ -46,119 +51,51 @@ class Tool():
         Retour :
             None
         """
-        # print(f"DEBUG: Current working directory: {os.getcwd()}")
-        # print(f"DEBUG: __file__ location: {__file__}")
-        # print(f"DEBUG: sys.path: {sys.path[:3]}...")  # Afficher les 3 premiers éléments
-
-        try:
-            import numpy as np
-            # print("DEBUG: numpy imported successfully")
-            from astroca.tools.loadData import load_data
-            # print("DEBUG: load_data imported successfully")
-            from astroca.tools.exportData import export_data
-            # print("DEBUG: export_data imported successfully")
-            from astroca.activeVoxels.medianFilter import unified_median_filter_3d
-            # print("DEBUG: closing_morphology_in_space imported successfully")
-        except ImportError as e:
-            # print(f"DEBUG: First import failed: {e}")
-            base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'astroca'))
-            # print(f"DEBUG: Trying to add to path: {base_dir}")
-            # print(f"DEBUG: Directory exists: {os.path.exists(base_dir)}")
-            # if os.path.exists(base_dir):
-                # print(
-                    # f"DEBUG: Contents of {base_dir}: {os.listdir(base_dir)[:5]}...")  # Afficher les 5 premiers éléments
-
-            if base_dir not in sys.path:
-                sys.path.append(base_dir)
-                # print(f"DEBUG: Added {base_dir} to sys.path")
-            # else:
-                # print(f"DEBUG: {base_dir} already in sys.path")
-
-            try:
-                import numpy as np
-                # print("DEBUG: numpy imported successfully (second try)")
-                from astroca.tools.loadData import load_data
-                # print("DEBUG: load_data imported successfully (second try)")
-                from astroca.tools.exportData import export_data
-                # print("DEBUG: export_data imported successfully (second try)")
-                from astroca.activeVoxels.medianFilter import unified_median_filter_3d
-                # print("DEBUG: closing_morphology_in_space imported successfully (second try)")
-            except ImportError as e:
-                # print(f"DEBUG: Second import also failed: {e}")
-
-                # Essayons une approche différente pour trouver astroca
-                possible_paths = [
-                    os.path.join(os.path.dirname(__file__), '..', '..', 'astroca'),
-                    os.path.join(os.path.dirname(__file__), '..', '..', '..', 'astroca'),
-                    os.path.join(os.path.dirname(__file__), 'astroca'),
-                    '/home/matteo/Bureau/INRIA/codePython/astroca',  # Chemin absolu basé sur votre structure
-                ]
-
-                for path in possible_paths:
-                    abs_path = os.path.abspath(path)
-                    # print(f"DEBUG: Checking path: {abs_path}")
-                    if os.path.exists(abs_path):
-                        # print(f"DEBUG: Found astroca at: {abs_path}")
-                        if abs_path not in sys.path:
-                            sys.path.append(abs_path)
-                        try:
-                            from astroca.tools.loadData import load_data
-                            from astroca.tools.exportData import export_data
-                            from astroca.dynamicImage.backgroundEstimator import background_estimation_single_block
-                            # print("DEBUG: Successfully imported astroca modules!")
-                            break
-                        except ImportError as e2:
-                            # print(f"DEBUG: Import failed even with path {abs_path}: {e2}")
-                            continue
-                else:
-                    raise ImportError("Impossible d'importer les modules nécessaires. "
-                                      "Vérifiez que le module 'astroca' est présent.") from e
-
-        time_length = len(argsList)
-        first_volume = argsList[0].closed_data
-        first_volume = str(first_volume)  # Ensure it's a string path
-        # Vérification du fichier d'entrée
-        if not os.path.exists(first_volume):
-            raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {first_volume}")
-        data = load_data(first_volume)
-        print(f"Shape of loaded data: {data.shape}")
-
-        Z, Y, X = data.shape
-        data4D = np.empty((time_length, Z, Y, X), dtype=data.dtype)
-        data4D[0] = data  # Initialize the first time frame
-
-        # Merge all the others input data into one 4D array
-        for t, arg in enumerate(argsList[1:], start=1):
-            input_path = arg.closed_data
-            input_path = str(input_path)
-
-            # check files
-            if not os.path.exists(input_path):
-                raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {input_path}")
-            data = load_data(input_path)
-            print(f"Data shape for time {t}: {data.shape}")
-            data4D[t] = data
-
-        print(f"Shape of merged data: {data4D.shape}")
-
-        # Load xmin and xmax indices
+        # Resolve astroca once and import only the submodules this tool uses
+        tools_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        if tools_dir not in sys.path:
+            sys.path.append(tools_dir)
+
+        from astroca_workflow.resolver import astroca_functions, startup_report
+        # Imported here so that the startup report covers it; the filter itself runs in median_filter_parallel
+        astroca_functions('activeVoxels.medianFilter.unified_median_filter_3d')
+        startup_report(self.name)
+
+        from astroca_workflow.frames import read_stack
+        from astroca_workflow.options import tool_flag
+        from astroca_workflow.stacks import export_sequence
+        from astroca_workflow.cache import open_stage_cache
+        from astroca_workflow.jit import kernel_timing
+        from astroca_workflow.median import median_filter_parallel
+        from astroca_workflow.store import resolve_scratch_dir
+
+        # Load the median filter parameters
         radius = float(argsList[0].radius)
         border_mode = str(argsList[0].border_mode)
+        n_workers = int(getattr(argsList[0], 'n_workers', 1) or 1)
 
         output_image = argsList[0].output_image
 
-        # Apply the space closing operation
-        processed_data = unified_median_filter_3d(data4D, radius, border_mode)
-
-        # Save each time frame as a separate image
-        file_name = str(os.path.basename(output_image))
-        # remove .tif extension if present
-        if file_name.endswith('.tif'):
-            file_name = file_name[:-5]
-        for t in range(time_length):
-            file_name_t = f"{file_name}{t}.tif"
-            data_to_export = processed_data[t][np.newaxis, ...]  # Add a new axis for time
-            export_data(data_to_export, os.path.dirname(output_image), export_as_single_tif=True, file_name=file_name_t)
+        stage_cache, cache_key = open_stage_cache(self.name, argsList, ('closed_data',),
+                                                  {'radius': radius, 'border_mode': border_mode})
+        if stage_cache is not None and stage_cache.restore(cache_key, os.path.dirname(str(output_image))) is not None:
+            return
+
+        # Merge all the input data into one 4D array
+        data4D = read_stack(argsList, 'closed_data')
+
+        print(f"Shape of merged data: {data4D.shape}")
+
+        # Apply the median filter, time frames being independent
+        with kernel_timing(self.name):
+            processed_data = median_filter_parallel(data4D, radius, border_mode, n_workers,
+                                                    tool_flag(argsList[0], 'fast_median'),
+                                                    resolve_scratch_dir(argsList[0]))
+
+        # Save the sequence, one file per time frame or as a single 4D stack
+        written = export_sequence(processed_data, output_image, tool_flag(argsList[0], 'single_stack'))
+        if stage_cache is not None:
+            stage_cache.store(cache_key, written)
 
 
 
@@ -16,7 +16,7 @@ class Tool():
     # Dépendances (tu peux adapter si besoin)
     dependencies = dict(
         python='==3.10',
-        conda=['tqdm', 'numpy', 'pandas'],
+        conda=['tqdm', 'numpy', 'pandas', 'tifffile'],
         pip=[]
     )
 
@@ -27,7 +27,14 @@ class Tool():
         dict(name='index_xmax', help='Chemin vers le fichier .npy contenant les xmax par Z.', required=True, type='Path'),
         dict(name='std_noise', help='Écart-type du bruit pour la normalisation.', required=True, type='Float', default=1.17),
         dict(name='mean_noise', help='Moyenne du bruit pour la normalisation.', required=True, type='Float', default=0.93),
+        dict(name='noise_stats', help='Fichier noise_stats.json écrit par Dynamic Image : ses valeurs remplacent std_noise et mean_noise. Vide : valeurs saisies.', required=False, type='Path', default=''),
+        dict(name='use_noise_stats', help='Lit std_noise et mean_noise dans le noise_stats.json écrit par Dynamic Image à côté de l\'image d\'entrée.', required=False, type='Bool', default=False),
         dict(name='threshold', help='Seuil pour la détection des voxels actifs.', required=True, type='Float', default=2.8),
+        dict(name='scratch_dir', help='Dossier où assembler les séquences 4D sur disque (memmap) au lieu de la RAM. Vide : en mémoire.', required=False, type='Path', default=''),
+        dict(name='streaming', help='Traite la séquence volume par volume (lecture, calcul, écriture) sans assembler la séquence 4D en mémoire.', required=False, type='Bool', default=False),
+        dict(name='band_output', help='Écrit, volume par volume, uniquement la bande [xmin, xmax] de chaque Z dans un fichier .band.npz au lieu des TIFF pleine largeur. L\'outil suivant le relit et reconstruit des volumes denses pour le calcul.', required=False, type='Bool', default=False),
+        dict(name='single_stack', help='Lit/écrit la séquence sous forme d\'une seule pile TIFF 4D (BigTIFF au-delà de 4 Go) au lieu d\'un fichier par volume.', required=False, type='Bool', default=False),
+        dict(name='cache_dir', help='Dossier du cache des résultats (clé : entrées + paramètres). Vide : pas de cache.', required=False, type='Path', default=''),
     ]
 
     outputs = [
@@ -46,88 +53,72 @@ class Tool():
         Retour :
             None
         """
-        # Import avec fallback si lancement local
-        try:
-            import numpy as np
-            from astroca.tools.loadData import load_data
-            from astroca.tools.exportData import export_data
-            from astroca.activeVoxels.zScore import compute_z_score
-        except ImportError as e:
-            base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'astroca'))
-            if base_dir not in sys.path:
-                sys.path.append(base_dir)
-            try:
-                import numpy as np
-                from astroca.tools.loadData import load_data
-                from astroca.tools.exportData import export_data
-                from astroca.activeVoxels.zScore import compute_z_score
-            except ImportError as e:
-                raise ImportError("Impossible d'importer les modules nécessaires. "
-                                  "Vérifiez que le module 'astroca' est présent.") from e
-                
-        time_length = len(argsList)     
-        first_volume = argsList[0].input_image
-        first_volume = str(first_volume)  # Ensure it's a string path
-        # Vérification du fichier d'entrée
-        if not os.path.exists(first_volume):
-            raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {first_volume}")
-        data = load_data(first_volume)
-        print(f"Shape of loaded data: {data.shape}")
-        
-        Z, Y, X = data.shape
-        data4D = np.empty((time_length, Z, Y, X), dtype=data.dtype)
-        data4D[0] = data  # Initialize the first time frame
-                
-        # Merge all the others input data into one 4D array
-        for t, arg in enumerate(argsList[1:], start=1):
-            input_path = arg.input_image
-            input_path = str(input_path)
-            
-            # check files
-            if not os.path.exists(input_path):
-                raise FileNotFoundError(f"Le fichier d'entrée est introuvable : {input_path}")
-            data = load_data(input_path)
-            print(f"Data shape for time {t}: {data.shape}")
-            data4D[t] = data
+        # Resolve astroca once and import only the submodules this tool uses
+        tools_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        if tools_dir not in sys.path:
+            sys.path.append(tools_dir)
 
-        print(f"Shape of merged data: {data4D.shape}")
-        
-        # Load xmin and xmax indices
-        xmin_path = argsList[0].index_xmin
-        xmax_path = argsList[0].index_xmax
-        xmin_path = str(xmin_path)
-        xmax_path = str(xmax_path)
-        # we have xmin_path = ..../index_xmin0.npy lets remove the 0 at the end
-        if xmin_path.endswith('0.npy'):
-            xmin_path = xmin_path[:-5] + '.npy'
-        if xmax_path.endswith('0.npy'):
-            xmax_path = xmax_path[:-5] + '.npy'
-        if not os.path.exists(xmin_path):
-            raise FileNotFoundError(f"Le fichier index_xmin est introuvable : {xmin_path}")
-        if not os.path.exists(xmax_path):
-            raise FileNotFoundError(f"Le fichier index_xmax est introuvable : {xmax_path}")
-        index_xmin = np.load(xmin_path)
-        index_xmax = np.load(xmax_path)
+        import numpy as np
+        from astroca_workflow.resolver import astroca_functions, startup_report
+        compute_z_score, = astroca_functions('activeVoxels.zScore.compute_z_score')
+        startup_report(self.name)
+
+        from astroca_workflow.frames import read_stack
+        from astroca_workflow.options import tool_flag
+        from astroca_workflow.stacks import export_sequence
+        from astroca_workflow.cache import open_stage_cache
+        from astroca_workflow.indices import load_tool_indices
+        from astroca_workflow.band import band_path, save_band_4d
+        from astroca_workflow.streaming import stream_transform
+        from astroca_workflow.noise import resolve_noise
+
+        # Resolve and map the boundary indices before any 4D stack is loaded
+        xmin_path, xmax_path, index_xmin, index_xmax = load_tool_indices(argsList[0])
         
         # Load std_noise and mean_noise
         std_noise = float(argsList[0].std_noise)
         mean_noise = float(argsList[0].mean_noise)
+        # Values estimated by Dynamic_Image replace the hand-entered ones only when requested
+        std_noise, mean_noise, noise_file = resolve_noise(argsList[0], 'input_image', std_noise, mean_noise)
         threshold = float(argsList[0].threshold)
 
         output_image = argsList[0].output_image
-        
-        # Apply the Z-score computation
-        processed_data = compute_z_score(data4D, std_noise, mean_noise, threshold, index_xmin, index_xmax)
-        
-        # Save each time frame as a separate image
-        file_name = str(os.path.basename(output_image))
-        # remove .tif extension if present
-        if file_name.endswith('.tif'):
-            file_name = file_name[:-5]
-        for t in range(time_length):
-            file_name_t = f"{file_name}{t}.tif"
-            data_to_export = processed_data[t][np.newaxis, ...]  # Add a new axis for time
-            export_data(data_to_export, os.path.dirname(output_image), export_as_single_tif=True, file_name=file_name_t)
+
+        stage_cache, cache_key = open_stage_cache(
+            self.name, argsList, ('input_image',),
+            {'std_noise': std_noise, 'mean_noise': mean_noise, 'threshold': threshold},
+            [xmin_path, xmax_path] + ([noise_file] if noise_file else []))
+        if stage_cache is not None and stage_cache.restore(cache_key, os.path.dirname(str(output_image))) is not None:
+            return
+
+        if tool_flag(argsList[0], 'streaming'):
+            # The Z-score is a per-voxel transform: read, compute and write one time frame at a time
+            written = stream_transform(
+                argsList,
+                lambda frame: compute_z_score(frame[np.newaxis, ...], std_noise, mean_noise, threshold,
+                                              index_xmin, index_xmax)[0],
+                output_image,
+                tool_flag(argsList[0], 'single_stack'),
+                band=(index_xmin, index_xmax) if tool_flag(argsList[0], 'band_output') else None
+            )
+        else:
+            # Merge all the input data into one 4D array
+            data4D = read_stack(argsList, 'input_image')
+
+            print(f"Shape of merged data: {data4D.shape}")
+
+            # Apply the Z-score computation
+            processed_data = compute_z_score(data4D, std_noise, mean_noise, threshold, index_xmin, index_xmax)
+
+            written = None
+            if tool_flag(argsList[0], 'band_output'):
+                # Only the [xmin, xmax] band of each Z carries data: store that span alone
+                written = save_band_4d(processed_data, index_xmin, index_xmax, band_path(output_image))
+            if written is None:
+                # Save the sequence, one file per time frame or as a single 4D stack
+                written = export_sequence(processed_data, output_image, tool_flag(argsList[0], 'single_stack'))
+        if stage_cache is not None:
+            stage_cache.store(cache_key, written)
         
         
         
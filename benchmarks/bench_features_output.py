@@ -0,0 +1,99 @@
+"""
+Compare l'écriture d'une table de caractéristiques synthétique : CSV et XLSX écrits en une fois
+(comme save_features_from_events) et FeatureWriter (CSV, Parquet, Feather) alimenté par morceaux,
+comme au fil du calcul des événements. Mesure aussi la relecture d'une seule colonne.
+
+Usage :
+    python benchmarks/bench_features_output.py --events 200000 --columns 30 --chunk 16
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Tools')))
+from astroca_workflow.columnar import FeatureWriter, open_features  # noqa: E402
+
+
+def synthetic_features(n_events, n_columns, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = {'id': np.arange(1, n_events + 1)}
+    for c in range(n_columns - 1):
+        if c % 4 == 0:
+            columns[f'int_{c}'] = rng.integers(0, 10000, n_events)
+        else:
+            columns[f'float_{c}'] = rng.random(n_events) * 100
+    return pd.DataFrame(columns)
+
+
+def measured(func):
+    """ Durée (s) et pic de mémoire Python (Mo, tracemalloc) de func(). """
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / 1e6
+
+
+def streamed(table, path, fmt, chunk):
+    def run():
+        with FeatureWriter(path, fmt) as writer:
+            for start in range(0, len(table), chunk):
+                writer.append(table.iloc[start:start + chunk])
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--columns', type=int, default=30)
+    parser.add_argument('--chunk', type=int, default=16, help="Lignes par morceau transmis au FeatureWriter")
+    parser.add_argument('--xlsx-events', type=int, default=20000,
+                        help="Lignes écrites en XLSX (openpyxl est lent ; 0 pour l'omettre)")
+    args = parser.parse_args()
+
+    table = synthetic_features(args.events, args.columns)
+    directory = tempfile.mkdtemp(prefix='bench_features_')
+    try:
+        variants = [('csv, en une fois', os.path.join(directory, 'whole.csv'),
+                     lambda path: (lambda: table.to_csv(path, index=False)), args.events)]
+        if args.xlsx_events > 0:
+            head = table.head(args.xlsx_events)
+            variants.append(('xlsx, en une fois', os.path.join(directory, 'whole.xlsx'),
+                             lambda path: (lambda: head.to_excel(path, index=False)), len(head)))
+        for fmt in ('csv', 'parquet', 'feather'):
+            path = os.path.join(directory, f'streamed.{fmt}')
+            variants.append((f'{fmt}, par morceaux', path,
+                             lambda path, fmt=fmt: streamed(table, path, fmt, args.chunk), args.events))
+
+        print(f"Table de {args.events} événements x {args.columns} colonnes, morceaux de {args.chunk} lignes")
+        print(f"{'variante':<22}{'lignes':>10}{'temps (s)':>12}{'lignes/s':>12}{'taille (Mo)':>14}{'pic (Mo)':>11}")
+        for label, path, make, n_rows in variants:
+            seconds, peak = measured(make(path))
+            size = os.path.getsize(path) / 1e6
+            print(f"{label:<22}{n_rows:>10}{seconds:>12.3f}{n_rows / seconds:>12.0f}{size:>14.2f}{peak:>11.1f}")
+
+        # Downstream analysis often needs a few columns only
+        column = table.columns[-1]
+        print(f"\nRelecture de la colonne '{column}' :")
+        start = time.perf_counter()
+        pd.read_csv(os.path.join(directory, 'whole.csv'), usecols=[column])
+        print(f"{'csv (pandas)':<22}{time.perf_counter() - start:>12.3f} s")
+        for fmt in ('parquet', 'feather'):
+            start = time.perf_counter()
+            open_features(os.path.join(directory, f'streamed.{fmt}')).to_table(columns=[column])
+            print(f"{fmt + ' (dataset)':<22}{time.perf_counter() - start:>12.3f} s")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Compare le filtre médian de référence (unified_median_filter_3d) au filtre parallèle par volume
+et au chemin rapide, sur une séquence synthétique de masques seuillés.
+
+Le noyau du chemin rapide (median_filter_ignore) est d'abord mesuré seul sur un volume, face à
+scipy.ndimage.median_filter avec le même élément structurant, pour des valeurs continues et un
+masque binaire ; cette partie ne nécessite pas astroca (--kernel-only).
+
+Usage :
+    python benchmarks/bench_median.py --shape 20 60 256 256 --workers 1 4 8 --radius 1.5
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Tools')))
+from astroca_workflow.median import median_filter_ignore, median_filter_parallel, sphere_offsets  # noqa: E402
+from astroca_workflow.resolver import astroca_function  # noqa: E402
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_kernel(volume, radius):
+    """ Noyau du chemin rapide face à scipy.ndimage.median_filter sur un volume. """
+    from scipy import ndimage
+
+    offsets = sphere_offsets(radius)
+    reach = int(np.abs(offsets).max())
+    footprint = np.zeros((2 * reach + 1,) * 3, dtype=bool)
+    footprint[tuple((offsets + reach).T)] = True
+    for label, data in (('valeurs continues', volume), ('masque binaire', (volume > 0).astype(volume.dtype))):
+        median_filter_ignore(data[:2], radius)  # compile
+        _, kernel_s = timed(median_filter_ignore, data, radius)
+        _, scipy_s = timed(ndimage.median_filter, data, None, footprint)
+        print(f"{'noyau rapide, ' + label:<40}{kernel_s:>10.3f} s   scipy.ndimage {scipy_s:>8.3f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shape', type=int, nargs=4, default=[20, 30, 128, 128], metavar=('T', 'Z', 'Y', 'X'))
+    parser.add_argument('--dtype', default='float32')
+    parser.add_argument('--radius', type=float, default=1.5)
+    parser.add_argument('--border-mode', default='ignore')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--kernel-only', action='store_true', help='Mesure seulement le noyau du chemin rapide')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Sparse thresholded activity, as produced by Zscore and Space_closing
+    data4D = np.where(rng.random(args.shape) > 0.8, rng.random(args.shape) * 10, 0).astype(args.dtype)
+
+    print(f"Volume {tuple(data4D.shape[1:])} {data4D.dtype}, radius={args.radius}")
+    bench_kernel(data4D[0], args.radius)
+    if args.kernel_only:
+        return
+
+    unified_median_filter_3d = astroca_function('activeVoxels.medianFilter.unified_median_filter_3d')
+    # Compile the numba kernels once so that every variant is measured warm
+    unified_median_filter_3d(data4D[:1], args.radius, args.border_mode)
+    reference, reference_s = timed(unified_median_filter_3d, data4D, args.radius, args.border_mode)
+
+    print(f"Séquence {tuple(data4D.shape)} {data4D.dtype}, radius={args.radius}, border_mode='{args.border_mode}'")
+    print(f"{'variante':<28}{'temps (s)':>12}{'accélération':>14}{'identique':>12}")
+    print(f"{'référence':<28}{reference_s:>12.3f}{1:>14.2f}{'-':>12}")
+    for fast in (False, True):
+        for n_workers in args.workers:
+            result, seconds = timed(median_filter_parallel, data4D, args.radius, args.border_mode, n_workers, fast)
+            label = f"{'rapide' if fast else 'parallèle'}, {n_workers} processus"
+            same = np.array_equal(result, reference, equal_nan=bool(np.issubdtype(result.dtype, np.floating)))
+            print(f"{label:<28}{seconds:>12.3f}{reference_s / seconds:>14.2f}{str(same):>12}")
+
+
+if __name__ == '__main__':
+    main()
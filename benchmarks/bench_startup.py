@@ -0,0 +1,70 @@
+"""
+Mesure le temps de démarrage de chaque outil : résolution d'astroca et import de ses fonctions,
+dans un processus neuf (comme un lancement depuis BioImageIT).
+
+Usage :
+    python benchmarks/bench_startup.py --repeat 3
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+TOOLS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Tools'))
+sys.path.append(TOOLS_DIR)
+from astroca_workflow.resolver import STARTUP_BUDGET_S  # noqa: E402
+
+# Functions imported by each tool, see their processAllData
+TOOL_FUNCTIONS = {
+    'BoundariesComputation': ['tools.exportData.save_numpy_tab',
+                              'croppingBoundaries.computeBoundaries.compute_boundaries',
+                              'croppingBoundaries.cropper.crop_boundaries'],
+    'Anscombe': ['varianceStabilization.varianceStabilization.compute_variance_stabilization'],
+    'Baseline_fluorescence_estimation': ['tools.exportData.export_data',
+                                         'dynamicImage.dynamicImage.background_estimation_single_block'],
+    'Dynamic_Image': ['tools.loadData.load_data', 'dynamicImage.dynamicImage.compute_dynamic_image'],
+    'Zscore': ['activeVoxels.zScore.compute_z_score'],
+    'Fused_Zscore': ['tools.loadData.load_data',
+                     'varianceStabilization.varianceStabilization.compute_variance_stabilization',
+                     'dynamicImage.dynamicImage.compute_dynamic_image',
+                     'activeVoxels.zScore.compute_z_score'],
+    'Space_closing': ['activeVoxels.spaceMorphology.closing_morphology_in_space'],
+    'Median_Filter': ['activeVoxels.medianFilter.unified_median_filter_3d'],
+    'AV_finder': ['activeVoxels.activeVoxelsFinder.voxels_finder'],
+    'Event_Finder': ['events.eventDetectorCorrected.detect_calcium_events_opti'],
+    'Image_Amplitude': ['tools.loadData.load_data', 'dynamicImage.dynamicImage.compute_image_amplitude'],
+    'Features_Extraction': ['features.featuresComputation.save_features_from_events'],
+}
+
+SNIPPET = """
+import sys, time
+start = time.perf_counter()
+sys.path.append({tools_dir!r})
+import numpy
+from astroca_workflow.resolver import astroca_functions, startup_report
+astroca_functions(*{names!r})
+startup_report()
+print('TOTAL', time.perf_counter() - start)
+"""
+
+
+def measure(names):
+    code = SNIPPET.format(tools_dir=TOOLS_DIR, names=names)
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1].split()[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3, help='Nombre de lancements par outil (meilleur retenu)')
+    args = parser.parse_args()
+
+    print(f"{'outil':<34}{'démarrage (ms)':>16}  budget {1e3 * STARTUP_BUDGET_S:.0f} ms")
+    for tool, names in TOOL_FUNCTIONS.items():
+        best = min(measure(names) for _ in range(args.repeat))
+        status = 'OK' if best <= STARTUP_BUDGET_S else 'DÉPASSÉ'
+        print(f"{tool:<34}{1e3 * best:>16.0f}  {status}")
+
+
+if __name__ == '__main__':
+    main()
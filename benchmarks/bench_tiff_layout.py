@@ -0,0 +1,77 @@
+"""
+Compare les deux dispositions de sortie des outils : un .tif par volume et une pile 4D unique.
+
+Usage :
+    python benchmarks/bench_tiff_layout.py --shape 200 20 256 256 --dtype float32 --workdir /tmp/bench
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import tifffile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Tools')))
+from astroca_workflow.stacks import export_stack, load_stack  # noqa: E402
+
+
+def write_frames(data4D, output_dir):
+    for t in range(data4D.shape[0]):
+        tifffile.imwrite(os.path.join(output_dir, f"frame{t}.tif"), data4D[t][np.newaxis, ...])
+
+
+def read_frames(output_dir, time_length):
+    frames = [tifffile.imread(os.path.join(output_dir, f"frame{t}.tif")) for t in range(time_length)]
+    return np.stack(frames)
+
+
+def directory_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shape', type=int, nargs=4, default=[100, 16, 256, 256], metavar=('T', 'Z', 'Y', 'X'))
+    parser.add_argument('--dtype', default='float32')
+    parser.add_argument('--workdir', default=None, help="Dossier de travail (défaut : dossier temporaire)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    data4D = (rng.random(args.shape) * 1000).astype(args.dtype)
+    workdir = tempfile.mkdtemp(prefix='bench_tiff_', dir=args.workdir)
+    frames_dir = os.path.join(workdir, 'frames')
+    stack_dir = os.path.join(workdir, 'stack')
+    os.makedirs(frames_dir)
+    os.makedirs(stack_dir)
+    stack_path = os.path.join(stack_dir, 'stack.tif')
+
+    try:
+        _, write_frames_s = timed(write_frames, data4D, frames_dir)
+        frames_back, read_frames_s = timed(read_frames, frames_dir, data4D.shape[0])
+        _, write_stack_s = timed(export_stack, data4D, stack_path)
+        stack_back, read_stack_s = timed(load_stack, stack_path)
+        assert np.array_equal(frames_back[:, 0] if frames_back.ndim == 5 else frames_back, data4D)
+        assert np.array_equal(stack_back, data4D)
+
+        size_mb = data4D.nbytes / 1e6
+        print(f"Séquence {tuple(data4D.shape)} {data4D.dtype} : {size_mb:.1f} Mo")
+        print(f"{'disposition':<14}{'fichiers':>10}{'taille (Mo)':>14}{'écriture (s)':>15}{'lecture (s)':>14}")
+        print(f"{'par volume':<14}{data4D.shape[0]:>10}{directory_size(frames_dir) / 1e6:>14.1f}"
+              f"{write_frames_s:>15.3f}{read_frames_s:>14.3f}")
+        print(f"{'pile 4D':<14}{1:>10}{directory_size(stack_dir) / 1e6:>14.1f}"
+              f"{write_stack_s:>15.3f}{read_stack_s:>14.3f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The astroca_workflow package is imported from Tools/, as the BioImageIT tools do
+TOOLS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Tools'))
+if TOOLS_DIR not in sys.path:
+    sys.path.insert(0, TOOLS_DIR)
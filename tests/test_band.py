@@ -0,0 +1,59 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from astroca_workflow.band import BandPackedArray, BandWriter, band_path, is_band, save_band_4d
+
+INDEX_XMIN, INDEX_XMAX = np.array([1, 0, 3]), np.array([4, 2, 5])
+
+
+def banded(T=5, fill=0, dtype=np.float32):
+    data4D = np.random.default_rng(0).random((T, 3, 4, 7)).astype(dtype)
+    x = np.arange(7)
+    inside = (x >= INDEX_XMIN[:, None]) & (x <= INDEX_XMAX[:, None])
+    return np.where(inside[None, :, None, :], data4D, fill).astype(dtype)
+
+
+@pytest.mark.parametrize('fill', [0, np.nan])
+def test_band_round_trip(tmp_path, fill):
+    data4D = banded(fill=fill)
+    path = band_path(tmp_path / 'Zscore.tif')
+    assert save_band_4d(data4D, INDEX_XMIN, INDEX_XMAX, path) == [path]
+    assert is_band(path)
+
+    band = BandPackedArray.load(path)
+    # Frames are read from a memmap of the values: one row per frame
+    assert isinstance(band.values, np.memmap)
+    assert band.shape == data4D.shape and band.dtype == data4D.dtype
+    np.testing.assert_array_equal(band[3], data4D[3])
+    np.testing.assert_array_equal(band.to_dense(), data4D)
+    # Only the band is stored
+    assert band.nbytes == data4D[:, 0, :, 0].size * int((INDEX_XMAX - INDEX_XMIN + 1).sum()) * 4
+
+
+def test_band_file_is_a_regular_npz(tmp_path):
+    data4D = banded()
+    path = band_path(tmp_path / 'out.tif')
+    BandPackedArray.from_dense(data4D, INDEX_XMIN, INDEX_XMAX).save(path)
+    with np.load(path) as band:
+        assert tuple(band['shape']) == data4D.shape
+        np.testing.assert_array_equal(band['index_xmin'], INDEX_XMIN)
+        assert band['values'].shape == (5, 4 * 10)
+
+
+def test_non_constant_margins_are_refused(tmp_path):
+    data4D = banded()
+    data4D[2, 0, 0, 0] = 7
+    path = band_path(tmp_path / 'out.tif')
+    assert save_band_4d(data4D, INDEX_XMIN, INDEX_XMAX, path) is None
+    assert not (tmp_path / 'out.band.npz').exists()
+
+
+def test_incomplete_writer_is_removed(tmp_path):
+    data4D = banded()
+    path = band_path(tmp_path / 'out.tif')
+    writer = BandWriter(path, data4D.shape, data4D.dtype, INDEX_XMIN, INDEX_XMAX)
+    assert writer.write(data4D[0])
+    with pytest.raises(ValueError, match='incomplète'):
+        writer.close()
+    assert not (tmp_path / 'out.band.npz').exists()
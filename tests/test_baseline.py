@@ -0,0 +1,57 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from astroca_workflow import baseline
+from astroca_workflow.baseline import IncrementalBaseline
+
+
+def windowed_minimum(window, leftover='merge'):
+    """ Fake background estimator: minimum over fixed windows of `window` frames. """
+    def estimate(data4D, index_xmin, index_xmax, params, n_workers=1):
+        T = data4D.shape[0]
+        if leftover == 'merge':
+            # Floor: the leftover frames belong to the last window
+            nb = max(1, T // window)
+            bounds = [(k * window, (k + 1) * window if k < nb - 1 else T) for k in range(nb)]
+        else:
+            # Ceil: the leftover frames form a shorter last window
+            bounds = [(start, min(T, start + window)) for start in range(0, T, window)]
+        return np.stack([data4D[start:stop].min(axis=0) for start, stop in bounds])
+    return estimate
+
+
+def sequence(T, seed=0):
+    return np.random.default_rng(seed).random((T, 2, 3, 4)).astype(np.float32)
+
+
+def engine(tmp_path):
+    return IncrementalBaseline(tmp_path / 'state.npz', {}, np.zeros(2, int), np.full(2, 3), 1)
+
+
+def test_two_windows_are_ambiguous(tmp_path, monkeypatch):
+    # T=8 cut in two windows of 3 (+2 merged) or of 4: the length is not established
+    monkeypatch.setattr(baseline, 'background_estimation_tiled', windowed_minimum(3, 'merge'))
+    incremental = engine(tmp_path)
+    incremental.initialize(sequence(8), [])
+    assert incremental.block_frames == 0
+
+
+@pytest.mark.parametrize('leftover', ['merge', 'split'])
+@pytest.mark.parametrize('T', [8, 10, 11])
+def test_non_multiple_length_updates_like_full_recompute(tmp_path, monkeypatch, leftover, T):
+    estimate = windowed_minimum(3, leftover)
+    monkeypatch.setattr(baseline, 'background_estimation_tiled', estimate)
+    if leftover == 'merge' and T == 8:
+        pytest.skip('two windows only, see test_two_windows_are_ambiguous')
+    data = np.concatenate([sequence(T), sequence(7, seed=1)])
+    incremental = engine(tmp_path)
+    incremental.initialize(data[:T], [])
+    assert incremental.block_frames == 3
+
+    for stop in range(T + 1, len(data) + 1):
+        F0 = incremental.update(data[stop - 1:stop], [])
+        # Only complete windows are returned: they match the full computation over those windows
+        complete = stop // 3
+        assert F0.shape[0] == complete
+        np.testing.assert_array_equal(F0, estimate(data[:3 * complete], None, None, None))
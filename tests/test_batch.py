@@ -0,0 +1,44 @@
+from astroca_workflow.batch import schedule
+
+GB = 10 ** 9
+
+
+def _job(name, memory):
+    return {'name': name, 'memory': memory}
+
+
+def _order(jobs, budget, frees):
+    scheduler = schedule(jobs, budget)
+    next(scheduler)
+    chosen = []
+    for free in frees:
+        job = scheduler.send(free)
+        chosen.append(None if job is None else job['name'])
+    return chosen
+
+
+def test_largest_job_that_fits_first():
+    jobs = [_job('small', 1 * GB), _job('large', 6 * GB), _job('medium', 3 * GB)]
+    # 10 GB free, then 4 GB once 'large' runs, then 1 GB once 'medium' runs too
+    assert _order(jobs, 10 * GB, [10 * GB, 4 * GB, 1 * GB]) == ['large', 'medium', 'small']
+
+
+def test_small_jobs_fill_the_remaining_memory():
+    jobs = [_job('a', 7 * GB), _job('b', 5 * GB), _job('c', 2 * GB)]
+    # Once 'a' runs, 'b' does not fit in 3 GB but 'c' does
+    assert _order(jobs, 10 * GB, [10 * GB, 3 * GB, 1 * GB, 10 * GB]) == ['a', 'c', None, 'b']
+
+
+def test_unknown_and_oversized_jobs_wait_for_the_whole_budget():
+    jobs = [_job('unknown', None), _job('huge', 40 * GB), _job('small', 1 * GB)]
+    assert _order(jobs, 10 * GB, [9 * GB]) == ['small']
+    scheduler = schedule(jobs, 10 * GB)
+    next(scheduler)
+    assert scheduler.send(9 * GB)['name'] == 'small'
+    assert scheduler.send(9 * GB) is None
+    assert {scheduler.send(10 * GB)['name'], scheduler.send(10 * GB)['name']} == {'unknown', 'huge'}
+
+
+def test_unknown_shapes_without_budget():
+    jobs = [_job('unknown', None), _job('known', 2 * GB)]
+    assert sorted(_order(jobs, float('inf'), [float('inf')] * 2)) == ['known', 'unknown']
@@ -0,0 +1,80 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from astroca_workflow.cache import StageCache, open_stage_cache, snapshot_dir, written_since
+
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_store_and_restore(tmp_path):
+    cache = StageCache(tmp_path / 'cache')
+    source = write(tmp_path / 'in' / 'data.tif', b'input')
+    output = write(tmp_path / 'run' / 'Zscore.tif', b'zscore')
+    key = cache.key('Zscore', [source], {'threshold': 2})
+    assert cache.restore(key, str(tmp_path / 'elsewhere')) is None
+
+    cache.store(key, [output], extra={'ids_events': 3})
+    os.remove(output)
+    assert cache.restore(key, str(tmp_path / 'restored')) == {'ids_events': 3}
+    restored = tmp_path / 'restored' / 'Zscore.tif'
+    assert restored.read_bytes() == b'zscore'
+    # Dates are kept, so the next tool's key does not change
+    assert os.stat(restored).st_mtime_ns == os.stat(cache._entry(key) + '/Zscore.tif').st_mtime_ns
+
+
+def test_key_follows_inputs_and_params(tmp_path):
+    cache = StageCache(tmp_path / 'cache', digest='content')
+    source = write(tmp_path / 'data.tif', b'one')
+    key = cache.key('Zscore', [source], {'threshold': 2})
+    assert cache.key('Zscore', [source], {'threshold': 2}) == key
+    assert cache.key('Zscore', [source], {'threshold': 3}) != key
+    assert cache.key('Median', [source], {'threshold': 2}) != key
+    write(tmp_path / 'data.tif', b'two')
+    assert cache.key('Zscore', [source], {'threshold': 2}) != key
+    with pytest.raises(FileNotFoundError):
+        cache.key('Zscore', [str(tmp_path / 'absent.tif')], {})
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = StageCache(tmp_path / 'cache', max_bytes=25)
+    keys = []
+    for k in range(3):
+        output = write(tmp_path / f'run{k}' / 'out.tif', bytes(10))
+        keys.append(cache.key('Tool', [output], {'k': k}))
+        cache.store(keys[-1], [output])
+        # Distinct access times for the LRU order
+        os.utime(os.path.join(cache._entry(keys[-1]), 'manifest.json'), (k, k))
+        if k == 1:
+            # Using the first entry makes the second one the least recently used
+            assert cache.restore(keys[0], str(tmp_path / 'restored')) is not None
+    remaining = {key for _, _, key in cache.entries()}
+    assert remaining == {keys[0], keys[2]}
+    assert sum(size for _, size, _ in cache.entries()) <= 25
+
+
+def test_open_stage_cache_keys_output_format_flags(tmp_path, monkeypatch):
+    monkeypatch.delenv('ASTROCA_CACHE_DIR', raising=False)
+    source = write(tmp_path / 'data.tif', b'input')
+    arg = SimpleNamespace(input_image=source, output_image=str(tmp_path / 'out.tif'), cache_dir='')
+    assert open_stage_cache('Zscore', [arg], ('input_image',), {}) == (None, None)
+
+    arg.cache_dir = str(tmp_path / 'cache')
+    _, key = open_stage_cache('Zscore', [arg], ('input_image',), {})
+    arg.single_stack = 'True'
+    _, stacked = open_stage_cache('Zscore', [arg], ('input_image',), {})
+    arg.single_stack, arg.incremental = False, True
+    _, incremental = open_stage_cache('Zscore', [arg], ('input_image',), {})
+    assert len({key, stacked, incremental}) == 3
+
+
+def test_written_since(tmp_path):
+    write(tmp_path / 'old.csv', b'old')
+    before = snapshot_dir(str(tmp_path))
+    new = write(tmp_path / 'new.xlsx', b'new')
+    assert written_since(str(tmp_path), before) == [new]
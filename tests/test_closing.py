@@ -0,0 +1,61 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+ndimage = pytest.importorskip('scipy.ndimage')
+
+from astroca_workflow import resolver
+from astroca_workflow.closing import ball_footprint, closing_batched
+from astroca_workflow.packed import PackedMask
+
+
+def ball_closing(data4D, radius, border_mode):
+    """ Frame-by-frame closing with a ball, as astroca's closing_morphology_in_space. """
+    footprint = ball_footprint(radius)[0]
+    return np.stack([ndimage.grey_closing(frame, footprint=footprint, mode=border_mode) for frame in data4D])
+
+
+def cube_closing(data4D, radius, border_mode):
+    # Another structuring element: the batched closing must not be used
+    size = 2 * int(radius) + 1
+    return np.stack([ndimage.grey_closing(frame, size=(size,) * 3, mode=border_mode) for frame in data4D])
+
+
+@pytest.fixture
+def astroca(monkeypatch):
+    def use(closing):
+        monkeypatch.setattr(resolver, 'astroca_function', lambda name: closing)
+    return use
+
+
+def mask(shape=(5, 4, 12, 13), seed=0):
+    return (np.random.default_rng(seed).random(shape) < 0.3).astype(np.uint8)
+
+
+def test_packed_mask_round_trip(tmp_path):
+    data4D = mask()
+    packed = PackedMask.from_dense(data4D, str(tmp_path))
+    assert isinstance(packed.bits, np.memmap)
+    assert packed.nbytes == 5 * 4 * 12 * 2
+    np.testing.assert_array_equal(packed[3], data4D[3])
+    np.testing.assert_array_equal(packed.to_dense(), data4D)
+    assert PackedMask.from_dense(data4D * 2) is None
+
+
+@pytest.mark.parametrize('closing', [ball_closing, cube_closing])
+@pytest.mark.parametrize('packed', [False, True])
+def test_closing_batched_matches_astroca(astroca, capsys, closing, packed):
+    astroca(closing)
+    data4D = mask()
+    expected = closing(data4D, 1, 'constant')
+    out = closing_batched(data4D, 1, 'constant', packed=packed)
+    assert isinstance(out, PackedMask) == packed
+    assert ('diffère' in capsys.readouterr().out) == (closing is cube_closing)
+    np.testing.assert_array_equal(out.to_dense() if packed else out, expected)
+
+
+def test_closing_of_a_packed_input(astroca):
+    astroca(ball_closing)
+    data4D = mask()
+    out = closing_batched(PackedMask.from_dense(data4D), 1, 'reflect')
+    assert isinstance(out, PackedMask)
+    np.testing.assert_array_equal(out.to_dense(), ball_closing(data4D, 1, 'reflect'))
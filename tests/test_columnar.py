@@ -0,0 +1,45 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from astroca_workflow.columnar import FeatureWriter, features_path, open_features
+
+
+def chunks(n_chunks=5, rows=3):
+    return [pd.DataFrame({'id': range(k * rows + 1, (k + 1) * rows + 1),
+                          'duration': [float(k)] * rows}) for k in range(n_chunks)]
+
+
+def test_features_path():
+    assert features_path('out/Features.csv', 'parquet') == 'out/Features.parquet'
+    with pytest.raises(ValueError):
+        features_path('out/Features.csv', 'xlsx')
+
+
+def test_csv_round_trip(tmp_path):
+    with FeatureWriter(tmp_path / 'Features.xlsx', row_group_rows=4) as writer:
+        for chunk in chunks():
+            writer.append(chunk)
+        writer.append(chunks()[0].iloc[:0])
+    assert writer.path == str(tmp_path / 'Features.csv') and writer.n_rows == 15
+    pd.testing.assert_frame_equal(pd.read_csv(writer.path), pd.concat(chunks(), ignore_index=True))
+
+
+def test_no_rows_writes_nothing(tmp_path):
+    assert FeatureWriter(tmp_path / 'Features.csv').close() == []
+    assert not (tmp_path / 'Features.csv').exists()
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'feather'])
+def test_columnar_round_trip(tmp_path, fmt):
+    pytest.importorskip('pyarrow')
+    import pyarrow.dataset as ds
+
+    writer = FeatureWriter(tmp_path / 'Features.csv', fmt=fmt, row_group_rows=4)
+    for chunk in chunks():
+        writer.append(chunk)
+    assert writer.close() == [str(tmp_path / f'Features.{fmt}')]
+    dataset = open_features(writer.path)
+    pd.testing.assert_frame_equal(dataset.to_table().to_pandas(), pd.concat(chunks(), ignore_index=True))
+    selected = dataset.to_table(columns=['id'], filter=ds.field('duration') > 3).to_pandas()
+    assert selected['id'].tolist() == [13, 14, 15]
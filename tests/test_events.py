@@ -0,0 +1,94 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+ndimage = pytest.importorskip('scipy.ndimage')
+
+from astroca_workflow.events import TilingMismatch, detect_events_tiled, same_partition, window_bounds
+
+# Face connectivity in (t, z, y, x): an event is connected in space and time
+STRUCTURE_4D = ndimage.generate_binary_structure(4, 1)
+STRUCTURE_3D = ndimage.generate_binary_structure(3, 1)
+
+
+def label_events(active, params):
+    """ Label-based detector: per-instant 3D size filter, then 4D connected components. """
+    active = np.asarray(active) > 0
+    kept = np.zeros_like(active)
+    for t in range(active.shape[0]):
+        components, _ = ndimage.label(active[t], STRUCTURE_3D)
+        sizes = np.bincount(components.ravel())
+        keep = sizes >= params['threshold_size_3d_removed']
+        keep[0] = False
+        kept[t] = keep[components]
+    labels, n_events = ndimage.label(kept, STRUCTURE_4D)
+    min_event = params.get('min_event_size', 0)
+    if min_event:
+        # Whole-event threshold: depends on how much of the event the window sees
+        sizes = np.bincount(labels.ravel())
+        small = sizes < min_event
+        small[0] = True
+        labels[small[labels]] = 0
+        labels, n_events = ndimage.label(labels > 0, STRUCTURE_4D)
+    return labels.astype(np.uint16), n_events
+
+
+def random_active(shape=(40, 3, 12, 12), n_blobs=30, max_duration=6, seed=0):
+    rng = np.random.default_rng(seed)
+    active = np.zeros(shape, np.uint8)
+    for _ in range(n_blobs):
+        duration = int(rng.integers(1, max_duration + 1))
+        t, z, y, x = (int(rng.integers(0, s)) for s in shape)
+        size = rng.integers(1, 4, 3)
+        active[t:t + duration, z:z + size[0], y:y + size[1], x:x + size[2]] = 1
+    # Isolated voxels, removed by the per-instant size filter
+    active[rng.random(shape) < 0.01] = 1
+    return active
+
+
+PARAMS = {'threshold_size_3d_removed': 2}
+
+
+def test_window_bounds_cover_the_sequence():
+    bounds = window_bounds(25, 10, 3)
+    assert [(start, stop) for start, stop, _, _ in bounds] == [(0, 10), (10, 20), (20, 25)]
+    assert [(ext_start, ext_stop) for _, _, ext_start, ext_stop in bounds] == [(0, 13), (7, 23), (17, 25)]
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_tiled_labels_match_the_monolithic_run(seed):
+    active = random_active(seed=seed)
+    reference, n_reference = label_events(active, PARAMS)
+    labels, n_events = detect_events_tiled(label_events, active, PARAMS, window=10, overlap=8, strict=True)
+    assert n_events == n_reference
+    # Both are numbered in order of first appearance (t, z, y, x)
+    assert np.array_equal(labels, reference)
+    assert same_partition(labels, reference)
+
+
+def test_tiled_labels_on_disk(tmp_path):
+    active = random_active()
+    reference, _ = label_events(active, PARAMS)
+    labels, _ = detect_events_tiled(label_events, active, PARAMS, window=7, overlap=8, scratch_dir=str(tmp_path))
+    assert isinstance(labels, np.memmap)
+    assert np.array_equal(labels, reference)
+
+
+def test_whole_event_threshold_disagreement_is_detected(capsys):
+    # One thin event over instants 5..20: the first window sees 9 of its instants, the second 15
+    active = np.zeros((30, 1, 4, 4), np.uint8)
+    active[5:21, 0, 1, 1:3] = 1
+    params = dict(PARAMS, min_event_size=24)
+    reference, n_reference = label_events(active, params)
+    assert n_reference == 1
+    with pytest.raises(TilingMismatch):
+        detect_events_tiled(label_events, active, params, window=10, overlap=4, strict=True)
+    labels, _ = detect_events_tiled(label_events, active, params, window=10, overlap=4)
+    assert 'ne s\'accordent pas' in capsys.readouterr().out
+    assert not same_partition(labels, reference)
+
+
+def test_single_window_calls_detect_once():
+    active = random_active()
+    reference, n_reference = label_events(active, PARAMS)
+    labels, n_events = detect_events_tiled(label_events, active, PARAMS, window=0, overlap=8)
+    assert n_events == n_reference and np.array_equal(labels, reference)
@@ -0,0 +1,83 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+from astroca_workflow import features, resolver
+from astroca_workflow.features import EventIndex, features_parallel
+
+
+def fake_features(labels, n_events, amplitude, params):
+    """ Per-event features with absolute coordinates, like astroca's save_features_from_events. """
+    rows = []
+    voxel_size_x = params['features_extraction']['voxel_size_x']
+    for event_id in range(1, n_events + 1):
+        t, z, y, x = np.nonzero(labels == event_id)
+        rows.append({'id': event_id, 'size': t.size, 't_start': t.min(), 'z_max': z.max(),
+                     'centroid_x': x.mean() * voxel_size_x, 'amplitude': amplitude[labels == event_id].sum()})
+    return pd.DataFrame(rows)
+
+
+def crowded_features(labels, n_events, amplitude, params):
+    """ Features that also depend on the other events: the per-event path must be refused. """
+    table = fake_features(labels, n_events, amplitude, params)
+    table['n_active'] = np.count_nonzero(labels)
+    return table
+
+
+def random_events(n_events=12, shape=(10, 4, 16, 16)):
+    rng = np.random.default_rng(0)
+    labels = np.zeros(shape, np.uint16)
+    for event_id in range(1, n_events + 1):
+        t, z, y, x = (rng.integers(0, s - 2) for s in shape)
+        labels[t:t + 2, z:z + 2, y:y + 3, x:x + 2] = event_id
+    # Ids overwritten by later events are dropped from the count
+    n_events = int(labels.max())
+    assert set(np.unique(labels)) == set(range(n_events + 1))
+    return labels, n_events, rng.random(shape).astype(np.float32)
+
+
+@pytest.fixture
+def astroca_features(monkeypatch):
+    def use(function):
+        monkeypatch.setattr(resolver, 'astroca_function',
+                            lambda name: function if name == features.FEATURES_FUNCTION else None)
+    return use
+
+
+PARAMS = {'features_extraction': {'voxel_size_x': 0.1025}, 'files': {'save_results': 1}}
+
+
+def test_event_index_boxes():
+    labels, n_events, _ = random_events()
+    index = EventIndex(labels, n_events)
+    for event_id in range(1, n_events + 1):
+        coords = np.argwhere(labels == event_id)
+        assert index.size(event_id) == len(coords)
+        assert [(s.start, s.stop - 1) for s in index.bbox(event_id)] == list(zip(coords.min(0), coords.max(0)))
+
+
+def test_per_event_features_match_the_full_call(astroca_features):
+    astroca_features(fake_features)
+    labels, n_events, amplitude = random_events()
+    reference = fake_features(labels, n_events, amplitude, PARAMS)
+    table = features_parallel(labels, n_events, amplitude, PARAMS, n_workers=1)
+    pd.testing.assert_frame_equal(table, reference, check_dtype=False)
+
+    received = []
+    assert features_parallel(labels, n_events, amplitude, PARAMS, n_workers=1, sink=received.append) == n_events
+    pd.testing.assert_frame_equal(pd.concat(received, ignore_index=True), reference, check_dtype=False)
+
+
+def test_features_depending_on_other_events_fall_back(astroca_features):
+    astroca_features(crowded_features)
+    labels, n_events, amplitude = random_events()
+    received = []
+    assert features_parallel(labels, n_events, amplitude, PARAMS, n_workers=1, sink=received.append) is None
+    assert received == []
+
+
+def test_ambiguous_id_column_falls_back(astroca_features):
+    astroca_features(lambda *args: fake_features(*args).assign(rank=lambda table: table['id']))
+    labels, n_events, amplitude = random_events()
+    assert features_parallel(labels, n_events, amplitude, PARAMS, n_workers=1) is None
@@ -0,0 +1,74 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from astroca_workflow import resolver
+from astroca_workflow.fused import FUSED_FUNCTIONS, chained_zscore, fused_zscore
+
+STABILIZATION, DYNAMIC_IMAGE, ZSCORE = FUSED_FUNCTIONS
+
+
+def stabilization(data, index_xmin, index_xmax, params):
+    return (2 * np.sqrt(np.maximum(data, 0) + 3 / 8)).astype(np.float32)
+
+
+def dynamic_image(data, F0, index_xmin, index_xmax, T, params):
+    dF = (data - F0).astype(np.float32)
+    return dF, float(dF.mean())
+
+
+def zscore(dF, std_noise, mean_noise, threshold, index_xmin, index_xmax):
+    return ((dF - mean_noise) / std_noise > threshold).astype(np.uint8)
+
+
+def temporal_dynamic_image(data, F0, index_xmin, index_xmax, T, params):
+    # Depends on the other frames of the block: cannot be computed one frame at a time
+    dF = (data - data.mean(axis=0, keepdims=True)).astype(np.float32)
+    return dF, 0.0
+
+
+@pytest.fixture
+def astroca(monkeypatch):
+    def use(dynamic):
+        functions = {STABILIZATION: stabilization, DYNAMIC_IMAGE: dynamic, ZSCORE: zscore}
+        monkeypatch.setattr(resolver, 'astroca_function', functions.__getitem__)
+    return use
+
+
+def sequence(T=7):
+    rng = np.random.default_rng(0)
+    data4D = rng.poisson(20, size=(T, 2, 5, 6)).astype(np.float32)
+    F0 = stabilization(np.full((1, 2, 5, 6), 20, np.float32), None, None, None)
+    return data4D, F0
+
+
+ARGS = (np.zeros(2, int), np.full(2, 5), 0.5, 0.0, 1.0)
+
+
+@pytest.mark.parametrize('scratch', [False, True])
+def test_fused_zscore_matches_the_chain(tmp_path, astroca, scratch):
+    astroca(dynamic_image)
+    data4D, F0 = sequence()
+    reference_z, reference_dF = chained_zscore(data4D, F0, *ARGS)
+    z, dF = fused_zscore(data4D, F0, *ARGS, keep_dynamic=True, scratch_dir=str(tmp_path) if scratch else None)
+    assert isinstance(z, np.memmap) == scratch
+    assert z.dtype == reference_z.dtype == np.uint8
+    np.testing.assert_array_equal(z, reference_z)
+    np.testing.assert_allclose(dF, reference_dF, rtol=1e-6)
+
+    z, dF = fused_zscore(data4D, F0, *ARGS)
+    assert dF is None
+    np.testing.assert_array_equal(z, reference_z)
+
+
+def test_temporal_stage_falls_back_to_the_chain(astroca, capsys):
+    astroca(temporal_dynamic_image)
+    data4D, F0 = sequence()
+    assert fused_zscore(data4D, F0, *ARGS) is None
+    assert 'chaîne en trois étapes' in capsys.readouterr().out
+
+
+def test_several_F0_frames_fall_back(astroca):
+    astroca(dynamic_image)
+    data4D, F0 = sequence()
+    assert fused_zscore(data4D, np.concatenate([F0, F0]), *ARGS) is None
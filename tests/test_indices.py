@@ -0,0 +1,44 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from astroca_workflow.indices import load_index, load_tool_indices, resolve_index_path
+
+
+def save(path, values):
+    np.save(path, np.asarray(values))
+    return str(path)
+
+
+def test_bioimageit_suffix_is_resolved(tmp_path):
+    xmin = save(tmp_path / 'index_xmin.npy', [1, 2, 3])
+    xmax = save(tmp_path / 'index_xmax.npy', [7, 8, 9])
+    arg = SimpleNamespace(index_xmin=str(tmp_path / 'index_xmin0.npy'), index_xmax=str(tmp_path / 'index_xmax0.npy'))
+    xmin_path, xmax_path, index_xmin, index_xmax = load_tool_indices(arg)
+    assert (xmin_path, xmax_path) == (os.path.realpath(xmin), os.path.realpath(xmax))
+    assert isinstance(index_xmin, np.memmap)
+    np.testing.assert_array_equal(index_xmax, [7, 8, 9])
+
+
+def test_path_as_received_when_alone(tmp_path):
+    path = save(tmp_path / 'bounds0.npy', [4])
+    assert resolve_index_path(path) == os.path.realpath(path)
+    with pytest.raises(FileNotFoundError, match='index_xmin'):
+        resolve_index_path(str(tmp_path / 'absent0.npy'), 'index_xmin')
+
+
+def test_loaded_once_and_reloaded_when_rewritten(tmp_path):
+    path = save(tmp_path / 'index_xmin.npy', [1, 2])
+    assert load_index(path) is load_index(path)
+    save(tmp_path / 'index_xmin.npy', [1, 2, 3])
+    np.testing.assert_array_equal(load_index(path), [1, 2, 3])
+
+
+def test_inconsistent_bounds_are_refused(tmp_path):
+    arg = SimpleNamespace(index_xmin=save(tmp_path / 'index_xmin.npy', [1, 2]),
+                          index_xmax=save(tmp_path / 'index_xmax.npy', [7, 8, 9]))
+    with pytest.raises(ValueError, match='incohérentes'):
+        load_tool_indices(arg)
@@ -0,0 +1,65 @@
+import inspect
+
+from astroca_workflow.jit import _caching
+
+
+class FakeDispatcher:
+    def __init__(self, func, sigs, options):
+        self.func = func
+        self.sigs = sigs
+        self.options = options
+
+
+def fake_njit(*args, **options):
+    """ Same calling conventions as numba.njit. """
+    if args and inspect.isfunction(args[0]):
+        return FakeDispatcher(args[0], args[1:], options)
+    return lambda func: FakeDispatcher(func, args, options)
+
+
+def kernel(x):
+    return x
+
+
+njit = _caching(fake_njit)
+
+
+def test_bare_decorator():
+    dispatcher = njit(kernel)
+    assert isinstance(dispatcher, FakeDispatcher)
+    assert dispatcher.func is kernel
+    assert dispatcher.options == {'cache': True}
+
+
+def test_direct_call_with_options():
+    dispatcher = njit(kernel, parallel=True)
+    assert isinstance(dispatcher, FakeDispatcher)
+    assert dispatcher.options == {'cache': True, 'parallel': True}
+
+
+def test_direct_call_keeps_explicit_cache():
+    dispatcher = njit(kernel, cache=False)
+    assert dispatcher.options == {'cache': False}
+
+
+def test_decorator_with_options():
+    dispatcher = njit(parallel=True)(kernel)
+    assert isinstance(dispatcher, FakeDispatcher)
+    assert dispatcher.options == {'cache': True, 'parallel': True}
+
+
+def test_decorator_with_signature():
+    dispatcher = njit('float64(float64)')(kernel)
+    assert dispatcher.func is kernel
+    assert dispatcher.sigs == ('float64(float64)',)
+    assert dispatcher.options == {'cache': True}
+
+
+def test_without_cache_locator():
+    def no_locator(*args, **options):
+        if options.get('cache'):
+            raise RuntimeError("cannot cache function")
+        return FakeDispatcher(args[0], args[1:], options)
+
+    dispatcher = _caching(no_locator)(kernel)
+    assert dispatcher.options == {}
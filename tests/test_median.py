@@ -0,0 +1,55 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('numba')
+
+from astroca_workflow import median
+from astroca_workflow.median import median_filter_ignore, median_filter_parallel, sphere_offsets
+
+
+def nanmedian_reference(volume, radius, lower_even=False):
+    """ Spherical median ignoring the neighbours outside the volume, by stacking shifted copies. """
+    r = int(np.floor(radius))
+    Z, Y, X = volume.shape
+    padded = np.pad(volume.astype(np.float64), r, constant_values=np.nan)
+    neighbours = np.stack([padded[r + dz:r + dz + Z, r + dy:r + dy + Y, r + dx:r + dx + X]
+                           for dz, dy, dx in sphere_offsets(radius)])
+    if lower_even:
+        # Other convention: lower middle value for an even number of neighbours
+        ordered = np.sort(neighbours, axis=0)
+        count = np.sum(~np.isnan(neighbours), axis=0)
+        return np.take_along_axis(ordered, ((count - 1) // 2)[np.newaxis], axis=0)[0].astype(volume.dtype)
+    return np.nanmedian(neighbours, axis=0).astype(volume.dtype)
+
+
+def _volumes():
+    rng = np.random.default_rng(0)
+    shape = (5, 17, 19)
+    values = np.where(rng.random(shape) > 0.6, rng.normal(0, 5, shape), 0).astype(np.float32)
+    values[2, 3, 4] = np.nan
+    mask = (rng.random(shape) > 0.5).astype(np.float32)
+    return [values, mask, mask.astype(np.uint8)]
+
+
+@pytest.mark.parametrize('radius', [1, 1.5, 2, 2.5])
+def test_kernel_matches_the_stacked_median(radius):
+    for volume in _volumes():
+        np.testing.assert_array_equal(median_filter_ignore(volume, radius), nanmedian_reference(volume, radius))
+
+
+@pytest.mark.parametrize('lower_even, fast_used', [(False, True), (True, False)])
+def test_fast_path_is_kept_only_when_it_matches(monkeypatch, lower_even, fast_used):
+    def reference(data4D, radius, border_mode):
+        return np.stack([nanmedian_reference(volume, radius, lower_even) for volume in data4D])
+
+    monkeypatch.setattr(median, '_reference', reference)
+    monkeypatch.setattr(median, '_probe_results', {})
+    calls = []
+    kernel = median.median_filter_ignore
+    monkeypatch.setattr(median, 'median_filter_ignore', lambda *args: calls.append(1) or kernel(*args))
+
+    data4D = (np.random.default_rng(1).random((3, 6, 24, 24)) > 0.5).astype(np.float32)
+    result = median_filter_parallel(data4D, 1.5, 'ignore', n_workers=1, fast=True)
+    np.testing.assert_array_equal(result, reference(data4D, 1.5, 'ignore'))
+    # The probes call the kernel in both cases; the frames only when the fast path is kept
+    assert (len(calls) > 3) == fast_used
@@ -0,0 +1,62 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from astroca_workflow.noise import NOISE_FILE, NoiseStats, ObservedSequence, find_noise, resolve_noise
+
+
+def test_robust_std_ignores_active_signal():
+    rng = np.random.default_rng(0)
+    values = rng.normal(0.0, 2.0, 200_000)
+    # 10 % of the voxels carry a strong calcium signal
+    values[:20_000] += 50.0
+    stats = NoiseStats(sample_size=50_000)
+    for chunk in np.array_split(values, 17):
+        stats.update(chunk)
+    assert stats.count == values.size
+    # Signal well separated from the noise is clipped before the MAD
+    assert stats.std == pytest.approx(2.0, rel=0.05)
+    assert stats.std_all > 10.0
+
+
+def test_sample_size_is_bounded_and_band_weighted():
+    rng = np.random.default_rng(1)
+    stats = NoiseStats(sample_size=1000, per_update=100)
+    index_xmin, index_xmax = np.array([0, 0]), np.array([1, 7])
+    for _ in range(50):
+        frame = np.empty((2, 4, 8))
+        # Plane 0 (2 columns) holds -1, plane 1 (8 columns) holds +1
+        frame[0], frame[1] = -1.0, 1.0
+        stats.update_band(frame + rng.normal(0, 1e-3, frame.shape), index_xmin, index_xmax)
+    stats.robust()
+    assert stats._sample.size == 1000
+    # 8 of the 10 band columns are in plane 1
+    assert np.mean(stats._sample > 0) == pytest.approx(0.8, abs=0.05)
+
+
+def test_observed_sequence_counts_each_band_voxel_once():
+    data4D = np.arange(3 * 2 * 4 * 5, dtype=np.float32).reshape(3, 2, 4, 5)
+    index_xmin, index_xmax = np.array([1, 0]), np.array([3, 4])
+    observed = ObservedSequence(data4D, index_xmin, index_xmax)
+    observed[0], observed[0], observed[2]
+    stats = observed.finish()
+    expected = NoiseStats.from_sequence(data4D, index_xmin, index_xmax)
+    assert stats.count == expected.count == 3 * 4 * (3 + 5)
+    assert stats.mean == pytest.approx(expected.mean)
+
+
+def test_noise_file_is_read_on_request_only(tmp_path):
+    (tmp_path / NOISE_FILE).write_text(json.dumps({'std_noise': 3.0, 'mean_noise': 0.5}))
+    image = str(tmp_path / 'dF.tif')
+    arg = SimpleNamespace(input_image=image, noise_stats='', use_noise_stats=False)
+    assert find_noise(arg, 'input_image') is None
+    assert resolve_noise(arg, 'input_image', 1.17, 0.93) == (1.17, 0.93, None)
+
+    arg.use_noise_stats = True
+    assert resolve_noise(arg, 'input_image', 1.17, 0.93)[:2] == (3.0, 0.5)
+
+    explicit = SimpleNamespace(input_image=image, noise_stats=str(tmp_path / NOISE_FILE))
+    assert resolve_noise(explicit, None, 1.17)[:2] == (3.0, None)
@@ -0,0 +1,38 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from astroca_workflow.online import FolderWatcher, LatencyReport
+
+
+def _write(path, size, age):
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+
+
+def test_vanished_file_does_not_block_later_frames(tmp_path):
+    watcher = FolderWatcher(tmp_path, settle=0.0)
+    _write(tmp_path / 'frame_000.tif', 10, 5)
+    _write(tmp_path / 'frame_001.tif', 10, 5)
+    assert watcher.poll() == []
+    # frame_000 is deleted before it was ever reported complete
+    os.remove(tmp_path / 'frame_000.tif')
+    assert [os.path.basename(path) for path, _ in watcher.poll()] == ['frame_001.tif']
+    assert watcher.sizes == {}
+
+
+def test_warmup_latency_is_reported_apart():
+    report = LatencyReport()
+    now = time.time()
+    report.record(now - 30.0, 0.1, warmup=True)
+    report.record(now - 0.5, 0.1)
+    report.record(now - 0.5, 0.1)
+    summary = report.summary()
+    assert summary['frames'] == 3 and summary['warmup_frames'] == 1
+    assert summary['latency_max_s'] < 5.0
+    assert summary['warmup_latency_max_s'] >= 30.0
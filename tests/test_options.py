@@ -0,0 +1,16 @@
+from types import SimpleNamespace
+
+from astroca_workflow.options import OUTPUT_FORMAT_FLAGS, output_format, tool_flag
+
+
+def test_tool_flag_reads_strings_and_missing_attributes():
+    arg = SimpleNamespace(a='True', b='0', c=None, d=1)
+    assert tool_flag(arg, 'a') and not tool_flag(arg, 'b')
+    assert not tool_flag(arg, 'c') and tool_flag(arg, 'd')
+    assert tool_flag(arg, 'missing', default=True)
+
+
+def test_output_format_lists_every_flag():
+    fmt = output_format(SimpleNamespace(streaming='true', band_output=False))
+    assert set(fmt) == set(OUTPUT_FORMAT_FLAGS)
+    assert fmt['streaming'] and not fmt['band_output'] and not fmt['single_stack']
@@ -0,0 +1,99 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from astroca_workflow import resolver
+from astroca_workflow.pipeline import run_pipeline
+
+
+def fake_astroca(seen):
+    """ Stand-ins for the astroca stages, recording whether each 4D input lives in a memmap. """
+
+    def record(name, *arrays):
+        seen[name] = [isinstance(array, np.memmap) for array in arrays]
+
+    def compute_boundaries(data, params):
+        xmin = np.zeros(data.shape[1], dtype=np.int64)
+        return xmin, xmin + data.shape[3] - 1, None, data.astype(np.float32)
+
+    def background(data, xmin, xmax, params):
+        record('background', data)
+        return np.asarray(data[:1]).copy()
+
+    def dynamic_image(data, F0, xmin, xmax, T, params):
+        record('dynamic_image', data)
+        return data - F0, 0.0
+
+    def zscore(data, std, mean, threshold, xmin, xmax):
+        record('zscore', data)
+        return (data - mean) / (std or 1)
+
+    def closing(data, radius, border_mode):
+        record('closing', data)
+        return np.asarray(data).copy()
+
+    def median(data, radius, border_mode):
+        record('median', data)
+        return np.asarray(data).copy()
+
+    def voxels_finder(filtered, dF, std, xmin, xmax):
+        record('voxels_finder', filtered, dF)
+        return (np.asarray(filtered) > 0).astype(np.uint8)
+
+    def detect(active, params):
+        record('detect', active)
+        return active.astype(np.int32), 1
+
+    def amplitude(data, F0, xmin, xmax, params):
+        record('amplitude', data)
+        return data - F0
+
+    def features(events, n, amplitude, params):
+        record('features', events)
+
+    functions = {
+        'tools.loadData.load_data': np.load,
+        'tools.exportData.save_numpy_tab': lambda array, output_dir, file_name: None,
+        'croppingBoundaries.computeBoundaries.compute_boundaries': compute_boundaries,
+        'croppingBoundaries.cropper.crop_boundaries': lambda data, params: data,
+        'varianceStabilization.varianceStabilization.compute_variance_stabilization':
+            lambda data, xmin, xmax, params: np.sqrt(np.abs(data)),
+        'dynamicImage.dynamicImage.background_estimation_single_block': background,
+        'dynamicImage.dynamicImage.compute_dynamic_image': dynamic_image,
+        'dynamicImage.dynamicImage.compute_image_amplitude': amplitude,
+        'activeVoxels.zScore.compute_z_score': zscore,
+        'activeVoxels.spaceMorphology.closing_morphology_in_space': closing,
+        'activeVoxels.medianFilter.unified_median_filter_3d': median,
+        'activeVoxels.activeVoxelsFinder.voxels_finder': voxels_finder,
+        'events.eventDetectorCorrected.detect_calcium_events_opti': detect,
+        'features.featuresComputation.save_features_from_events': features,
+    }
+    return functions.__getitem__
+
+
+@pytest.fixture
+def recording(tmp_path):
+    frames = np.random.default_rng(0).normal(size=(4, 2, 5, 6)).astype(np.float32)
+    paths = []
+    for t, frame in enumerate(frames):
+        paths.append(str(tmp_path / f'frame_{t}.npy'))
+        np.save(paths[-1], frame)
+    return paths
+
+
+PARAMS = {'preprocessing': {'x_min': 0, 'x_max': 5, 'pixel_cropped': 0}}
+
+
+@pytest.mark.parametrize('use_scratch', [False, True])
+def test_stage_results_kept_in_scratch_dir(tmp_path, recording, monkeypatch, use_scratch):
+    seen = {}
+    monkeypatch.setattr(resolver, 'astroca_function', fake_astroca(seen))
+    scratch_dir = str(tmp_path / 'scratch') if use_scratch else None
+    if scratch_dir:
+        (tmp_path / 'scratch').mkdir()
+    result = run_pipeline(recording, str(tmp_path / 'out'), PARAMS, scratch_dir=scratch_dir)
+    assert result['ids_events'] == 1
+    # Every 4D result passed from one stage to a later one is a memmap exactly when scratch_dir is set
+    assert seen.keys() == {'background', 'dynamic_image', 'zscore', 'closing', 'median', 'voxels_finder',
+                           'detect', 'amplitude', 'features'}
+    assert all(flag == use_scratch for flags in seen.values() for flag in flags)
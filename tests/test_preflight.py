@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+tifffile = pytest.importorskip('tifffile')
+
+from astroca_workflow import resolver
+from astroca_workflow.preflight import check_inputs, read_header
+from astroca_workflow.stacks import export_frame
+
+
+def tifffile_export(data, output_dir, export_as_single_tif=True, file_name='data.tif'):
+    """ Writes like astroca's export_data: the array as given, time axis included. """
+    tifffile.imwrite(os.path.join(output_dir, file_name), data, photometric='minisblack')
+
+
+@pytest.fixture
+def exported_frames(tmp_path, monkeypatch):
+    monkeypatch.setattr(resolver, 'astroca_function',
+                        lambda name: tifffile_export if name == 'tools.exportData.export_data' else None)
+    frames = np.random.default_rng(0).random((3, 4, 5, 6)).astype(np.float32)
+    return [export_frame(frames[t], tmp_path / 'out.tif', t) for t in range(3)]
+
+
+def test_frames_written_by_export_frame_pass_the_preflight(exported_frames):
+    # tifffile reads them back as (1,Z,Y,X)
+    assert tifffile.imread(exported_frames[0]).shape == (1, 4, 5, 6)
+    assert read_header(exported_frames[0]) == ((4, 5, 6), np.dtype(np.float32))
+    assert check_inputs(exported_frames, estimate=False) == ((3, 4, 5, 6), np.dtype(np.float32))
+
+
+def test_missing_and_mismatched_volumes_are_reported(tmp_path, exported_frames):
+    with pytest.raises(FileNotFoundError, match='1 fichier'):
+        check_inputs(exported_frames + [str(tmp_path / 'absent.tif')], estimate=False)
+    other = str(tmp_path / 'other.npy')
+    np.save(other, np.zeros((4, 5, 7), np.float32))
+    with pytest.raises(ValueError, match='diffèrent'):
+        check_inputs(exported_frames + [other], estimate=False)
+
+
+def test_two_dimensional_volume_is_rejected(tmp_path):
+    path = str(tmp_path / 'plane.npy')
+    np.save(path, np.zeros((5, 6), np.uint16))
+    with pytest.raises(ValueError, match='3D'):
+        check_inputs([path], estimate=False)
+
+
+def test_stack_header_keeps_four_axes(tmp_path):
+    path = str(tmp_path / 'stack.tif')
+    tifffile.imwrite(path, np.zeros((1, 4, 5, 6), np.uint16), photometric='minisblack', metadata={'axes': 'TZYX'})
+    assert read_header(path, ndim=4) == ((1, 4, 5, 6), np.dtype(np.uint16))
@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import TOOLS_DIR
+
+SCRIPT = """
+import json, sys
+from astroca_workflow.resolver import astroca_function, astroca_functions, astroca_root
+root = astroca_root()
+compute_z_score, = astroca_functions('activeVoxels.zScore.compute_z_score')
+try:
+    astroca_function('missing.module.function')
+    missing = None
+except ImportError as error:
+    missing = str(error)
+print(json.dumps({'root': root, 'value': compute_z_score(2), 'imported': sorted(
+    name for name in sys.modules if name.startswith('astroca.')), 'missing': missing}))
+"""
+
+
+def fake_astroca(root):
+    package = root / 'astroca'
+    for module in ('activeVoxels', 'events'):
+        (package / module).mkdir(parents=True)
+        (package / module / '__init__.py').write_text('')
+    (package / '__init__.py').write_text('')
+    (package / 'activeVoxels' / 'zScore.py').write_text('def compute_z_score(x):\n    return 10 * x\n')
+    # Importing this module fails: it must not be imported by a tool that does not use it
+    (package / 'events' / 'eventDetectorCorrected.py').write_text('raise RuntimeError("imported")\n')
+
+
+def run(script, env):
+    result = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_astroca_path_and_lazy_imports(tmp_path):
+    fake_astroca(tmp_path)
+    env = dict(os.environ, ASTROCA_PATH=str(tmp_path), PYTHONPATH=TOOLS_DIR,
+               NUMBA_CACHE_DIR=str(tmp_path / 'numba'))
+    report = run(SCRIPT, env)
+    assert os.path.realpath(report['root']) == os.path.realpath(str(tmp_path))
+    assert report['value'] == 20
+    # Only the requested submodule is imported
+    assert 'astroca.activeVoxels.zScore' in report['imported']
+    assert 'astroca.events.eventDetectorCorrected' not in report['imported']
+    assert 'astroca.missing' in report['missing']
@@ -0,0 +1,62 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from astroca_workflow.features import EventIndex
+from astroca_workflow.spans import EventSpans, compact_labels, is_spans, label_dtype, spans_path
+
+
+def labelled(n_events=40, shape=(6, 3, 10, 12), dtype=np.int32):
+    rng = np.random.default_rng(0)
+    labels = np.zeros(shape, dtype)
+    for event_id in range(1, n_events + 1):
+        t, z, y, x = (int(rng.integers(0, s - 1)) for s in shape)
+        labels[t:t + 2, z:z + 2, y:y + 3, x:x + 4] = event_id
+    return labels
+
+
+def test_label_dtype():
+    assert label_dtype(255) == np.uint8
+    assert label_dtype(256) == np.uint16
+    assert label_dtype(70000) == np.uint32
+
+
+def test_spans_round_trip(tmp_path):
+    labels = labelled()
+    n_events = int(labels.max())
+    spans = EventSpans.from_labels(labels, n_events)
+    path = spans_path(tmp_path / 'calciumEvents.tif')
+    assert spans.save(path) == [path] and is_spans(path)
+
+    loaded = EventSpans.load(path)
+    dense = loaded.to_dense(str(tmp_path))
+    assert dense.dtype == np.uint8 and isinstance(dense, np.memmap)
+    np.testing.assert_array_equal(dense, labels)
+    for event_id in (1, n_events // 2, n_events):
+        expected = np.flatnonzero(labels.reshape(-1) == event_id)
+        np.testing.assert_array_equal(loaded.flat_indices(event_id), expected)
+        assert loaded.size(event_id) == expected.size
+        assert [c.tolist() for c in loaded.coords(event_id)] == \
+            [c.tolist() for c in np.unravel_index(expected, labels.shape)]
+
+
+def test_event_index_from_spans_matches_the_label_scan():
+    labels = labelled()
+    n_events = int(labels.max())
+    scanned = EventIndex(labels, n_events)
+    from_spans = EventIndex.from_spans(EventSpans.from_labels(labels, n_events))
+    np.testing.assert_array_equal(from_spans.offsets, scanned.offsets)
+    np.testing.assert_array_equal(from_spans.bbox_min, scanned.bbox_min)
+    np.testing.assert_array_equal(from_spans.bbox_max, scanned.bbox_max)
+    for event_id in range(1, n_events + 1):
+        np.testing.assert_array_equal(from_spans.flat_indices(event_id), scanned.flat_indices(event_id))
+
+
+def test_compact_labels():
+    labels = labelled()
+    compact = compact_labels(labels, int(labels.max()))
+    assert compact.dtype == np.uint8
+    np.testing.assert_array_equal(compact, labels)
+    # Out-of-range labels keep the original type
+    labels[0, 0, 0, 0] = 1000
+    assert compact_labels(labels, 40) is labels
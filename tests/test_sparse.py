@@ -0,0 +1,47 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from astroca_workflow.sparse import is_sparse, load_sparse_4d, save_sparse_4d, sparse_path
+
+
+def active_voxels(shape=(5, 3, 8, 9), density=0.05, dtype=np.uint8):
+    rng = np.random.default_rng(0)
+    return (rng.random(shape) < density).astype(dtype) * rng.integers(1, 200, shape).astype(dtype)
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.float32])
+def test_sparse_round_trip(tmp_path, dtype):
+    data4D = active_voxels(dtype=dtype)
+    data4D[2] = 0  # an empty frame
+    path = sparse_path(tmp_path / 'AV.tif')
+    assert save_sparse_4d(data4D, path) == [path]
+    assert is_sparse(path)
+    restored = load_sparse_4d(path)
+    assert restored.dtype == data4D.dtype
+    np.testing.assert_array_equal(restored, data4D)
+
+
+def test_sparse_round_trip_in_scratch_dir(tmp_path):
+    data4D = active_voxels()
+    path = sparse_path(tmp_path / 'AV.tif')
+    save_sparse_4d(data4D, path)
+    restored = load_sparse_4d(path, str(tmp_path))
+    assert isinstance(restored, np.memmap)
+    np.testing.assert_array_equal(restored, data4D)
+
+
+def test_only_non_zero_voxels_are_stored(tmp_path):
+    data4D = active_voxels()
+    path = sparse_path(tmp_path / 'AV.tif')
+    save_sparse_4d(data4D, path)
+    with np.load(path) as sparse:
+        assert sparse['values'].size == np.count_nonzero(data4D)
+        assert list(np.diff(sparse['frame_offsets'])) == [np.count_nonzero(frame) for frame in data4D]
+
+
+def test_other_npz_files_are_not_sparse(tmp_path):
+    path = str(tmp_path / 'other.npz')
+    np.savez(path, values=np.zeros(3))
+    assert not is_sparse(path)
+    assert not is_sparse(str(tmp_path / 'AV.tif'))
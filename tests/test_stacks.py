@@ -0,0 +1,50 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+tifffile = pytest.importorskip('tifffile')
+
+from astroca_workflow.packed import PackedMask
+from astroca_workflow.stacks import (export_sequence, export_stack_frames, is_stack, iter_stack_frames,
+                                     load_stack, stack_shape)
+
+
+def sequence(dtype=np.float32):
+    return np.random.default_rng(0).random((4, 3, 5, 6)).astype(dtype)
+
+
+def test_stack_round_trip(tmp_path):
+    data4D = sequence()
+    output_image = tmp_path / 'out' / 'Zscore.tif'
+    assert export_sequence(data4D, output_image, single_stack=True) == [str(output_image)]
+    assert is_stack(output_image) and stack_shape(output_image) == data4D.shape
+    np.testing.assert_array_equal(load_stack(output_image), data4D)
+    np.testing.assert_array_equal(load_stack(output_image, str(tmp_path)), data4D)
+    np.testing.assert_array_equal(np.stack(list(iter_stack_frames(output_image))), data4D)
+
+
+def test_stack_written_frame_by_frame(tmp_path):
+    data4D = sequence(np.uint16)
+    output_image = tmp_path / 'stack.tif'
+    export_stack_frames(iter(data4D), data4D.shape, data4D.dtype, output_image)
+    np.testing.assert_array_equal(load_stack(output_image), data4D)
+
+
+def test_packed_mask_written_as_a_stack(tmp_path):
+    data4D = (sequence() > 0.5).astype(np.uint8)
+    output_image = tmp_path / 'mask.tif'
+    export_sequence(PackedMask.from_dense(data4D), output_image, single_stack=True)
+    np.testing.assert_array_equal(load_stack(output_image), data4D)
+
+
+def test_bigtiff_can_be_forced(tmp_path):
+    output_image = tmp_path / 'big.tif'
+    export_sequence(sequence(), output_image, single_stack=True, bigtiff=True)
+    with tifffile.TiffFile(output_image) as tif:
+        assert tif.is_bigtiff
+
+
+def test_single_volumes_are_not_stacks(tmp_path):
+    path = tmp_path / 'frame.tif'
+    tifffile.imwrite(path, sequence()[0], photometric='minisblack')
+    assert not is_stack(path)
+    assert not is_stack(tmp_path / 'absent.tif')
@@ -0,0 +1,54 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from astroca_workflow.band import BandPackedArray, band_path
+from astroca_workflow.streaming import stream_transform
+
+INDEX_XMIN, INDEX_XMAX = np.array([1, 2]), np.array([3, 4])
+
+
+def band_input(tmp_path, T=4):
+    data4D = np.random.default_rng(0).random((T, 2, 3, 6)).astype(np.float32)
+    packed = BandPackedArray.from_dense(np.where(_inside(data4D.shape), data4D, 0), INDEX_XMIN, INDEX_XMAX)
+    path = band_path(tmp_path / 'input.tif')
+    packed.save(path)
+    return SimpleNamespace(input_image=path), packed.to_dense()
+
+
+def _inside(shape):
+    x = np.arange(shape[-1])
+    inside = (x >= INDEX_XMIN[:, None]) & (x <= INDEX_XMAX[:, None])
+    return np.broadcast_to(inside[:, None, :], shape[1:])
+
+
+def test_streaming_writes_band_output(tmp_path):
+    arg, dense = band_input(tmp_path)
+    output_image = tmp_path / 'out' / 'Zscore.tif'
+    output_image.parent.mkdir()
+    written = stream_transform([arg], lambda frame: frame * 2, output_image, band=(INDEX_XMIN, INDEX_XMAX))
+    assert written == [band_path(output_image)]
+    np.testing.assert_array_equal(BandPackedArray.load(written[0]).to_dense(), dense * 2)
+
+
+def test_streaming_band_output_falls_back_to_dense(tmp_path):
+    tifffile = pytest.importorskip('tifffile')
+    arg, dense = band_input(tmp_path)
+    output_image = tmp_path / 'out' / 'Zscore.tif'
+    output_image.parent.mkdir()
+
+    # Frames 2 and 3 (told apart by their values) get non-constant margins
+    late = {float(frame.sum()) for frame in dense[2:]}
+
+    def transform(frame):
+        return frame + np.arange(6, dtype=frame.dtype) if float(frame.sum()) in late else frame + 1
+
+    expected = np.stack([frame + 1 for frame in dense[:2]] + [frame + np.arange(6, dtype=frame.dtype) for frame in dense[2:]])
+    written = stream_transform([arg], transform, output_image, single_stack=True, band=(INDEX_XMIN, INDEX_XMAX))
+    assert written == [str(output_image)]
+    np.testing.assert_array_equal(tifffile.imread(written[0]), expected)
+    # The partial band file is removed
+    assert not os.path.exists(band_path(output_image))
@@ -0,0 +1,48 @@
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from astroca_workflow.store import allocate_4d
+from astroca_workflow import tiling
+from astroca_workflow.tiling import block_bounds, map_blocks, map_blocks_into
+
+
+def scaled_cumsum(block, index_xmin, factor):
+    """ Per-Z result over time, so blocks along Z are independent and blocks along T are not. """
+    return np.cumsum(block, axis=0) * factor + index_xmin[np.newaxis, :, np.newaxis, np.newaxis]
+
+
+def test_block_bounds_cover_the_axis():
+    assert block_bounds(10, 3) == [(0, 3), (3, 6), (6, 10)]
+    assert block_bounds(2, 8) == [(0, 1), (1, 2)]
+
+
+@pytest.mark.parametrize('on_disk', [False, True])
+def test_blocks_along_z_match_the_whole_computation(tmp_path, on_disk):
+    data4D = np.random.default_rng(0).random((6, 5, 4, 3)).astype(np.float32)
+    if on_disk:
+        stored = allocate_4d(data4D.shape, data4D.dtype, str(tmp_path))
+        stored[...] = data4D
+        data4D = stored
+    index_xmin = np.arange(5)
+    expected = scaled_cumsum(np.asarray(data4D), index_xmin, 2.0)
+
+    result = map_blocks(scaled_cumsum, data4D, 1, n_workers=2, n_blocks=3, sliced_args=(index_xmin,), args=(2.0,))
+    np.testing.assert_allclose(result, expected, rtol=1e-6)
+
+    out = allocate_4d(data4D.shape, np.float64, str(tmp_path) if on_disk else None)
+    assert map_blocks_into(scaled_cumsum, data4D, out, 1, n_workers=2, n_blocks=3,
+                           sliced_args=(index_xmin,), args=(2.0,)) is out
+    np.testing.assert_allclose(out, expected, rtol=1e-6)
+
+
+def test_no_fork_once_numba_threads_run(monkeypatch):
+    # A started numba thread pool makes fork unsafe: blocks are sent to spawned workers
+    monkeypatch.setitem(sys.modules, 'numba.np.ufunc.parallel', SimpleNamespace(_is_initialized=True))
+    data4D = np.random.default_rng(0).random((6, 5, 4, 3)).astype(np.float32)
+    source, use_fork, context, block_for = tiling._plan(data4D, 1)
+    assert source is None and not use_fork and context.get_start_method() == 'spawn'
+    np.testing.assert_array_equal(block_for(1, 3), data4D[:, 1:3])